@@ -1,13 +0,0 @@
-from django.db import models
-from django.conf import settings
-
-class File(models.Model):
-    name = models.CharField(max_length=255)
-    file = models.FileField(upload_to='uploads/')
-    encrypted_file = models.FileField(upload_to='encrypted/', null=True, blank=True)
-    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    uploaded_at = models.DateTimeField(auto_now_add=True)
-    is_encrypted = models.BooleanField(default=False)
-
-    def __str__(self):
-        return self.name 
\ No newline at end of file
@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F, Q
+from django.utils import timezone
+from secure_file_share.apps.sharing.models import FileShare
+from .models import File
+
+
+def active_shares(user):
+    """Shares granted to `user` that have not expired."""
+    return FileShare.objects.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()),
+        shared_with=user,
+    )
+
+
+def shared_files(user):
+    """
+    Files shared with `user`, each annotated with its effective share.
+
+    (file, shared_with) is unique, so the join yields one row per file and
+    `share_id`, `share_type` and `shared_at` come back in the same query as
+    the file itself.
+    """
+    return File.objects.filter(
+        Q(shares__expires_at__isnull=True) | Q(shares__expires_at__gt=timezone.now()),
+        shares__shared_with=user,
+    ).annotate(
+        share_id=F('shares__id'),
+        share_type=F('shares__share_type'),
+        shared_at=F('shares__created_at'),
+    )
+
+
+def is_owner(user, file):
+    # Compare ids so the owner row is never fetched
+    return file.owner_id == user.pk
+
+
+def _access_cache():
+    return caches[getattr(settings, 'FILE_ACCESS_CACHE_ALIAS', 'default')]
+
+
+def _access_cache_key(user_id):
+    return f'files:access:{user_id}'
+
+
+def invalidate_access_cache(user_id):
+    """Drop the shared-cache entry for a user's shares (called from signals)."""
+    if getattr(settings, 'FILE_ACCESS_CACHE_TTL', 0):
+        _access_cache().delete(_access_cache_key(user_id))
+
+
+class AccessResolver:
+    """
+    Per-request access decisions for one user.
+
+    Files from `shared_files()` are decided from the share they carry.
+    Otherwise the user's active shares are loaded once, in one query, as
+    `{file_id: (share_type, expires_at)}` and every decision is memoized.
+    With FILE_ACCESS_CACHE_TTL set, the share map is also kept in the Django
+    cache for that many seconds (never past the earliest share expiry) and
+    dropped by signals whenever one of the user's shares changes.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._shares = None
+        self._decisions = {}
+
+    def _load_shares(self):
+        ttl = getattr(settings, 'FILE_ACCESS_CACHE_TTL', 0)
+        key = _access_cache_key(self.user.pk)
+        if ttl:
+            shares = _access_cache().get(key)
+            if shares is not None:
+                return shares
+
+        shares = {
+            file_id: (share_type, expires_at)
+            for file_id, share_type, expires_at in active_shares(self.user).values_list(
+                'file_id', 'share_type', 'expires_at'
+            )
+        }
+        if ttl:
+            now = timezone.now()
+            expiries = [expires_at for _, expires_at in shares.values() if expires_at]
+            if expiries:
+                ttl = min(ttl, max(int((min(expiries) - now).total_seconds()), 1))
+            _access_cache().set(key, shares, ttl)
+        return shares
+
+    @property
+    def shares(self):
+        if self._shares is None:
+            self._shares = self._load_shares()
+        return self._shares
+
+    def can_access(self, file, download=False):
+        if is_owner(self.user, file):
+            return True
+        if hasattr(file, 'share_type'):
+            return file.share_type is not None and (not download or file.share_type == 'DOWNLOAD')
+        decision_key = (file.pk, download)
+        if decision_key not in self._decisions:
+            share = self.shares.get(file.pk)
+            allowed = share is not None and (share[1] is None or share[1] > timezone.now())
+            if allowed and download:
+                allowed = share[0] == 'DOWNLOAD'
+            self._decisions[decision_key] = allowed
+        return self._decisions[decision_key]
+
+
+def get_access_resolver(request):
+    """Return the AccessResolver memoized on this request."""
+    resolver = getattr(request, '_access_resolver', None)
+    if resolver is None or resolver.user != request.user:
+        resolver = AccessResolver(request.user)
+        request._access_resolver = resolver
+    return resolver
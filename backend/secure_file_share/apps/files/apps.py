@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class FilesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'secure_file_share.apps.files'
-    label = 'files' 
\ No newline at end of file
+    label = 'files'
+
+    def ready(self):
+        from . import signals  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,226 @@
+"""
+Content-defined chunking and the deduplicated chunk store for file versions.
+
+Content is split where a Gear rolling hash over the last bytes matches a
+mask (FastCDC-style, with normalized chunk sizes), so an edit only changes
+the chunks around it and boundaries re-synchronise right after. Each unique
+chunk is stored once and reference-counted by the versions whose manifest
+lists it. A manifest is the packed sequence of `(digest, size)` entries.
+
+Chunks are encrypted at rest like file content. Each owner has a key (an
+HKDF subkey of the master key); a chunk is named by an HMAC of its
+plaintext under that key and encrypted in the segmented stream format
+under a key derived from its name. Deduplication therefore never crosses
+owners, and names reveal nothing about content.
+"""
+import hashlib
+import hmac
+import os
+import struct
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from .keys import derive_subkey
+from .models import ContentChunk
+from .storage import get_chunk_store
+from .utils import decrypt_stream_range, encrypt_stream
+
+MASK64 = (1 << 64) - 1
+GEAR = tuple(int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'big') for i in range(256))
+
+ENTRY = struct.Struct('>32sI')
+BATCH_SIZE = 256
+OWNER_KEY_INFO = b'secure-file-share/versions/'
+
+
+def _mask(bits):
+    # The Gear hash shifts left, so only its high bits cover the whole window
+    return ((1 << bits) - 1) << (64 - bits)
+
+
+def cut_point(data, min_size, avg_size, max_size):
+    """Return the length of the first chunk of `data`."""
+    n = len(data)
+    if n <= min_size:
+        return n
+    end = min(n, max_size)
+    bits = avg_size.bit_length() - 1
+    # Stricter mask before the average size, looser after: sizes cluster around it
+    mask_s, mask_l = _mask(bits + 1), _mask(bits - 1)
+    normal = min(avg_size, end)
+    gear = GEAR
+    h = 0
+    i = min_size
+    while i < normal:
+        h = ((h << 1) + gear[data[i]]) & MASK64
+        if not h & mask_s:
+            return i + 1
+        i += 1
+    while i < end:
+        h = ((h << 1) + gear[data[i]]) & MASK64
+        if not h & mask_l:
+            return i + 1
+        i += 1
+    return end
+
+
+def iter_content_chunks(chunks, min_size=None, avg_size=None, max_size=None):
+    """Re-split an iterable of byte chunks at content-defined boundaries."""
+    min_size = min_size or settings.VERSION_CHUNK_MIN_SIZE
+    avg_size = avg_size or settings.VERSION_CHUNK_AVG_SIZE
+    max_size = max_size or settings.VERSION_CHUNK_MAX_SIZE
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= max_size:
+            cut = cut_point(buffer, min_size, avg_size, max_size)
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
+    while buffer:
+        cut = cut_point(buffer, min_size, avg_size, max_size)
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+
+
+def pack_manifest(entries):
+    return b''.join(ENTRY.pack(bytes.fromhex(digest), size) for digest, size in entries)
+
+
+def unpack_manifest(manifest):
+    return [(digest.hex(), size) for digest, size in ENTRY.iter_unpack(bytes(manifest or b''))]
+
+
+def owner_key(owner_id):
+    """The key an owner's version chunks are named and encrypted under."""
+    return derive_subkey(OWNER_KEY_INFO + str(owner_id).encode())
+
+
+def version_key(version):
+    return owner_key(version.file.owner_id)
+
+
+def chunk_digest(key, data):
+    return hmac.new(key, data, hashlib.sha256).hexdigest()
+
+
+def _chunk_key(key, digest):
+    return hmac.new(key, b'chunk-key' + bytes.fromhex(digest), hashlib.sha256).digest()
+
+
+def _save(store, key, digest, chunks):
+    store.save(encrypt_stream(chunks, _chunk_key(key, digest)), digest=digest)
+
+
+def read_chunk(key, digest, offset, length):
+    """Yield `length` plaintext bytes of a stored chunk from `offset`."""
+    if length <= 0:
+        return
+    store = get_chunk_store()
+    ref = store.ref_for_digest(digest)
+    yield from decrypt_stream_range(
+        lambda start, count: store.read_chunks(ref, start, count),
+        _chunk_key(key, digest), store.size(ref), offset, offset + length - 1
+    )
+
+
+def _write_batch(store, key, batch, referenced):
+    """
+    Reference the chunks of `batch` this manifest doesn't reference yet,
+    writing the ones that aren't stored.
+
+    The reference is taken under the row lock that
+    `delete_unreferenced_chunks` holds while deleting, so a chunk seen as
+    stored can't go away before it is referenced.
+    """
+    data = {digest: chunk for digest, chunk in batch if digest not in referenced}
+    if not data:
+        return
+    with transaction.atomic():
+        ContentChunk.objects.bulk_create(
+            [ContentChunk(digest=digest, size=len(chunk)) for digest, chunk in data.items()],
+            ignore_conflicts=True
+        )
+        refcounts = dict(
+            ContentChunk.objects.select_for_update().filter(digest__in=list(data)).values_list('digest', 'refcount')
+        )
+        ContentChunk.objects.filter(digest__in=list(data)).update(refcount=F('refcount') + 1)
+        for digest, refcount in refcounts.items():
+            if refcount == 0:
+                # New, or released and possibly deleted already: (re)write it
+                _save(store, key, digest, [data[digest]])
+    referenced.update(data)
+
+
+def store_chunks(chunks, key):
+    """
+    Chunk, encrypt and store content under an owner's `key`, writing only
+    chunks not already stored.
+
+    Returns `(manifest, size)`; the chunks are referenced once more each.
+    """
+    store = get_chunk_store()
+    entries = []
+    referenced = set()
+    batch = []
+    for data in iter_content_chunks(chunks):
+        digest = chunk_digest(key, data)
+        entries.append((digest, len(data)))
+        batch.append((digest, data))
+        if len(batch) >= BATCH_SIZE:
+            _write_batch(store, key, batch, referenced)
+            batch = []
+    _write_batch(store, key, batch, referenced)
+    return pack_manifest(entries), sum(size for _, size in entries)
+
+
+def store_blob(chunks, key):
+    """Store content as a single chunk, for blobs that are read by offset."""
+    # Such blobs are unique, so a random name is as good as a keyed hash
+    digest = os.urandom(32).hex()
+    size = 0
+
+    def counted():
+        nonlocal size
+        for data in chunks:
+            size += len(data)
+            yield data
+
+    _save(get_chunk_store(), key, digest, counted())
+    ContentChunk.objects.create(digest=digest, size=size, refcount=1)
+    return pack_manifest([(digest, size)]), size
+
+
+def iter_manifest(manifest, key):
+    """Yield the content described by a manifest, chunk by chunk."""
+    for digest, size in unpack_manifest(manifest):
+        yield from read_chunk(key, digest, 0, size)
+
+
+def release_manifest(manifest):
+    """Drop one reference to each chunk of a manifest, deleting chunks nobody uses."""
+    digests = list(dict.fromkeys(digest for digest, _ in unpack_manifest(manifest)))
+    unused = []
+    with transaction.atomic():
+        for i in range(0, len(digests), 500):
+            batch = digests[i:i + 500]
+            ContentChunk.objects.filter(digest__in=batch, refcount__gt=0).update(refcount=F('refcount') - 1)
+            unused += ContentChunk.objects.filter(digest__in=batch, refcount=0).values_list('digest', flat=True)
+    if unused:
+        transaction.on_commit(lambda: delete_unreferenced_chunks(unused))
+
+
+def delete_unreferenced_chunks(digests):
+    """Delete the chunks among `digests` that are still unreferenced, rows and all."""
+    store = get_chunk_store()
+    for i in range(0, len(digests), 500):
+        with transaction.atomic():
+            # Rows stay locked until the blobs are gone; a save of the same
+            # chunk meanwhile waits, then finds no row and writes it again
+            orphans = list(
+                ContentChunk.objects.select_for_update()
+                .filter(digest__in=digests[i:i + 500], refcount=0)
+                .values_list('digest', flat=True)
+            )
+            for digest in orphans:
+                store.delete(store.ref_for_digest(digest))
+            ContentChunk.objects.filter(digest__in=orphans).delete()
@@ -0,0 +1,144 @@
+"""
+Compression applied to file content before it is encrypted.
+
+Ciphertext doesn't compress, so this is the only place it can happen. The
+codec is picked per upload from FILE_COMPRESSION_CODECS (longest matching
+content-type prefix) and recorded in the stream header; content whose
+first bytes look random (already compressed formats, media) is stored
+as is. zstd needs the optional `zstandard` package and falls back to
+deflate without it.
+"""
+import itertools
+import math
+import zlib
+from collections import Counter
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+CODEC_NONE = 0
+CODEC_DEFLATE = 1
+CODEC_ZSTD = 2
+CODECS = {'none': CODEC_NONE, 'deflate': CODEC_DEFLATE, 'zstd': CODEC_ZSTD}
+
+DEFLATE_LEVEL = 6
+ZSTD_LEVEL = 3
+SAMPLE_SIZE = 64 * 1024  # Plaintext sniffed before a codec is chosen
+MIN_SIZE = 256  # Smaller files aren't worth a codec
+OUTPUT_CHUNK_SIZE = 64 * 1024  # Largest piece decompression yields, one stream segment
+
+
+def entropy(data):
+    """Shannon entropy of `data` in bits per byte (8.0 for random data)."""
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+
+def codec_for_type(content_type):
+    """The configured codec for a content type; None when it is known not to compress."""
+    policy = settings.FILE_COMPRESSION_CODECS
+    matches = [prefix for prefix in policy if (content_type or '').startswith(prefix)]
+    name = policy[max(matches, key=len)] if matches else None
+    if name == 'zstd' and zstandard is None:
+        name = 'deflate'
+    return CODECS[name] if name else None
+
+
+def choose_codec(chunks, content_type=''):
+    """
+    Pick the codec for a plaintext stream.
+
+    Returns `(codec, chunks)`; the bytes read to sniff the content are
+    chained back in front of the remaining chunks.
+    """
+    chunks = iter(chunks)
+    if not settings.FILE_COMPRESSION:
+        return CODEC_NONE, chunks
+    codec = codec_for_type(content_type)
+    if codec is None:
+        return CODEC_NONE, chunks
+
+    sample = bytearray()
+    for chunk in chunks:
+        sample += chunk
+        if len(sample) >= SAMPLE_SIZE:
+            break
+    chunks = itertools.chain([bytes(sample)], chunks)
+    if len(sample) < MIN_SIZE or entropy(sample[:SAMPLE_SIZE]) > settings.FILE_COMPRESSION_MAX_ENTROPY:
+        return CODEC_NONE, chunks
+    return codec, chunks
+
+
+def compress_chunks(codec, chunks):
+    """Compress an iterable of byte chunks with `codec`."""
+    if codec == CODEC_NONE:
+        yield from chunks
+        return
+    if codec == CODEC_DEFLATE:
+        compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    else:
+        compressor = _zstd().ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    for chunk in chunks:
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
+
+
+def decompress_chunks(codec, chunks):
+    """
+    Decompress an iterable of chunks produced by `compress_chunks`.
+
+    Output comes in pieces of at most OUTPUT_CHUNK_SIZE bytes however well
+    the input compressed, so a small blob can't force a large allocation.
+    """
+    if codec == CODEC_NONE:
+        yield from chunks
+    elif codec == CODEC_DEFLATE:
+        yield from _inflate(chunks)
+    else:
+        decompressor = _zstd().ZstdDecompressor()
+        yield from decompressor.read_to_iter(_ChunkReader(chunks), write_size=OUTPUT_CHUNK_SIZE)
+
+
+def _inflate(chunks):
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    # A final empty chunk drains whatever output is still pending
+    for data in itertools.chain(chunks, [b'']):
+        while True:
+            output = decompressor.decompress(data, OUTPUT_CHUNK_SIZE)
+            if output:
+                yield output
+            data = decompressor.unconsumed_tail
+            if not data and len(output) < OUTPUT_CHUNK_SIZE:
+                break
+
+
+class _ChunkReader:
+    """File-like `read()` over an iterable of chunks, for zstandard's streaming API."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def _zstd():
+    if zstandard is None:
+        raise ValueError('Content is zstd-compressed but the zstandard package is not installed')
+    return zstandard
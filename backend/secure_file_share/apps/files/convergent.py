@@ -0,0 +1,156 @@
+"""
+Opt-in convergent encryption with per-tenant deduplication.
+
+With CONVERGENT_ENCRYPTION on, a file's content key is an HMAC of its
+plaintext under a per-tenant key (itself an HKDF subkey of the master
+key), and the stream nonce prefix is derived from the content key. The
+same content uploaded twice in one tenant therefore encrypts to the same
+ciphertext, which is stored once as a ConvergentBlob and
+reference-counted by the files that use it.
+
+Convergent blobs are never compressed. The nonce prefix depends only on
+the key, so the bytes encrypted under it must depend only on the content:
+a codec, level or library change between storing and restoring a blob
+would otherwise encrypt different plaintext under the same nonces.
+
+The plaintext is hashed before anything is encrypted, so an upload whose
+content is already stored costs one read pass and no writes to the blob
+store. Content never converges across tenants.
+
+The trade-off: anyone in a tenant who can upload can learn whether a given
+file already exists there (confirmation-of-file). Only enable it where
+that is acceptable.
+"""
+import hashlib
+import hmac
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+from .keys import KEY_VERSION_CONVERGENT, derive_subkey, key_fields, wrap_key, wrapped_kek_version
+from .models import ConvergentBlob, File
+from .storage import get_blob_store
+from .utils import NONCE_PREFIX_SIZE, encrypt_stream, new_stream_header
+
+TENANT_KEY_INFO = b'secure-file-share/convergent/'
+
+
+def default_tenant(user):
+    """Every user shares a single tenant."""
+    return 'default'
+
+
+def tenant_for(user):
+    """Return the tenant whose uploads `user`'s files converge with, or None when disabled."""
+    if not settings.CONVERGENT_ENCRYPTION:
+        return None
+    return import_string(settings.CONVERGENT_ENCRYPTION_TENANT)(user)
+
+
+def content_key(tenant, chunks):
+    """Return `(key, size)`: the keyed hash of the plaintext in `chunks` and its length."""
+    mac = hmac.new(derive_subkey(TENANT_KEY_INFO + str(tenant).encode()), digestmod=hashlib.sha256)
+    size = 0
+    for chunk in chunks:
+        mac.update(chunk)
+        size += len(chunk)
+    return mac.digest(), size
+
+
+def locator(key):
+    """Look-up id of the blob encrypted under `key`; reveals nothing about the key."""
+    return hashlib.sha256(b'locator' + key).hexdigest()
+
+
+def _encrypt(key, chunks, store):
+    # A new label, so no nonce is shared with blobs once stored compressed
+    nonce_prefix = hmac.new(key, b'nonce-prefix/raw', hashlib.sha256).digest()[:NONCE_PREFIX_SIZE]
+    header = new_stream_header(nonce_prefix=nonce_prefix)
+    return store.save(encrypt_stream(chunks, key, header=header))
+
+
+def store_convergent(tenant, reopen, attach, store=None):
+    """
+    Store content under convergent encryption and attach it to a file.
+
+    `reopen()` returns a fresh iterable of the plaintext chunks; it is read
+    once to hash the content and again only if no blob of that content
+    exists yet. `attach(blob)` is called in the transaction that takes the
+    new reference, so a failure there leaves the refcount untouched; its
+    result is returned.
+    """
+    store = store or get_blob_store()
+    key, size = content_key(tenant, reopen())
+    conditions = {'tenant': tenant, 'locator': locator(key)}
+    encrypted = None
+    if not ConvergentBlob.objects.filter(**conditions).exists():
+        encrypted = _encrypt(key, reopen(), store)
+
+    while True:
+        with transaction.atomic():
+            if encrypted is not None:
+                wrapped = wrap_key(key)
+                ConvergentBlob.objects.bulk_create([ConvergentBlob(
+                    blob_ref=encrypted.ref,
+                    blob_size=encrypted.size,
+                    blob_digest=encrypted.digest,
+                    wrapped_key=wrapped,
+                    kek_version=wrapped_kek_version(wrapped),
+                    size=size,
+                    **conditions
+                )], ignore_conflicts=True)
+            # The lock `_delete_unused` holds while deleting the blob
+            blob = ConvergentBlob.objects.select_for_update().filter(**conditions).first()
+            if blob is not None:
+                if blob.refcount == 0 and not store.exists(blob.blob_ref):
+                    # Released, and the blob deleted since this content was
+                    # found or saved: save it again before taking a reference
+                    _restore(blob, key, reopen(), store)
+                ConvergentBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+                blob.refcount += 1
+                return attach(blob)
+        # The last file using the blob was deleted since the check; store it again
+        encrypted = _encrypt(key, reopen(), store)
+
+
+def _restore(blob, key, chunks, store):
+    encrypted = _encrypt(key, chunks, store)
+    if encrypted.ref != blob.blob_ref:
+        # First stored compressed, under the old nonce prefix
+        blob.blob_ref, blob.blob_size, blob.blob_digest = encrypted
+        blob.save(update_fields=['blob_ref', 'blob_size', 'blob_digest'])
+
+
+def convergent_fields(blob):
+    """File fields for a file stored in `blob`."""
+    return {
+        'convergent_blob': blob,
+        'blob_ref': blob.blob_ref,
+        'blob_size': blob.blob_size,
+        'blob_digest': blob.blob_digest,
+        **key_fields(blob.wrapped_key, KEY_VERSION_CONVERGENT),
+    }
+
+
+def release_convergent_blob(blob_id):
+    """Drop one reference to a blob, deleting it once no file uses it."""
+    with transaction.atomic():
+        ConvergentBlob.objects.filter(pk=blob_id, refcount__gt=0).update(refcount=F('refcount') - 1)
+        if ConvergentBlob.objects.filter(pk=blob_id, refcount=0).exists():
+            transaction.on_commit(lambda: _delete_unused(blob_id))
+
+
+def _delete_unused(blob_id):
+    with transaction.atomic():
+        # The row stays locked until the blob is gone, so an upload of the
+        # same content waits and then stores it again instead of referencing
+        # a blob about to disappear
+        unused = ConvergentBlob.objects.select_for_update().filter(pk=blob_id, refcount=0).first()
+        if unused is None:
+            return
+        if not File.objects.filter(blob_ref=unused.blob_ref).exists():
+            # previews.py imports this module through engine.py
+            from .previews import delete_previews
+            get_blob_store().delete(unused.blob_ref)
+            delete_previews(unused.blob_digest)
+        unused.delete()
@@ -0,0 +1,305 @@
+"""
+Binary deltas between consecutive file versions.
+
+A delta version stores, in a single chunk-store blob, the operations that
+rebuild it from its base version: COPY a range of the base, or INSERT
+literal bytes kept at the end of the blob. Matches are found on small
+content-defined blocks, so unchanged regions are copied even when they
+move. Every `VERSION_KEYFRAME_INTERVAL` versions (or when a delta would be
+mostly literals) a keyframe is stored as an ordinary chunk manifest, which
+bounds reconstruction chains.
+
+Reading any version goes through its map: the flat list of
+`(chunk digest, offset, length)` ranges of the chunk store that make up its
+content. Maps are composed from the keyframe through each delta and kept in
+an LRU cache, so reading the latest version reads the same bytes in the
+same large ranges as reading a full copy. Entries are keyed on the file's
+`version_generation`, which changes whenever part of a chain is rebased.
+
+Blob layout: header `(magic, format version, op count)`, ops
+`(kind, offset, length)`, then the literal bytes.
+"""
+import bisect
+import hashlib
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models import F
+from .chunking import (
+    iter_content_chunks, read_chunk, release_manifest, store_blob, store_chunks, unpack_manifest, version_key
+)
+from .models import File
+
+MAGIC = b'SFSD'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('>4sBI')
+OP = struct.Struct('>BQQ')
+COPY, INSERT = 0, 1
+# Chunk sizes are stored as 32-bit values
+MAX_LITERAL_SIZE = 2 ** 31 - 1
+
+
+class DeltaError(ValueError):
+    """Raised when a stored delta cannot be parsed."""
+
+
+def _block_sizes():
+    avg = settings.VERSION_DELTA_BLOCK_SIZE
+    return dict(min_size=avg // 4, avg_size=avg, max_size=avg * 4)
+
+
+def _block_key(block):
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+def block_index(chunks):
+    """Map each content-defined block of the base to its `(offset, length)`."""
+    index = {}
+    offset = 0
+    for block in iter_content_chunks(chunks, **_block_sizes()):
+        index.setdefault(_block_key(block), (offset, len(block)))
+        offset += len(block)
+    return index
+
+
+def _append_op(ops, kind, offset, length):
+    if ops:
+        last_kind, last_offset, last_length = ops[-1]
+        if last_kind == kind and last_offset + last_length == offset:
+            ops[-1] = (kind, last_offset, last_length + length)
+            return
+    ops.append((kind, offset, length))
+
+
+def compute_delta(index, chunks, literals):
+    """
+    Encode `chunks` against a base `index`, writing literal bytes to `literals`.
+
+    Returns `(ops, literal_size, size)`.
+    """
+    ops = []
+    literal_size = size = 0
+    for block in iter_content_chunks(chunks, **_block_sizes()):
+        hit = index.get(_block_key(block))
+        if hit is not None and hit[1] == len(block):
+            _append_op(ops, COPY, hit[0], len(block))
+        else:
+            literals.write(block)
+            _append_op(ops, INSERT, literal_size, len(block))
+            literal_size += len(block)
+        size += len(block)
+    return ops, literal_size, size
+
+
+def encode_delta(ops, literals, chunk_size=256 * 1024):
+    """Yield the delta blob for `ops` and a readable `literals` file."""
+    yield HEADER.pack(MAGIC, FORMAT_VERSION, len(ops))
+    yield b''.join(OP.pack(*op) for op in ops)
+    literals.seek(0)
+    while chunk := literals.read(chunk_size):
+        yield chunk
+
+
+def read_delta_ops(digest, key):
+    """Return `(ops, literal_offset)` of a stored delta blob."""
+    header = b''.join(read_chunk(key, digest, 0, HEADER.size))
+    try:
+        magic, version, count = HEADER.unpack(header)
+    except struct.error:
+        raise DeltaError('Truncated delta header')
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise DeltaError('Not a delta blob')
+    raw = b''.join(read_chunk(key, digest, HEADER.size, count * OP.size))
+    if len(raw) != count * OP.size:
+        raise DeltaError('Truncated delta ops')
+    return list(OP.iter_unpack(raw)), HEADER.size + count * OP.size
+
+
+def _append_range(segments, digest, offset, length):
+    if segments:
+        last_digest, last_offset, last_length = segments[-1]
+        if last_digest == digest and last_offset + last_length == offset:
+            segments[-1] = (digest, last_offset, last_length + length)
+            return
+    segments.append((digest, offset, length))
+
+
+def slice_map(segments, starts, offset, length):
+    """The ranges covering `[offset, offset + length)` of a map; `starts` are its offsets."""
+    out = []
+    i = bisect.bisect_right(starts, offset) - 1
+    end = offset + length
+    while offset < end:
+        digest, seg_offset, seg_length = segments[i]
+        skip = offset - starts[i]
+        take = min(seg_length - skip, end - offset)
+        _append_range(out, digest, seg_offset + skip, take)
+        offset += take
+        i += 1
+    return out
+
+
+def _starts(segments):
+    starts = []
+    position = 0
+    for _, _, length in segments:
+        starts.append(position)
+        position += length
+    return starts
+
+
+def compose_map(base_segments, delta_digest, key):
+    """Resolve a delta against its base's map into a map of its own."""
+    ops, literal_offset = read_delta_ops(delta_digest, key)
+    starts = _starts(base_segments)
+    segments = []
+    for kind, offset, length in ops:
+        if kind == COPY:
+            for segment in slice_map(base_segments, starts, offset, length):
+                _append_range(segments, *segment)
+        elif kind == INSERT:
+            _append_range(segments, delta_digest, literal_offset + offset, length)
+        else:
+            raise DeltaError(f'Unknown delta op {kind}')
+    return segments
+
+
+class MapCache:
+    """Thread-safe LRU of composed version maps."""
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            segments = self._entries.get(key)
+            if segments is not None:
+                self._entries.move_to_end(key)
+            return segments
+
+    def put(self, key, segments):
+        with self._lock:
+            self._entries[key] = segments
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+map_cache = MapCache(getattr(settings, 'VERSION_MAP_CACHE_SIZE', 64))
+
+
+def version_map(version, key=None):
+    """
+    Return the chunk-store ranges holding a version's content; `key` is
+    its owner's chunk key (see chunking.py), looked up if not given.
+    """
+    return _version_map(version, key or version_key(version), version.file.version_generation)
+
+
+def _version_map(version, key, generation):
+    if version.manifest is None:
+        return []
+    manifest = bytes(version.manifest)
+    if version.base_id is None:
+        return [(digest, 0, size) for digest, size in unpack_manifest(manifest)]
+
+    # Rebasing rewrites a version's ancestors but not its own manifest, so
+    # the file's generation (bumped by rebase_dependents) is part of the key
+    cache_key = (version.pk, manifest, generation)
+    segments = map_cache.get(cache_key)
+    if segments is None:
+        (delta_digest, _), = unpack_manifest(manifest)
+        segments = compose_map(_version_map(version.base, key, generation), delta_digest, key)
+        map_cache.put(cache_key, segments)
+    return segments
+
+
+def iter_map(segments, key):
+    for digest, offset, length in segments:
+        yield from read_chunk(key, digest, offset, length)
+
+
+def iter_version(version):
+    """Stream a version's content, reconstructing deltas as needed."""
+    key = version_key(version)
+    return iter_map(version_map(version, key), key)
+
+
+def save_delta_version(version, base, chunks):
+    """
+    Store `chunks` as a delta against `base`, or as a keyframe when the
+    chain is long enough or the delta would be mostly literals.
+    """
+    if base is None or base.chain_depth + 1 >= settings.VERSION_KEYFRAME_INTERVAL:
+        return save_keyframe(version, chunks)
+
+    index = block_index(iter_version(base))
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as literals:
+        ops, literal_size, size = compute_delta(index, chunks, literals)
+        if literal_size > min(size * settings.VERSION_DELTA_MAX_LITERAL_RATIO, MAX_LITERAL_SIZE):
+            # Rebuild the content from the ops rather than keep a poor delta
+            literals.seek(0)
+            return save_keyframe(version, _apply_ops(ops, literals, base))
+        manifest, _ = store_blob(encode_delta(ops, literals), version_key(version))
+
+    version.manifest = manifest
+    version.base = base
+    version.chain_depth = base.chain_depth + 1
+    version.size = size
+    version.save()
+    return version
+
+
+def save_keyframe(version, chunks):
+    version.manifest, version.size = store_chunks(chunks, version_key(version))
+    version.base = None
+    version.chain_depth = 0
+    version.save()
+    return version
+
+
+def _apply_ops(ops, literals, base):
+    key = version_key(base)
+    base_segments = version_map(base, key)
+    starts = _starts(base_segments)
+    for kind, offset, length in ops:
+        if kind == COPY:
+            yield from iter_map(slice_map(base_segments, starts, offset, length), key)
+        else:
+            literals.seek(offset)
+            while length > 0:
+                chunk = literals.read(min(length, 256 * 1024))
+                length -= len(chunk)
+                yield chunk
+
+
+def rebase_dependents(version):
+    """Turn the deltas based on `version` into keyframes so it can be removed."""
+    children = list(version.deltas.filter(manifest__isnull=False))
+    if children:
+        # Maps cached in any process for deeper deltas still point into the
+        # old chain; a new generation makes them unreachable
+        File.objects.filter(pk=version.file_id).update(version_generation=F('version_generation') + 1)
+    for child in children:
+        old_manifest, old_depth = child.manifest, child.chain_depth
+        save_keyframe(child, iter_version(child))
+        release_manifest(old_manifest)
+        _shift_depths(child, old_depth)
+
+
+def _shift_depths(version, by):
+    for child in version.deltas.all():
+        child.chain_depth -= by
+        child.save(update_fields=['chain_depth'])
+        _shift_depths(child, by)
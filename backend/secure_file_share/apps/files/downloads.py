@@ -0,0 +1,94 @@
+import re
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import quote_etag
+from .engine import StorageEngine
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range `Range` header against a resource of `size` bytes.
+
+    Returns `(start, end)` inclusive, None when the header should be ignored
+    (absent, malformed or multi-range) and raises ValueError when the range
+    cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final `last` bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError('Unsatisfiable range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise ValueError('Unsatisfiable range')
+    return start, end
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return etag in candidates
+
+
+def file_download_response(request, file_obj):
+    """
+    Build a streaming download response for a File.
+
+    Blob-backed stream payloads support `ETag`/`If-None-Match`, `Range` and
+    `If-Range`; only the segments overlapping the requested range are read
+    and decrypted (compressed payloads are decrypted up to the end of the
+    range). Legacy payloads are streamed whole.
+    """
+    engine = StorageEngine()
+    size = engine.plaintext_size(file_obj)
+    if size is None:
+        response = StreamingHttpResponse(engine.read(file_obj), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="{file_obj.name}"'
+        return response
+
+    etag = quote_etag(file_obj.blob_digest)
+    conditional = request.method in ('GET', 'HEAD')
+
+    if conditional and _etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    byte_range = None
+    if conditional:
+        if_range = request.headers.get('If-Range')
+        if not if_range or if_range.strip() == etag:
+            try:
+                byte_range = parse_range(request.headers.get('Range'), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status = 206
+    chunks = engine.read(file_obj, start, end) if size else iter(())
+
+    response = StreamingHttpResponse(chunks, status=status, content_type='application/octet-stream')
+    response['Content-Length'] = str(end - start + 1)
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = f'attachment; filename="{file_obj.name}"'
+    return response
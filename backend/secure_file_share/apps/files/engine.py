@@ -0,0 +1,131 @@
+"""
+The storage engine: the one path file content takes in and out.
+
+Writing streams plaintext chunks through compression (compression.py) and
+segmented encryption under a wrapped per-file data key (keys.py), or a
+content-derived key with convergent encryption (convergent.py), into a
+blob store backend. The fields describing the stored content are handed
+to the caller to attach to a File, together with the SHA-256 of the
+plaintext, hashed in the same pass; saving the File fires the signals that
+index it for search and queue its previews.
+
+Reading decrypts (and decompresses) plaintext straight from the blob
+store, only touching the segments a byte range needs where the stream
+format allows it.
+"""
+import hashlib
+import itertools
+from .compression import CODEC_NONE
+from .convergent import convergent_fields, release_convergent_blob, store_convergent
+from .keys import derive_file_key, key_fields
+from .models import ConvergentBlob, File
+from .storage import get_blob_store
+from .utils import (
+    MAX_HEADER_SIZE, _iter_chunks, decrypt_chunks, decrypt_stream_range, encrypt_file_to_store,
+    is_encrypted_stream, parse_stream_header, stream_codec, stream_plaintext_size
+)
+
+
+def _digesting(chunks, digest):
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+
+def _reopen(source):
+    """A callable returning fresh plaintext chunks of `source` on every call."""
+    if callable(source):
+        return source
+    if hasattr(source, 'chunks'):
+        return source.chunks
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return lambda: [bytes(source)]
+    raise TypeError('Convergent storage needs content that can be read twice')
+
+
+def _digesting_first_pass(reopen, digest):
+    """`reopen`, feeding the chunks of its first pass to `digest`."""
+    passes = itertools.count()
+
+    def wrapped():
+        chunks = reopen()
+        return _digesting(chunks, digest) if next(passes) == 0 else chunks
+    return wrapped
+
+
+class StorageEngine:
+    def __init__(self, store=None):
+        self.store = store or get_blob_store()
+
+    def write(self, source, attach, content_type='', tenant=None):
+        """
+        Store content and pass the File fields describing it, including its
+        `content_digest`, to `attach(fields)`.
+
+        `source` is bytes, an uploaded file, an iterable of chunks or a
+        callable returning fresh chunks. With a `tenant`, identical content
+        in the tenant is stored once and `attach` runs in the transaction
+        that takes the reference, so `source` must be readable twice.
+        Returns what `attach` returns.
+        """
+        digest = hashlib.sha256()
+        if tenant is not None:
+            return store_convergent(
+                tenant,
+                _digesting_first_pass(_reopen(source), digest),
+                lambda blob: attach({**convergent_fields(blob), 'content_digest': digest.hexdigest()}),
+                self.store
+            )
+        chunks = _digesting(source() if callable(source) else _iter_chunks(source), digest)
+        blob, salt = encrypt_file_to_store(chunks, self.store, content_type)
+        return attach({
+            'blob_ref': blob.ref,
+            'blob_size': blob.size,
+            'blob_digest': blob.digest,
+            'content_digest': digest.hexdigest(),
+            **key_fields(salt),
+        })
+
+    def discard(self, fields):
+        """Undo a write whose file went away before `fields` could be attached."""
+        if fields.get('convergent_blob') is not None:
+            release_convergent_blob(fields['convergent_blob'].pk)
+        elif not (
+            File.objects.filter(blob_ref=fields['blob_ref']).exists()
+            or ConvergentBlob.objects.filter(blob_ref=fields['blob_ref']).exists()
+        ):
+            self.store.delete(fields['blob_ref'])
+
+    def plaintext_size(self, file):
+        """
+        Plaintext length of a file stored as a segmented stream; None for
+        legacy payloads, which can only be read whole.
+        """
+        if not file.blob_ref or not file.blob_size:
+            return None
+        header = b''.join(self.store.read_chunks(file.blob_ref, 0, MAX_HEADER_SIZE))
+        if not is_encrypted_stream(header):
+            return None
+        if stream_codec(header) != CODEC_NONE:
+            # Compressed before encryption; only the File row knows the real size
+            return file.size
+        segment_size, _ = parse_stream_header(header)
+        return stream_plaintext_size(file.blob_size, segment_size)
+
+    def read(self, file, start=0, end=None):
+        """
+        Yield a file's plaintext, or bytes `start`..`end` (inclusive) of it.
+
+        Ranges need a stream payload (see `plaintext_size`).
+        """
+        if start and end is None:
+            end = self.plaintext_size(file) - 1
+        if end is None:
+            chunks = self.store.read_chunks(file.blob_ref) if file.blob_ref else file.encrypted_chunks()
+            return decrypt_chunks(chunks, file.encryption_salt, file.key_version)
+
+        def read(offset, length):
+            return self.store.read_chunks(file.blob_ref, offset, length)
+
+        key = derive_file_key(file.encryption_salt, file.key_version)
+        return decrypt_stream_range(read, key, file.blob_size, start, end)
@@ -0,0 +1,233 @@
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# Key versions recorded on File.key_version
+KEY_VERSION_PBKDF2 = 1  # Legacy: PBKDF2(SECRET_KEY, per-file salt) on every request
+KEY_VERSION_HKDF = 2    # HKDF subkey of a per-process master key
+KEY_VERSION_CONVERGENT = 3  # Content-derived key, wrapped with a KEK (see convergent.py)
+KEY_VERSION_ENVELOPE = 4  # Random per-file data key, wrapped with a KEK
+CURRENT_KEY_VERSION = KEY_VERSION_ENVELOPE
+# Versions whose "salt" is a wrapped key record, re-wrapped by `manage.py rotate_keys`
+WRAPPED_KEY_VERSIONS = (KEY_VERSION_CONVERGENT, KEY_VERSION_ENVELOPE)
+
+MASTER_KEY_SALT = b'secure-file-share/master-key'
+FILE_KEY_INFO = b'secure-file-share/file-key/v2'
+WRAP_KEY_INFO = b'secure-file-share/wrap-key/v1'
+WRAP_NONCE_SIZE = 12
+# Wrapped key record: KEK version (2) | nonce (12) | AES-GCM(data key) + tag (48)
+WRAPPED_KEY_PREFIX = struct.Struct('>H')
+PBKDF2_ITERATIONS = 100000
+
+
+def _pbkdf2(secret, salt):
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=PBKDF2_ITERATIONS,
+    )
+    return kdf.derive(secret)
+
+
+class DerivedKeyCache:
+    """
+    Bounded LRU cache of derived keys with a TTL.
+
+    Keys are held in bytearrays that are zeroed when they are evicted,
+    expire or the cache is cleared. Callers receive an immutable copy so an
+    eviction on another thread can never change a key that is in use.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key, derive):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                key, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(cache_key)
+                    return bytes(key)
+                self._discard(cache_key)
+
+        # Derive outside the lock so a slow legacy PBKDF2 doesn't serialize other requests
+        key = bytearray(derive())
+        with self._lock:
+            if cache_key in self._entries:
+                self._discard(cache_key)
+            self._entries[cache_key] = (key, now + self.ttl)
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+            return bytes(key)
+
+    def clear(self):
+        with self._lock:
+            for cache_key in list(self._entries):
+                self._discard(cache_key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _discard(self, cache_key):
+        key, _ = self._entries.pop(cache_key)
+        _wipe(key)
+
+
+def _wipe(buffer):
+    for i in range(len(buffer)):
+        buffer[i] = 0
+
+
+_master_key = None
+_master_key_lock = threading.Lock()
+_wrapping_keys = {}  # KEK version -> key used to wrap data keys
+
+key_cache = DerivedKeyCache(
+    maxsize=getattr(settings, 'FILE_KEY_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'FILE_KEY_CACHE_TTL', 300),
+)
+
+
+def get_master_key():
+    """Derive the master data-encryption key once per process."""
+    global _master_key
+    if _master_key is None:
+        with _master_key_lock:
+            if _master_key is None:
+                _master_key = bytearray(
+                    _pbkdf2(settings.ENCRYPTION_MASTER_KEY.encode(), MASTER_KEY_SALT)
+                )
+    return bytes(_master_key)
+
+
+def reset_keys():
+    """Wipe the master key and every cached file key (e.g. after a settings change)."""
+    global _master_key
+    with _master_key_lock:
+        if _master_key is not None:
+            _wipe(_master_key)
+        _master_key = None
+        for key in _wrapping_keys.values():
+            _wipe(key)
+        _wrapping_keys.clear()
+    key_cache.clear()
+
+
+@receiver(setting_changed)
+def _reset_changed_keys(setting, **kwargs):
+    if setting in ('ENCRYPTION_MASTER_KEY', 'ENCRYPTION_KEKS'):
+        reset_keys()
+
+
+def derive_subkey(info, salt=None):
+    """
+    An HKDF subkey of the master key for `info`, served from the key cache.
+
+    Subkeys are not wrapped, so `rotate_keys` leaves them under the master key.
+    """
+    return key_cache.get(('subkey', info, salt), lambda: HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        info=info,
+    ).derive(get_master_key()))
+
+
+def current_kek_version():
+    return settings.ENCRYPTION_KEK_VERSION
+
+
+def _wrapping_key(kek_version):
+    """The key derived from KEK `kek_version` (settings.ENCRYPTION_KEKS), once per process."""
+    key = _wrapping_keys.get(kek_version)
+    if key is None:
+        try:
+            secret = settings.ENCRYPTION_KEKS[kek_version]
+        except KeyError:
+            raise ValueError(f'Unknown key-encryption key version: {kek_version}') from None
+        kek = _pbkdf2(secret.encode(), MASTER_KEY_SALT)
+        key = bytearray(HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=WRAP_KEY_INFO).derive(kek))
+        with _master_key_lock:
+            key = _wrapping_keys.setdefault(kek_version, key)
+    return bytes(key)
+
+
+def wrap_key(key, kek_version=None):
+    """Encrypt a data key with a KEK (the current one by default), for storage in `File.encryption_salt`."""
+    if kek_version is None:
+        kek_version = current_kek_version()
+    prefix = WRAPPED_KEY_PREFIX.pack(kek_version)
+    nonce = os.urandom(WRAP_NONCE_SIZE)
+    # The version is authenticated, so a record can't be replayed under another KEK
+    return prefix + nonce + AESGCM(_wrapping_key(kek_version)).encrypt(nonce, bytes(key), prefix)
+
+
+def wrapped_kek_version(wrapped):
+    """The KEK version a wrapped key record was made with."""
+    return WRAPPED_KEY_PREFIX.unpack_from(bytes(wrapped))[0]
+
+
+def unwrap_key(wrapped):
+    wrapped = bytes(wrapped)
+    prefix, nonce = wrapped[:WRAPPED_KEY_PREFIX.size], wrapped[WRAPPED_KEY_PREFIX.size:][:WRAP_NONCE_SIZE]
+    ciphertext = wrapped[WRAPPED_KEY_PREFIX.size + WRAP_NONCE_SIZE:]
+    return AESGCM(_wrapping_key(wrapped_kek_version(wrapped))).decrypt(nonce, ciphertext, prefix)
+
+
+def rewrap_key(wrapped, kek_version=None):
+    """Re-wrap a record under another KEK (the current one by default); the data key is unchanged."""
+    return wrap_key(unwrap_key(wrapped), kek_version)
+
+
+def new_data_key():
+    """Return `(key, wrapped)`: a random data key and its record under the current KEK."""
+    key = os.urandom(32)
+    return key, wrap_key(key)
+
+
+def key_fields(salt, key_version=CURRENT_KEY_VERSION):
+    """Model fields recording a file's key: its salt (or wrapped key record) and versions."""
+    salt = bytes(salt)
+    return {
+        'encryption_salt': salt,
+        'key_version': key_version,
+        'kek_version': wrapped_kek_version(salt) if key_version in WRAPPED_KEY_VERSIONS else None,
+    }
+
+
+def derive_file_key(salt, key_version):
+    """
+    Return the raw 32 byte key for a file's salt under the given key version.
+
+    For WRAPPED_KEY_VERSIONS the "salt" is the wrapped key record.
+    """
+    salt = bytes(salt)
+    if key_version in WRAPPED_KEY_VERSIONS:
+        derive = lambda: unwrap_key(salt)
+    elif key_version == KEY_VERSION_HKDF:
+        derive = lambda: HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            info=FILE_KEY_INFO,
+        ).derive(get_master_key())
+    elif key_version == KEY_VERSION_PBKDF2:
+        derive = lambda: _pbkdf2(settings.SECRET_KEY.encode(), salt)
+    else:
+        raise ValueError(f'Unknown key version: {key_version}')
+    return key_cache.get((key_version, salt), derive)
@@ -0,0 +1,159 @@
+"""
+Stateless share-link tokens.
+
+A token carries everything needed to resolve a link: the file id, the
+permission, the expiry and a random link id, authenticated with a
+truncated HMAC-SHA256 keyed from SECRET_KEY (or one of
+SECRET_KEY_FALLBACKS). Checking a token therefore needs no database
+access.
+
+Revoked links are recorded as RevokedShareLink rows until they would
+have expired. Each process keeps a copy of the revoked ids in a
+RevocationSet. The set re-reads only recently revoked rows, at most every
+SHARE_LINK_REVOCATION_REFRESH seconds, so a revocation reaches every
+process within that interval and immediately in the process that made it.
+"""
+import base64
+import os
+import struct
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from .models import RevokedShareLink
+
+TOKEN_VERSION = 1
+# version, file id, permission, expiry (Unix time), link id
+PAYLOAD = struct.Struct('>B16sBI8s')
+TAG_SIZE = 16
+KEY_SALT = 'secure_file_share.files.links'
+
+PERMISSIONS = ('VIEW', 'DOWNLOAD')
+
+
+class ShareLink(namedtuple('ShareLink', 'link_id file_id permission expires')):
+    __slots__ = ()
+
+    @property
+    def expires_at(self):
+        return datetime.fromtimestamp(self.expires, tz=dt_timezone.utc)
+
+
+class InvalidShareToken(Exception):
+    """Raised for malformed, forged, expired or revoked tokens."""
+
+
+def _tag(payload, secret=None):
+    return salted_hmac(KEY_SALT, payload, secret=secret, algorithm='sha256').digest()[:TAG_SIZE]
+
+
+def issue_token(file_id, permission='VIEW', ttl=None):
+    """Return `(token, ShareLink)` for a new link to `file_id` valid for `ttl` seconds."""
+    ttl = settings.SHARE_LINK_MAX_AGE if ttl is None else min(ttl, settings.SHARE_LINK_MAX_AGE)
+    link = ShareLink(
+        link_id=os.urandom(8).hex(),
+        file_id=uuid.UUID(str(file_id)),
+        permission=permission,
+        expires=int(time.time()) + ttl,
+    )
+    payload = PAYLOAD.pack(
+        TOKEN_VERSION, link.file_id.bytes, PERMISSIONS.index(permission), link.expires, bytes.fromhex(link.link_id)
+    )
+    return base64.urlsafe_b64encode(payload + _tag(payload)).decode().rstrip('='), link
+
+
+def verify_token(token):
+    """Return the ShareLink of a valid token without touching the database."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (ValueError, TypeError):
+        raise InvalidShareToken('Malformed token')
+    if len(raw) != PAYLOAD.size + TAG_SIZE:
+        raise InvalidShareToken('Malformed token')
+
+    payload, tag = raw[:PAYLOAD.size], raw[PAYLOAD.size:]
+    secrets = [settings.SECRET_KEY, *getattr(settings, 'SECRET_KEY_FALLBACKS', [])]
+    if not any(constant_time_compare(tag, _tag(payload, secret)) for secret in secrets):
+        raise InvalidShareToken('Bad signature')
+
+    version, file_id, permission, expires, link_id = PAYLOAD.unpack(payload)
+    if version != TOKEN_VERSION or permission >= len(PERMISSIONS):
+        raise InvalidShareToken('Unsupported token')
+    if expires <= time.time():
+        raise InvalidShareToken('Link has expired')
+    link = ShareLink(link_id.hex(), uuid.UUID(bytes=file_id), PERMISSIONS[permission], expires)
+    if link.link_id in revocations:
+        raise InvalidShareToken('Link has been revoked')
+    return link
+
+
+class RevocationSet:
+    """
+    Process-local copy of the ids of revoked, unexpired links.
+
+    The first check loads every unexpired revocation. Later refreshes read
+    only rows revoked since the previous refresh, less a margin for
+    transactions that committed late. Entries are dropped once their link
+    has expired anyway.
+    """
+    # Rows revoked this long before a refresh are read again by it
+    LATE_COMMIT_MARGIN = timedelta(seconds=60)
+
+    def __init__(self):
+        self._revoked = {}  # link id -> expiry
+        self._refreshed_at = None  # time.monotonic() of the last refresh
+        self._since = None  # revoked_at lower bound of the next refresh
+        self._lock = threading.Lock()
+
+    def _stale(self):
+        return (
+            self._refreshed_at is None
+            or time.monotonic() - self._refreshed_at >= settings.SHARE_LINK_REVOCATION_REFRESH
+        )
+
+    def refresh(self, force=False):
+        if not (force or self._stale()):
+            return
+        with self._lock:
+            if not (force or self._stale()):
+                return
+            started = timezone.now()
+            now = time.time()
+            rows = RevokedShareLink.objects.filter(expires__gt=now)
+            if self._since is not None:
+                rows = rows.filter(revoked_at__gte=self._since)
+            revoked = {link_id: expires for link_id, expires in self._revoked.items() if expires > now}
+            revoked.update(rows.values_list('link_id', 'expires'))
+            self._revoked = revoked
+            self._since = started - self.LATE_COMMIT_MARGIN
+            self._refreshed_at = time.monotonic()
+
+    def add(self, link_id, expires):
+        with self._lock:
+            self._revoked[link_id] = expires
+
+    def clear(self):
+        with self._lock:
+            self._revoked = {}
+            self._refreshed_at = self._since = None
+
+    def __contains__(self, link_id):
+        self.refresh()
+        return link_id in self._revoked
+
+
+revocations = RevocationSet()
+
+
+def revoke_token(token):
+    """Revoke the link of a valid token; returns its ShareLink."""
+    link = verify_token(token)
+    RevokedShareLink.objects.get_or_create(link_id=link.link_id, defaults={'expires': link.expires})
+    revocations.add(link.link_id, link.expires)
+    # Revocations of links that have expired since are no longer needed
+    RevokedShareLink.objects.filter(expires__lte=time.time()).delete()
+    return link
@@ -0,0 +1,48 @@
+import hashlib
+import time
+from django.core.management.base import BaseCommand
+from ...engine import StorageEngine
+from ...models import File
+
+
+class Command(BaseCommand):
+    help = 'Hash the plaintext of files stored without a content digest, so upload preflight finds them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches to limit load on the database'
+        )
+
+    def handle(self, *args, **options):
+        engine = StorageEngine()
+        pending = File.objects.filter(status='READY', content_digest__isnull=True)
+        hashed = 0
+        last_pk = None
+
+        while True:
+            # Each file is decrypted and updated on its own; nothing is locked while hashing
+            batch = pending.order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            files = list(batch[:options['batch_size']])
+            if not files:
+                break
+
+            for file in files:
+                if not file.has_content:
+                    continue
+                digest = hashlib.sha256()
+                for chunk in engine.read(file):
+                    digest.update(chunk)
+                hashed += File.objects.filter(pk=file.pk, content_digest__isnull=True).update(
+                    content_digest=digest.hexdigest()
+                )
+
+            last_pk = files[-1].pk
+            self.stdout.write(f'Hashed {hashed} files')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Done, {hashed} files given a content digest'))
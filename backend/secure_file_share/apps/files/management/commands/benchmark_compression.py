@@ -0,0 +1,109 @@
+import io
+import mimetypes
+import os
+import random
+import statistics
+import time
+import zipfile
+from django.core.management.base import BaseCommand
+from ...compression import CODEC_DEFLATE, CODEC_NONE, CODEC_ZSTD, choose_codec, zstandard
+from ...utils import decrypt_stream, encrypt_stream, new_stream_header
+
+WORDS = (
+    'quarterly revenue forecast budget region invoice customer contract total '
+    'shipment pending approved review account balance margin growth report'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Report compression ratio against encrypt/decrypt throughput for each codec on a sample corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Directory of sample files (default: a generated corpus)')
+        parser.add_argument('--size', type=int, default=8, help='Size of each generated sample in MB')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per measurement')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        corpus = self._load(options['path']) if options['path'] else self._generate(options)
+        codecs = [('none', CODEC_NONE), ('deflate', CODEC_DEFLATE)]
+        if zstandard is not None:
+            codecs.append(('zstd', CODEC_ZSTD))
+        else:
+            self.stdout.write('zstandard is not installed; skipping zstd')
+        codecs.append(('auto', None))  # What uploads get under FILE_COMPRESSION_CODECS
+
+        key = os.urandom(32)
+        self.stdout.write(f"{'sample':<14}{'codec':<9}{'MB':>7}{'ratio':>8}{'enc MB/s':>10}{'dec MB/s':>10}")
+        totals = {}
+        for name, content_type, data in corpus:
+            for label, codec in codecs:
+                stored, encrypt, decrypt = self._measure(data, content_type, codec, key, options['repeat'])
+                total = totals.setdefault(label, [0, 0])
+                total[0] += len(data)
+                total[1] += stored
+                mb = len(data) / 2 ** 20
+                self.stdout.write(
+                    f'{name:<14}{label:<9}{mb:>7.1f}{stored / len(data):>8.3f}'
+                    f'{mb / encrypt:>10.1f}{mb / decrypt:>10.1f}'
+                )
+        for label, (logical, stored) in totals.items():
+            self.stdout.write(f'overall {label:<9} ratio {stored / logical:.3f}')
+
+    @staticmethod
+    def _time(fn, repeat):
+        samples = []
+        result = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            samples.append(time.perf_counter() - started)
+        return result, statistics.median(samples)
+
+    def _measure(self, data, content_type, codec, key, repeat):
+        def encrypt():
+            chunks = (data[i:i + 64 * 1024] for i in range(0, len(data), 64 * 1024))
+            chosen = codec
+            if chosen is None:
+                chosen, chunks = choose_codec(chunks, content_type)
+            return b''.join(encrypt_stream(chunks, key, header=new_stream_header(codec=chosen)))
+
+        ciphertext, encrypt_time = self._time(encrypt, repeat)
+        plaintext, decrypt_time = self._time(lambda: b''.join(decrypt_stream([ciphertext], key)), repeat)
+        assert plaintext == data
+        return len(ciphertext), encrypt_time, decrypt_time
+
+    @staticmethod
+    def _load(path):
+        corpus = []
+        for entry in sorted(os.listdir(path)):
+            full_path = os.path.join(path, entry)
+            if os.path.isfile(full_path):
+                with open(full_path, 'rb') as f:
+                    corpus.append((entry[:13], mimetypes.guess_type(entry)[0] or '', f.read()))
+        return corpus
+
+    @staticmethod
+    def _generate(options):
+        rng = random.Random(options['seed'])
+        size = options['size'] * 1024 * 1024
+
+        def fill(make_line):
+            out = io.StringIO()
+            while out.tell() < size:
+                out.write(make_line())
+            return out.getvalue().encode()[:size]
+
+        csv = fill(lambda: ','.join([
+            f'{rng.randrange(10 ** 6)}', rng.choice(WORDS), f'{rng.uniform(0, 10 ** 4):.2f}', '2024-01-01'
+        ]) + '\n')
+        text = fill(lambda: ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(5, 20))).capitalize() + '.\n')
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('data.csv', csv)
+        return [
+            ('data.csv', 'text/csv', csv),
+            ('notes.txt', 'text/plain', text),
+            ('data.zip', 'application/zip', archive.getvalue()),
+            ('random.bin', 'application/octet-stream', rng.randbytes(size)),
+        ]
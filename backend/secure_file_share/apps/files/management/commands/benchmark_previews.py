@@ -0,0 +1,125 @@
+import mimetypes
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+from io import BytesIO
+from django.core.management.base import BaseCommand
+from PIL import Image
+from ...services.preview import FilePreviewService, fitz
+
+SUPPORTED = ('image/jpeg', 'image/png', 'image/gif', 'application/pdf')
+
+
+def legacy_preview(path, content_type, size):
+    """The previous renderer: PDFs at 2x through a PNG round-trip, convert before thumbnail."""
+    with open(path, 'rb') as f:
+        if content_type == 'application/pdf':
+            pdf_document = fitz.open(stream=f.read(), filetype='pdf')
+            pix = pdf_document[0].get_pixmap(matrix=fitz.Matrix(2, 2))
+            image = Image.open(BytesIO(pix.tobytes('png')))
+        else:
+            image = Image.open(f)
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        output = BytesIO()
+        image.save(output, format='JPEG', quality=85)
+        return output.getvalue()
+
+
+def fast_preview(path, content_type, size):
+    with open(path, 'rb') as f:
+        return FilePreviewService(size).generate_preview(f, content_type)
+
+
+RENDERERS = {'legacy': legacy_preview, 'fast': fast_preview}
+
+
+def _measure(conn, renderer, path, content_type, size, repeat):
+    # Runs in a fresh child so ru_maxrss is this renderer's peak alone
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        RENDERERS[renderer](path, content_type, size)
+        samples.append(time.perf_counter() - started)
+    conn.send((statistics.median(samples), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+    conn.close()
+
+
+def _idle(conn):
+    conn.send((0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+    conn.close()
+
+
+class Command(BaseCommand):
+    help = 'Measure ms per preview and peak RSS of the legacy and fast preview renderers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corpus', help='Directory of JPEG/PNG/GIF/PDF files; a synthetic corpus is generated if omitted'
+        )
+        parser.add_argument('--size', default='800x800', help='Target preview size, WxH')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        size = tuple(int(v) for v in options['size'].split('x'))
+        generated = None
+        corpus = options['corpus']
+        if not corpus:
+            corpus = generated = tempfile.mkdtemp()
+            self._generate_corpus(corpus)
+
+        try:
+            self._run(corpus, size, options['repeat'])
+        finally:
+            if generated:
+                shutil.rmtree(generated, ignore_errors=True)
+
+    def _run(self, corpus, size, repeat):
+        context = multiprocessing.get_context('fork')
+        _, baseline = self._child(context, _idle)
+        self.stdout.write(f'Baseline child RSS {baseline / 1024:.0f} MB, target {size[0]}x{size[1]}')
+        self.stdout.write(f"{'file':<28}{'MB':>7}{'renderer':>10}{'ms':>10}{'peak RSS MB':>13}")
+
+        for name in sorted(os.listdir(corpus)):
+            path = os.path.join(corpus, name)
+            content_type = mimetypes.guess_type(name)[0]
+            if content_type not in SUPPORTED or (content_type == 'application/pdf' and fitz is None):
+                continue
+            for renderer in RENDERERS:
+                seconds, rss = self._child(context, _measure, renderer, path, content_type, size, repeat)
+                self.stdout.write(
+                    f'{name[:27]:<28}{os.path.getsize(path) / 2 ** 20:>7.1f}{renderer:>10}'
+                    f'{seconds * 1000:>10.1f}{rss / 1024:>13.0f}'
+                )
+
+    @staticmethod
+    def _child(context, target, *args):
+        parent, child = context.Pipe()
+        process = context.Process(target=target, args=(child, *args))
+        process.start()
+        result = parent.recv()
+        process.join()
+        return result
+
+    def _generate_corpus(self, directory):
+        """Large scans and PDFs: a 24 MP JPEG, a 12 MP PNG, a GIF and an A4 PDF with a full-page scan."""
+        scan = Image.radial_gradient('L').resize((6000, 4000)).convert('RGB')
+        scan.paste((240, 235, 220), (300, 300, 5700, 3700))
+        scan.save(os.path.join(directory, 'scan-24mp.jpg'), quality=90)
+        scan.resize((4000, 3000)).save(os.path.join(directory, 'scan-12mp.png'))
+        scan.resize((2000, 1500)).convert('P').save(os.path.join(directory, 'diagram.gif'))
+
+        if fitz is not None:
+            page_scan = BytesIO()
+            scan.resize((2480, 3508)).save(page_scan, format='JPEG', quality=85)
+            document = fitz.open()
+            for _ in range(3):
+                page = document.new_page(width=595, height=842)
+                page.insert_image(page.rect, stream=page_scan.getvalue())
+                page.insert_text((72, 72), 'Scanned document', fontsize=24)
+            document.save(os.path.join(directory, 'scanned-a4.pdf'))
@@ -0,0 +1,140 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from ...deltas import map_cache
+from ...models import File, FileVersion
+from ...services import VersionControlService
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare storage and restore latency of full-copy, chunked and delta file versions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=16, help='File size in MB')
+        parser.add_argument('--versions', type=int, default=20)
+        parser.add_argument('--edits', type=int, default=5, help='Small edits per version')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed restores per measurement')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        contents = [rng.randbytes(options['size'] * 1024 * 1024)]
+        for _ in range(options['versions'] - 1):
+            contents.append(self._edit(rng, contents[-1], options['edits']))
+        logical = sum(map(len, contents))
+        self.stdout.write(
+            f"{len(contents)} versions of {options['size']} MB, {options['edits']} edits each"
+        )
+
+        root = tempfile.mkdtemp()
+        try:
+            rows = [self._full_copies(root, contents, options['repeat'])]
+            for mode in ('chunked', 'delta'):
+                rows.append(self._versions(root, mode, contents, options['repeat']))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+        self.stdout.write(f"{'mode':<10}{'stored MB':>12}{'ratio':>8}{'save s':>9}"
+                          f"{'latest ms':>12}{'cold ms':>10}{'oldest ms':>12}")
+        for mode, stored, save, latest, cold, oldest in rows:
+            self.stdout.write(
+                f'{mode:<10}{stored / 2 ** 20:>12.1f}{stored / logical:>8.3f}{save:>9.2f}'
+                f'{latest * 1000:>12.1f}{cold * 1000:>10.1f}{oldest * 1000:>12.1f}'
+            )
+
+    @staticmethod
+    def _edit(rng, data, edits):
+        data = bytearray(data)
+        for _ in range(edits):
+            at = rng.randrange(len(data))
+            if rng.random() < 0.5:
+                data[at:at + 64] = rng.randbytes(64)
+            else:
+                data[at:at] = rng.randbytes(rng.randrange(1, 512))
+        return bytes(data)
+
+    @staticmethod
+    def _time(fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+        return statistics.median(samples)
+
+    def _full_copies(self, root, contents, repeat):
+        directory = os.path.join(root, 'full')
+        os.makedirs(directory)
+        started = time.perf_counter()
+        paths = []
+        for number, content in enumerate(contents, 1):
+            paths.append(os.path.join(directory, f'v{number}'))
+            with open(paths[-1], 'wb') as f:
+                f.write(content)
+        save = time.perf_counter() - started
+
+        def read(path):
+            with open(path, 'rb') as f:
+                while f.read(256 * 1024):
+                    pass
+
+        latest = self._time(lambda: read(paths[-1]), repeat)
+        oldest = self._time(lambda: read(paths[0]), repeat)
+        return 'full', self._disk_usage(directory), save, latest, latest, oldest
+
+    def _versions(self, root, mode, contents, repeat):
+        chunk_root = os.path.join(root, mode)
+        result = None
+        with override_settings(VERSION_CHUNK_ROOT=chunk_root):
+            try:
+                # Nothing the benchmark writes to the database is kept
+                with transaction.atomic():
+                    user = get_user_model().objects.create_user(username=f'benchmark-{mode}')
+                    file = File.objects.create(name='benchmark.bin', owner=user)
+                    started = time.perf_counter()
+                    versions = []
+                    for number, content in enumerate(contents, 1):
+                        version = FileVersion(file=file, version_number=number)
+                        VersionControlService.save_version(
+                            ContentFile(content, name='benchmark.bin'), version, delta=mode == 'delta'
+                        )
+                        versions.append(version)
+                    save = time.perf_counter() - started
+
+                    def read(version):
+                        for _ in VersionControlService.read_version(version):
+                            pass
+
+                    def cold_read():
+                        map_cache.clear()
+                        read(versions[-1])
+
+                    assert b''.join(VersionControlService.read_version(versions[-1])) == contents[-1]
+                    latest = self._time(lambda: read(versions[-1]), repeat)
+                    cold = self._time(cold_read, repeat)
+                    oldest = self._time(lambda: read(versions[0]), repeat)
+                    result = (mode, self._disk_usage(chunk_root), save, latest, cold, oldest)
+                    raise Rollback
+            except Rollback:
+                pass
+        return result
+
+    @staticmethod
+    def _disk_usage(directory):
+        return sum(
+            os.path.getsize(os.path.join(path, name))
+            for path, _, names in os.walk(directory)
+            for name in names
+        )
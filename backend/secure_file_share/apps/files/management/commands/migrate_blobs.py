@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand
+from ...models import File
+from ...storage import get_blob_store
+
+
+class Command(BaseCommand):
+    help = 'Move ciphertext from the legacy File.encrypted_file column into the blob store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches to limit load on the database'
+        )
+
+    def handle(self, *args, **options):
+        store = get_blob_store()
+        pending = File.objects.filter(blob_ref__isnull=True, encrypted_file__isnull=False)
+        migrated = 0
+        last_pk = None
+
+        while True:
+            # Walk the primary key in short batches; each row is copied and
+            # updated in its own statement so no long-lived lock is held.
+            batch = pending.order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            pks = list(batch.values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+
+            for pk in pks:
+                data = File.objects.filter(pk=pk).values_list('encrypted_file', flat=True).first()
+                if data is None:
+                    continue
+                blob = store.save([bytes(data)])
+                migrated += File.objects.filter(pk=pk, blob_ref__isnull=True).update(
+                    blob_ref=blob.ref,
+                    blob_size=blob.size,
+                    blob_digest=blob.digest,
+                    encrypted_file=None,
+                )
+
+            last_pk = pks[-1]
+            self.stdout.write(f'Migrated {migrated} files')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Done, {migrated} files moved to the blob store'))
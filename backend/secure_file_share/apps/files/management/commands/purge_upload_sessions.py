@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from ...uploads import purge_stale_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable upload sessions (and their staging files) that have gone stale'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=None,
+            help='Seconds since the last chunk (defaults to UPLOAD_SESSION_TTL)'
+        )
+
+    def handle(self, *args, **options):
+        purged = purge_stale_sessions(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} upload sessions'))
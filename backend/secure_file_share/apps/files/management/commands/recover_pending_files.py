@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from ...workers import recover_pending_files
+
+
+class Command(BaseCommand):
+    help = 'Encrypt or fail uploads left PENDING by a worker that died, and remove orphaned staged uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=None,
+            help='Seconds a file must have been PENDING (defaults to ASYNC_PENDING_TIMEOUT)'
+        )
+
+    def handle(self, *args, **options):
+        recovered, failed, removed = recover_pending_files(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Recovered {recovered} pending files, failed {failed}, removed {removed} orphaned staged uploads'
+        ))
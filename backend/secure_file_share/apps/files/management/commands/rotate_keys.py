@@ -0,0 +1,49 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ...rotation import WRAPPED_KEY_TABLES, rotate_keys, stale_rows
+
+
+class Command(BaseCommand):
+    help = 'Re-wrap per-file data keys with the current key-encryption key, without touching any blob'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches to limit load on the database'
+        )
+        parser.add_argument(
+            '--kek-version', type=int, default=None,
+            help='KEK to wrap with (defaults to ENCRYPTION_KEK_VERSION)'
+        )
+        parser.add_argument(
+            '--convert-legacy', action='store_true',
+            help='Also give files keyed from a salt (key versions 1 and 2) wrapped data keys'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many keys are stale')
+
+    def handle(self, *args, **options):
+        kek_version = options['kek_version'] or settings.ENCRYPTION_KEK_VERSION
+        if kek_version not in settings.ENCRYPTION_KEKS:
+            raise CommandError(f'KEK version {kek_version} is not configured in ENCRYPTION_KEKS')
+
+        if options['dry_run']:
+            for model, _ in WRAPPED_KEY_TABLES:
+                stale = stale_rows(model, kek_version, options['convert_legacy']).count()
+                self.stdout.write(f'{model.__name__}: {stale} keys to re-wrap')
+            return
+
+        totals = {}
+        for model, rotated in rotate_keys(kek_version, options['batch_size'], options['convert_legacy']):
+            totals[model.__name__] = rotated
+            self.stdout.write(f'{model.__name__}: re-wrapped {rotated}')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        summary = ', '.join(f'{name} {count}' for name, count in totals.items()) or 'nothing to do'
+        self.stdout.write(self.style.SUCCESS(f'Done, keys now under KEK {kek_version}: {summary}'))
+        self.stdout.write(
+            'KEK 1 (ENCRYPTION_MASTER_KEY) can never be retired: version chunk and convergent '
+            'tenant keys are derived from it'
+        )
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from ...outbox import deliver_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send the queued notification emails that are due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Messages per connection')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = deliver_outbox(options['batch_size'])
+            if not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails'))
+                return
+            if sent:
+                self.stdout.write(f'Sent {sent} emails')
+            time.sleep(options['interval'])
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0001_initial'),
+    ]
+
+    operations = [
+        # Existing rows were encrypted with per-request PBKDF2 keys (version 1)
+        migrations.AddField(
+            model_name='file',
+            name='key_version',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='key_version',
+            field=models.PositiveSmallIntegerField(default=2),
+        ),
+    ]
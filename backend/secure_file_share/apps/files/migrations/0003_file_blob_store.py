@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_file_key_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='blob_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='blob_ref',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='blob_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
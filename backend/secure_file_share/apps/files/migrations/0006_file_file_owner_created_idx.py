@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0005_file_size_content_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['owner', '-created_at', '-id'], name='file_owner_created_idx'),
+        ),
+    ]
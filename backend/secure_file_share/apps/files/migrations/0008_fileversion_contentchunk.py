@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 14:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_file_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentChunk',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.PositiveIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FileVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version_number', models.PositiveIntegerField()),
+                ('file_path', models.CharField(blank=True, max_length=500)),
+                ('manifest', models.BinaryField(null=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='files.file')),
+            ],
+            options={
+                'ordering': ['-version_number'],
+                'unique_together': {('file', 'version_number')},
+            },
+        ),
+    ]
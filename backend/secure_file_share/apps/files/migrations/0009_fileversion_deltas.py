@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-18 14:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0008_fileversion_contentchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileversion',
+            name='base',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='deltas', to='files.fileversion'),
+        ),
+        migrations.AddField(
+            model_name='fileversion',
+            name='chain_depth',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
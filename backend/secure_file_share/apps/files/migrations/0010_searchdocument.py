@@ -0,0 +1,110 @@
+# Generated by Django 4.2 on 2026-10-18 14:50
+
+from django.conf import settings
+from django.db import DatabaseError, migrations, models, transaction
+import django.db.models.deletion
+
+SQLITE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE files_search_fts USING fts5(
+        name, body, owner_id,
+        content='files_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER files_search_ai AFTER INSERT ON files_searchdocument BEGIN
+        INSERT INTO files_search_fts(rowid, name, body, owner_id)
+        VALUES (new.id, new.name, new.body, new.owner_id);
+    END
+    """,
+    """
+    CREATE TRIGGER files_search_ad AFTER DELETE ON files_searchdocument BEGIN
+        INSERT INTO files_search_fts(files_search_fts, rowid, name, body, owner_id)
+        VALUES ('delete', old.id, old.name, old.body, old.owner_id);
+    END
+    """,
+    """
+    CREATE TRIGGER files_search_au AFTER UPDATE ON files_searchdocument BEGIN
+        INSERT INTO files_search_fts(files_search_fts, rowid, name, body, owner_id)
+        VALUES ('delete', old.id, old.name, old.body, old.owner_id);
+        INSERT INTO files_search_fts(rowid, name, body, owner_id)
+        VALUES (new.id, new.name, new.body, new.owner_id);
+    END
+    """,
+]
+
+POSTGRES_INDEX = [
+    """
+    CREATE INDEX files_search_tsv_idx ON files_searchdocument
+    USING gin (to_tsvector('simple', name || ' ' || body))
+    """,
+]
+
+POSTGRES_TRIGRAM_INDEX = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX files_search_name_trgm_idx ON files_searchdocument USING gin (name gin_trgm_ops)',
+]
+
+
+def create_search_index(apps, schema_editor):
+    # Note: SQLite drops the triggers if a later migration rebuilds
+    # files_searchdocument; recreate them there.
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                for statement in SQLITE_INDEX:
+                    cursor.execute(statement)
+        except DatabaseError:
+            pass  # SQLite without FTS5, search.py falls back to plain lookups
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for statement in POSTGRES_INDEX:
+                cursor.execute(statement)
+        try:
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                for statement in POSTGRES_TRIGRAM_INDEX:
+                    cursor.execute(statement)
+        except DatabaseError:
+            pass  # pg_trgm unavailable, names are matched by tsvector only
+
+    File = apps.get_model('files', 'File')
+    SearchDocument = apps.get_model('files', 'SearchDocument')
+    SearchDocument.objects.bulk_create(
+        SearchDocument(file_id=pk, owner_id=owner_id, name=name)
+        for pk, owner_id, name in File.objects.values_list('pk', 'owner_id', 'name').iterator()
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('DROP TABLE IF EXISTS files_search_fts')
+        elif connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS files_search_tsv_idx')
+            cursor.execute('DROP INDEX IF EXISTS files_search_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('files', '0009_fileversion_deltas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='files.file')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
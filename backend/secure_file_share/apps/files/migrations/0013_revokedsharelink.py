@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0012_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedShareLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('link_id', models.CharField(max_length=16, unique=True)),
+                ('expires', models.BigIntegerField()),
+                ('revoked_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
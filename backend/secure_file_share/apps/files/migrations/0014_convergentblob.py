@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 15:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0013_revokedsharelink'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConvergentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant', models.CharField(max_length=64)),
+                ('locator', models.CharField(max_length=64)),
+                ('blob_ref', models.CharField(max_length=255)),
+                ('blob_size', models.BigIntegerField()),
+                ('blob_digest', models.CharField(max_length=64)),
+                ('wrapped_key', models.BinaryField()),
+                ('size', models.BigIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('tenant', 'locator')},
+            },
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='convergent_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='files', to='files.convergentblob'),
+        ),
+    ]
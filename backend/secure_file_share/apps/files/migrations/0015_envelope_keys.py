@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0014_convergentblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='convergentblob',
+            name='kek_version',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='kek_version',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='kek_version',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='key_version',
+            field=models.PositiveSmallIntegerField(default=4),
+        ),
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='key_version',
+            field=models.PositiveSmallIntegerField(default=4),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0015_envelope_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='content_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['owner', 'content_digest'], name='file_owner_digest_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 15:28
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0016_file_content_digest'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='uploadsession',
+            name='chain_digest',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 15:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0017_remove_uploadsession_chain_digest'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='file',
+            name='file',
+        ),
+    ]
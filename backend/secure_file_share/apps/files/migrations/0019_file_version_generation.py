@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0018_remove_file_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='version_generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
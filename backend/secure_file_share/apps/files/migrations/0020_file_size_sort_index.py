@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 16:07
+
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0019_file_version_generation'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='file',
+            name='file_owner_size_idx',
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(models.F('owner'), django.db.models.functions.comparison.Coalesce(models.F('size'), models.Value(-1)), models.F('id'), name='file_owner_size_idx'),
+        ),
+    ]
@@ -1,13 +1,41 @@
 import uuid
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
+from .keys import CURRENT_KEY_VERSION
+from .storage import get_blob_store
 
 class File(models.Model):
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),  # Queued for background encryption
+        ('READY', 'Ready'),
+        ('FAILED', 'Failed'),
+    )
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255)
-    file = models.FileField(upload_to='uploads/')
-    encrypted_file = models.BinaryField(null=True)  # For storing encrypted file content
+    encrypted_file = models.BinaryField(null=True)  # Legacy inline ciphertext, see migrate_blobs
+    blob_ref = models.CharField(max_length=255, null=True, blank=True)  # Ciphertext location in the blob store
+    blob_size = models.BigIntegerField(null=True, blank=True)
+    blob_digest = models.CharField(max_length=64, null=True, blank=True)  # SHA-256 of the ciphertext
+    content_digest = models.CharField(max_length=64, null=True, blank=True)  # SHA-256 of the plaintext
+    size = models.BigIntegerField(null=True, blank=True)  # Plaintext size in bytes
+    content_type = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='READY')
     encryption_salt = models.BinaryField(null=True)  # For storing the salt used in encryption
+    key_version = models.PositiveSmallIntegerField(default=CURRENT_KEY_VERSION)  # How the key is derived from the salt
+    kek_version = models.PositiveSmallIntegerField(null=True, blank=True)  # KEK of a wrapped key in encryption_salt
+    version_generation = models.PositiveIntegerField(default=0)  # Bumped when versions are rebased, see deltas.py
+    # Shared ciphertext of a convergently encrypted file (see convergent.py)
+    convergent_blob = models.ForeignKey(
+        'ConvergentBlob',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='files'
+    )
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -16,8 +44,209 @@ class File(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        app_label = 'files'
+        indexes = [
+            # Keyset pagination of an owner's files (see pagination.py)
+            models.Index(fields=['owner', '-created_at', '-id'], name='file_owner_created_idx'),
+            # Whitelisted sort keys (see FileSearchService.SORT_KEYS)
+            models.Index(fields=['owner', 'name', 'id'], name='file_owner_name_idx'),
+            models.Index(
+                # Unknown sizes sort as -1 (see FileSearchService.SORT_ANNOTATIONS)
+                F('owner'), Coalesce(F('size'), Value(-1)), F('id'),
+                name='file_owner_size_idx'
+            ),
+            # Covers the facet aggregate, so counting never reads the table
+            models.Index(fields=['owner', 'content_type', 'size', 'created_at'], name='file_owner_facet_idx'),
+            # Upload preflight: which of these contents does the owner already have?
+            models.Index(fields=['owner', 'content_digest'], name='file_owner_digest_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def has_content(self):
+        return bool(self.blob_ref) or self.encrypted_file is not None
+
+    def encrypted_chunks(self):
+        """Yield the stored ciphertext, from the blob store or the legacy column."""
+        if self.blob_ref:
+            yield from get_blob_store().read_chunks(self.blob_ref)
+        elif self.encrypted_file is not None:
+            yield bytes(self.encrypted_file) 
+
+class ConvergentBlob(models.Model):
+    """
+    Ciphertext shared by every file in a tenant with the same content.
+
+    The content key is a keyed hash of the plaintext, so identical uploads
+    encrypt to the same blob; `refcount` counts the files referencing it.
+    """
+    tenant = models.CharField(max_length=64)
+    locator = models.CharField(max_length=64)  # SHA-256 of the content key, never the key itself
+    blob_ref = models.CharField(max_length=255)
+    blob_size = models.BigIntegerField()
+    blob_digest = models.CharField(max_length=64)
+    wrapped_key = models.BinaryField()  # Content key encrypted with a KEK (see keys.wrap_key)
+    kek_version = models.PositiveSmallIntegerField(null=True, blank=True)
+    size = models.BigIntegerField()  # Plaintext size in bytes
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'files'
+        unique_together = ('tenant', 'locator')
+
+    def __str__(self):
+        return f"{self.tenant}/{self.locator}"
+
+
+class UploadSession(models.Model):
+    """A resumable upload; see uploads.py for the protocol."""
+    STATUS_CHOICES = (
+        ('ACTIVE', 'Active'),
+        ('COMPLETE', 'Complete'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=255, blank=True)
+    total_size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)  # Next expected plaintext offset
+    segments_written = models.BigIntegerField(default=0)  # Sealed segments in the staging file
+    stream_header = models.BinaryField()
+    encryption_salt = models.BinaryField()
+    key_version = models.PositiveSmallIntegerField(default=CURRENT_KEY_VERSION)
+    kek_version = models.PositiveSmallIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ACTIVE')
+    file = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'files'
+        indexes = [models.Index(fields=['updated_at'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.received}/{self.total_size})"
+
+class FileVersion(models.Model):
+    """
+    A saved version of a file.
+
+    Content is stored as a manifest of content-defined chunks (see
+    chunking.py), or as a delta against `base` (see deltas.py); `file_path`
+    is only set for versions saved as full copies.
+    """
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='versions')
+    version_number = models.PositiveIntegerField()
+    file_path = models.CharField(max_length=500, blank=True)
+    manifest = models.BinaryField(null=True)  # Packed (digest, size) chunk entries
+    base = models.ForeignKey(
+        'self',
+        on_delete=models.RESTRICT,
+        null=True,
+        blank=True,
+        related_name='deltas'
+    )  # Set when the manifest holds a delta against this version, see deltas.py
+    chain_depth = models.PositiveSmallIntegerField(default=0)  # Deltas back to the keyframe
+    size = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'files'
+        unique_together = ('file', 'version_number')
+        ordering = ['-version_number']
+
+    def __str__(self):
+        return f"{self.file.name} v{self.version_number}"
+
+
+class ContentChunk(models.Model):
+    """A unique chunk of version content, shared by every manifest that lists it."""
+    digest = models.CharField(max_length=64, primary_key=True)  # HMAC of the chunk under its owner's key
+    size = models.PositiveIntegerField()
+    refcount = models.PositiveIntegerField(default=0)  # Number of versions referencing it
+
+    class Meta:
+        app_label = 'files'
+
+    def __str__(self):
+        return self.digest
+
+
+class SearchDocument(models.Model):
+    """
+    The searchable text of a file, kept in a per-owner full-text index.
+
+    Rows are maintained by search.py; the index itself is an FTS5 table
+    kept in sync by triggers on SQLite and GIN indexes on PostgreSQL (see
+    migration 0010).
+    """
+    file = models.OneToOneField(File, on_delete=models.CASCADE, related_name='search_document')
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    name = models.CharField(max_length=255)
+    body = models.TextField(blank=True)  # Text extracted from the content
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'files'
+
+    def __str__(self):
+        return self.name
+
+
+class OutboundEmail(models.Model):
+    """
+    A queued notification email.
+
+    Rows are written in the request's transaction and delivered by the
+    outbox worker (see outbox.py), which renders the template at send time.
+    """
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('SENDING', 'Sending'),  # Claimed by a worker until `next_attempt_at`
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),  # Gave up after EMAIL_OUTBOX_MAX_ATTEMPTS
+    )
+
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    template = models.CharField(max_length=255)
+    context = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.UUIDField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'files'
+        indexes = [
+            # The worker's scan for due messages
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.to}"
+
+
+class RevokedShareLink(models.Model):
+    """A share link revoked before it expired; kept until it would have expired (see links.py)."""
+    link_id = models.CharField(max_length=16, unique=True)  # Hex id embedded in the token
+    expires = models.BigIntegerField()  # Unix time the link expires
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
     class Meta:
         app_label = 'files'
 
     def __str__(self):
-        return self.name 
\ No newline at end of file
+        return self.link_id
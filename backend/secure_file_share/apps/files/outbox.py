@@ -0,0 +1,139 @@
+"""
+Transactional email outbox.
+
+Notifications are queued as OutboundEmail rows inside the caller's
+transaction, so an HTTP request only pays for one INSERT however many
+recipients there are. `deliver_outbox()` claims due rows in batches,
+renders them from compiled templates cached per process and sends each
+batch over a single connection. Failed messages are retried with
+exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS, then marked FAILED.
+
+Committing queued mail schedules a drain on the mail pool; `manage.py
+send_outbox` drains from cron or a dedicated process as well.
+"""
+import functools
+import logging
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.html import strip_tags
+from .models import OutboundEmail
+from .workers import PoolSaturated, get_mail_pool
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _template(name):
+    # Parsed once per process, then reused for every message
+    return get_template(name)
+
+
+def render_email(template, context):
+    """Return the `(text, html)` bodies of a message."""
+    html = _template(template).render(context)
+    return strip_tags(html), html
+
+
+def queue_emails(emails):
+    """Save unsaved OutboundEmail rows in one INSERT; delivery starts once the transaction commits."""
+    emails = OutboundEmail.objects.bulk_create(emails)
+    if emails and settings.EMAIL_OUTBOX_AUTOSEND:
+        transaction.on_commit(schedule_delivery)
+    return emails
+
+
+def schedule_delivery():
+    try:
+        get_mail_pool().submit(deliver_outbox)
+    except PoolSaturated:
+        # A drain is already queued and picks these up
+        pass
+
+
+def retry_delay(attempts):
+    delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_DELAY))
+
+
+def claim_due(limit):
+    """
+    Claim up to `limit` due messages for this worker.
+
+    A claim lasts EMAIL_OUTBOX_LEASE seconds, after which messages left in
+    SENDING by a crashed worker are due again.
+    """
+    now = timezone.now()
+    due = OutboundEmail.objects.filter(status__in=('PENDING', 'SENDING'), next_attempt_at__lte=now)
+    ids = list(due.order_by('next_attempt_at', 'pk').values_list('pk', flat=True)[:limit])
+    if not ids:
+        return []
+    token = uuid.uuid4()
+    # Only rows still due are claimed, so concurrent workers never share one
+    due.filter(pk__in=ids).update(
+        status='SENDING',
+        claim=token,
+        next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE),
+    )
+    return list(OutboundEmail.objects.filter(pk__in=ids, claim=token).order_by('pk'))
+
+
+def _message(email, connection):
+    text, html = render_email(email.template, email.context)
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=text,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[email.to],
+        connection=connection,
+    )
+    message.attach_alternative(html, 'text/html')
+    return message
+
+
+def send_batch(emails):
+    """Send claimed messages over one connection; returns how many were sent."""
+    sent, failed = [], []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        failed = [(email, e) for email in emails]
+    else:
+        try:
+            for email in emails:
+                try:
+                    connection.send_messages([_message(email, connection)])
+                    sent.append(email.pk)
+                except Exception as e:
+                    failed.append((email, e))
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    OutboundEmail.objects.filter(pk__in=sent).update(status='SENT', sent_at=now, claim=None)
+    for email, error in failed:
+        attempts = email.attempts + 1
+        if attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            logger.error('Giving up on email %s to %s: %s', email.pk, email.to, error)
+            changes = {'status': 'FAILED'}
+        else:
+            logger.warning('Email %s to %s failed, retrying: %s', email.pk, email.to, error)
+            changes = {'status': 'PENDING', 'next_attempt_at': now + retry_delay(attempts)}
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            attempts=attempts, last_error=str(error), claim=None, **changes
+        )
+    return len(sent)
+
+
+def deliver_outbox(batch_size=None):
+    """Send every due message; returns how many were sent."""
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    total = 0
+    while emails := claim_due(batch_size):
+        total += send_batch(emails)
+    return total
@@ -0,0 +1,174 @@
+import base64
+from collections import OrderedDict
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset pagination over `(ordering_field, pk)`, newest first.
+
+    Cursors carry the last seen key instead of an offset, so each page is a
+    single range scan on a composite index no matter how deep the client
+    has paged. `ordering_field` may be an annotation on the queryset. A view
+    may order by another indexed field by defining `get_keyset_ordering()`,
+    returning `(field, descending)`; cursors are bound to that field.
+    """
+    ordering_field = 'created_at'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'FILE_LIST_PAGE_SIZE', 50)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, view):
+        get_keyset_ordering = getattr(view, 'get_keyset_ordering', None)
+        if get_keyset_ordering is not None:
+            return get_keyset_ordering()
+        return self.ordering_field, True
+
+    def encode_cursor(self, direction, obj):
+        value = getattr(obj, self.field)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        raw = f'{direction}|{self.field}|{value}|{obj.pk}'.encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, encoded, queryset):
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode()
+            direction, field, rest = raw.split('|', 2)
+            value, pk = rest.rsplit('|', 1)
+            value = self.parse_value(queryset, field, value)
+            pk = queryset.model._meta.pk.to_python(pk)
+        except (ValueError, UnicodeDecodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('n', 'p') or field != self.field or value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return direction, value, pk
+
+    def parse_value(self, queryset, field, value):
+        try:
+            return queryset.model._meta.get_field(field).to_python(value)
+        except FieldDoesNotExist:
+            # Annotations such as `shared_at` or `sort_size`
+            if field not in queryset.query.annotations:
+                raise ValueError(f'Unknown cursor field: {field}')
+            return queryset.query.annotations[field].output_field.to_python(value)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        self.field, descending = self.get_ordering(view)
+        field = self.field
+        encoded = request.query_params.get(self.cursor_query_param)
+        direction, value, pk = self.decode_cursor(encoded, queryset) if encoded else ('n', None, None)
+
+        forward, backward = ('lt', 'gt') if descending else ('gt', 'lt')
+        ordering = (f'-{field}', '-pk') if descending else (field, 'pk')
+        if direction == 'n':
+            if value is not None:
+                queryset = queryset.filter(
+                    Q(**{f'{field}__{forward}': value}) | Q(**{field: value, f'pk__{forward}': pk})
+                )
+            queryset = queryset.order_by(*ordering)
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{field}__{backward}': value}) | Q(**{field: value, f'pk__{backward}': pk})
+            ).order_by(*(key[1:] if key.startswith('-') else f'-{key}' for key in ordering))
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if direction == 'p':
+            results.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if results:
+            if direction == 'p' or has_more:
+                self.next_cursor = self.encode_cursor('n', results[-1])
+            if (direction == 'n' and encoded) or (direction == 'p' and has_more):
+                self.previous_cursor = self.encode_cursor('p', results[0])
+        return results
+
+    def _link(self, cursor):
+        url = self.request.build_absolute_uri()
+        if cursor is None:
+            return None
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self._link(self.next_cursor)),
+            ('previous', self._link(self.previous_cursor)),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class FileCursorPagination(KeysetCursorPagination):
+    ordering_field = 'created_at'
+
+
+class SharedFileCursorPagination(KeysetCursorPagination):
+    # Files shared with the user are listed by when they were shared
+    ordering_field = 'shared_at'
+
+
+class SearchCursorPagination(KeysetCursorPagination):
+    """
+    Forward-only cursor over ranked search hits.
+
+    The cursor carries the `(score, document id)` of the last hit, which the
+    search backend turns into a keyset condition.
+    """
+
+    def encode_key(self, score, doc_id):
+        raw = f'{float(score)!r}|{doc_id}'.encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_key(self, encoded):
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode()
+            score, doc_id = raw.split('|')
+            return float(score), int(doc_id)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_search(self, fetch, request):
+        """`fetch(after, limit)` returns `(file_id, score, doc_id)` rows best first."""
+        self.request = request
+        page_size = self.get_page_size(request)
+        encoded = request.query_params.get(self.cursor_query_param)
+        rows = fetch(self.decode_key(encoded) if encoded else None, page_size + 1)
+
+        self.previous_cursor = None
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            _, score, doc_id = rows[-1]
+            self.next_cursor = self.encode_key(score, doc_id)
+        return rows
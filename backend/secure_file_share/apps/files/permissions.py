@@ -1,4 +1,9 @@
 from rest_framework import permissions
+from .access import get_access_resolver, is_owner
+
+def _shared_access(request, obj, download=False):
+    # One resolver per request instead of a query per object
+    return get_access_resolver(request).can_access(obj, download=download)
 
 class FilePermission(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -6,29 +11,23 @@ class FilePermission(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # Allow if user is owner
-        if obj.owner == request.user:
+        if is_owner(request.user, obj):
             return True
             
         # Check if user has shared access
         if hasattr(view, 'action') and view.action == 'download':
-            return obj.fileshare_set.filter(
-                shared_with=request.user,
-                expires_at__gt=timezone.now()
-            ).exists()
+            return _shared_access(request, obj, download=True)
             
         return False
 
 class IsOwnerOrShared(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         # Check if user is the owner
-        if obj.owner == request.user:
+        if is_owner(request.user, obj):
             return True
             
         # Check if file is shared with the user
         if request.method in permissions.SAFE_METHODS:
-            return obj.fileshare_set.filter(
-                shared_with=request.user,
-                expires_at__gt=timezone.now()
-            ).exists()
+            return _shared_access(request, obj)
             
-        return False 
\ No newline at end of file
+        return False
\ No newline at end of file
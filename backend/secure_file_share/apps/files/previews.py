@@ -0,0 +1,171 @@
+"""
+Background preview pipeline.
+
+Previews are rendered on a worker pool once a file is READY and stored
+encrypted with the file's key in PREVIEW_ROOT as
+`<digest[:2]>/<digest>-<preset>`, keyed by the blob digest and size preset.
+A stored derivative is always served instead of rendering again, and a
+render already queued in this process is not queued twice. Files the
+renderer can't handle get an empty `.none` marker so they aren't retried.
+"""
+import logging
+import os
+import tempfile
+import threading
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import quote_etag
+from .downloads import _etag_matches
+from .engine import StorageEngine
+from .keys import derive_file_key
+from .models import File
+from .services.preview import FilePreviewService
+from .utils import decrypt_stream, encrypt_stream
+from .workers import PoolSaturated, get_preview_pool
+
+logger = logging.getLogger(__name__)
+
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def preview_path(digest, preset):
+    return os.path.join(settings.PREVIEW_ROOT, digest[:2], f'{digest}-{preset}')
+
+
+def _marker_path(digest, preset):
+    return preview_path(digest, preset) + '.none'
+
+
+def preview_exists(file, preset):
+    return bool(file.blob_digest) and os.path.exists(preview_path(file.blob_digest, preset))
+
+
+def preview_unavailable(file, preset):
+    """True when the file can never have this preview."""
+    if not file.blob_digest or not FilePreviewService().supports(file.content_type):
+        return True
+    return os.path.exists(_marker_path(file.blob_digest, preset))
+
+
+def _write_atomic(path, chunks):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def plaintext_chunks(file, limit=None):
+    """
+    Decrypt a file's content; with `limit`, segmented payloads only have
+    the segments covering the first `limit` bytes read and decrypted.
+    """
+    engine = StorageEngine()
+    if limit:
+        size = engine.plaintext_size(file)
+        if size == 0:
+            return iter(())
+        if size is not None:
+            return engine.read(file, 0, min(limit, size) - 1)
+    return engine.read(file)
+
+
+def render_preview(file, preset):
+    """Render and store one preview of `file`; returns False if none can be made."""
+    digest = file.blob_digest
+    if os.path.exists(preview_path(digest, preset)):
+        return True
+
+    service = FilePreviewService(settings.PREVIEW_PRESETS[preset])
+    data = None
+    if service.is_text(file.content_type):
+        # Text previews decode straight from the stream and stop after a short prefix
+        data = service.generate_preview(
+            plaintext_chunks(file, service.TEXT_PREVIEW_BYTES), file.content_type
+        )
+    elif service.supports(file.content_type):
+        with tempfile.SpooledTemporaryFile(max_size=settings.PREVIEW_SPOOL_SIZE) as plain:
+            for chunk in plaintext_chunks(file):
+                plain.write(chunk)
+            plain.seek(0)
+            data = service.generate_preview(plain, file.content_type)
+
+    if data is None:
+        _write_atomic(_marker_path(digest, preset), [])
+        return False
+    key = derive_file_key(file.encryption_salt, file.key_version)
+    _write_atomic(preview_path(digest, preset), encrypt_stream([data], key))
+    return True
+
+
+def _render_job(file_id, preset, job):
+    try:
+        file = File.objects.filter(pk=file_id, status='READY').defer('encrypted_file').first()
+        if file is not None and file.blob_digest:
+            render_preview(file, preset)
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(job)
+
+
+def queue_previews(file, presets=None):
+    """Queue rendering of the missing previews of a READY file."""
+    if file.status != 'READY' or not file.blob_digest:
+        return
+    if not FilePreviewService().supports(file.content_type):
+        return
+    pool = get_preview_pool()
+    for preset in presets or settings.PREVIEW_PRESETS:
+        job = (file.blob_digest, preset)
+        if os.path.exists(preview_path(*job)) or os.path.exists(_marker_path(*job)):
+            continue
+        with _in_flight_lock:
+            if job in _in_flight:
+                continue
+            _in_flight.add(job)
+        try:
+            pool.submit(_render_job, file.pk, preset, job)
+        except PoolSaturated:
+            # Rendered on demand when the preview is first requested
+            with _in_flight_lock:
+                _in_flight.discard(job)
+            logger.info('Preview queue is full, skipping %s', job)
+
+
+def delete_previews(digest):
+    directory = os.path.join(settings.PREVIEW_ROOT, digest[:2])
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.startswith(f'{digest}-'):
+            os.remove(os.path.join(directory, name))
+
+
+def preview_response(request, file, preset):
+    """Serve a stored preview with long-lived private caching headers."""
+    etag = quote_etag(f'{file.blob_digest}-{preset}')
+    if _etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponse(status=304)
+    else:
+        key = derive_file_key(file.encryption_salt, file.key_version)
+
+        def read():
+            with open(preview_path(file.blob_digest, preset), 'rb') as f:
+                while chunk := f.read(64 * 1024):
+                    yield chunk
+
+        response = StreamingHttpResponse(
+            decrypt_stream(read(), key),
+            content_type=FilePreviewService.preview_content_type(file.content_type)
+        )
+    response['ETag'] = etag
+    # The derivative only changes with the content, which changes the ETag
+    response['Cache-Control'] = f'private, max-age={settings.PREVIEW_CACHE_MAX_AGE}, immutable'
+    return response
@@ -0,0 +1,85 @@
+"""
+Re-wrapping of data keys after a key-encryption key (KEK) rotation.
+
+Only the wrapped key records change; blobs are never read or rewritten, so
+rotating costs one short UPDATE per batch of rows. Each table is walked by
+primary key and every batch commits on its own. Rows already under the
+target KEK are left out of the walk, so an interrupted rotation carries on
+where it stopped when it is run again.
+
+Files still keyed from a salt (key versions 1 and 2) can be converted to
+wrapped data keys on the way, after which SECRET_KEY no longer protects
+their content.
+
+Keys derived from the master key with `derive_subkey` (per-owner version
+chunk keys, per-tenant convergent keys) are not wrapped and never rotate,
+so ENCRYPTION_MASTER_KEY, which is also KEK 1, must stay configured.
+"""
+from django.db import transaction
+from .keys import (
+    KEY_VERSION_ENVELOPE, WRAPPED_KEY_VERSIONS, current_kek_version, derive_file_key, rewrap_key, wrap_key
+)
+from .models import ConvergentBlob, File, UploadSession
+
+# (model, field holding the wrapped record)
+WRAPPED_KEY_TABLES = (
+    (File, 'encryption_salt'),
+    (ConvergentBlob, 'wrapped_key'),
+    (UploadSession, 'encryption_salt'),
+)
+
+
+def stale_rows(model, kek_version=None, legacy=False):
+    """Rows of `model` whose key isn't wrapped with `kek_version` (the current KEK by default)."""
+    rows = model.objects.exclude(kek_version=kek_version or current_kek_version())
+    if model is ConvergentBlob:
+        return rows
+    if legacy:
+        return rows.filter(encryption_salt__isnull=False)
+    return rows.filter(key_version__in=WRAPPED_KEY_VERSIONS)
+
+
+def _rewrap(row, field, kek_version):
+    record = bytes(getattr(row, field))
+    key_version = getattr(row, 'key_version', None)
+    if key_version is not None and key_version not in WRAPPED_KEY_VERSIONS:
+        # Same key, now stored wrapped instead of derived from the salt
+        record = wrap_key(derive_file_key(record, key_version), kek_version)
+        row.key_version = KEY_VERSION_ENVELOPE
+    else:
+        record = rewrap_key(record, kek_version)
+    setattr(row, field, record)
+    row.kek_version = kek_version
+
+
+def rewrap_batch(model, field, pks, kek_version):
+    """Re-wrap the keys of rows `pks` under `kek_version`; returns how many changed."""
+    fields = [field, 'kek_version'] + (['key_version'] if model is not ConvergentBlob else [])
+    with transaction.atomic():
+        rows = list(model.objects.select_for_update().filter(pk__in=pks).only('pk', *fields))
+        for row in rows:
+            _rewrap(row, field, kek_version)
+        model.objects.bulk_update(rows, fields)
+    return len(rows)
+
+
+def rotate_keys(kek_version=None, batch_size=1000, legacy=False):
+    """
+    Re-wrap every stale key record under `kek_version`.
+
+    Yields `(model, rotated)` after each batch, `rotated` being the running
+    total for that table.
+    """
+    kek_version = kek_version or current_kek_version()
+    for model, field in WRAPPED_KEY_TABLES:
+        stale = stale_rows(model, kek_version, legacy).order_by('pk')
+        rotated = 0
+        last_pk = None
+        while True:
+            batch = stale if last_pk is None else stale.filter(pk__gt=last_pk)
+            pks = list(batch.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            rotated += rewrap_batch(model, field, pks, kek_version)
+            last_pk = pks[-1]
+            yield model, rotated
@@ -0,0 +1,229 @@
+"""
+Full-text search over file names and extracted content.
+
+Every file has a SearchDocument holding its name and, for text (and, with
+PyMuPDF, PDF) files, a bounded prefix of its text. The database indexes
+those rows: an FTS5 table on SQLite, GIN tsvector/trigram indexes on
+PostgreSQL, plain lookups elsewhere. Names are re-indexed whenever a File
+is saved; content is extracted in the background once the file is READY.
+
+`search()` returns `(file_id, score, doc_id)` rows, best first, scoped to one
+owner and paged by a keyset on `(score, document id)`. `matching_documents()`
+returns every match, unranked, as a queryset that other queries can filter
+on as a subquery.
+"""
+import codecs
+import logging
+import re
+import tempfile
+import uuid
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from .models import File, SearchDocument
+from .previews import plaintext_chunks
+from .services.preview import FilePreviewService, detect_encoding, fitz
+from .workers import PoolSaturated, get_preview_pool
+
+logger = logging.getLogger(__name__)
+
+TERM_RE = re.compile(r'\w+')
+
+
+def search_terms(query, limit=16):
+    return TERM_RE.findall(query.lower())[:limit]
+
+
+class SearchBackend:
+    def search(self, owner_id, terms, after=None, limit=50):
+        """Return up to `limit` `(file_id, score, doc_id)` rows after the `(score, doc_id)` key."""
+        raise NotImplementedError
+
+    def matches(self, owner_id, terms):
+        """Every SearchDocument of the owner matching all `terms`, as an unevaluated queryset."""
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(SearchBackend):
+    # Matches in the name weigh ten times as much as matches in the content
+    SCORE = '-bm25(files_search_fts, 10.0, 1.0, 0.0)'
+
+    def _match(self, owner_id, terms):
+        # Every term as a quoted prefix, so user input can't inject FTS syntax
+        return 'owner_id : "{}" AND {{name body}} : ({})'.format(
+            int(owner_id), ' AND '.join(f'"{term}"*' for term in terms)
+        )
+
+    def search(self, owner_id, terms, after=None, limit=50):
+        match = self._match(owner_id, terms)
+        sql = (
+            f'SELECT d.file_id, {self.SCORE} AS score, d.id FROM files_search_fts '
+            'JOIN files_searchdocument d ON d.id = files_search_fts.rowid '
+            'WHERE files_search_fts MATCH %s'
+        )
+        params = [match]
+        if after is not None:
+            sql += f' AND ({self.SCORE} < %s OR ({self.SCORE} = %s AND d.id > %s))'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score DESC, d.id LIMIT %s'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit])
+            return cursor.fetchall()
+
+    def matches(self, owner_id, terms):
+        return SearchDocument.objects.filter(id__in=RawSQL(
+            'SELECT rowid FROM files_search_fts WHERE files_search_fts MATCH %s', [self._match(owner_id, terms)]
+        ))
+
+
+class PostgresSearchBackend(SearchBackend):
+    VECTOR = "to_tsvector('simple', name || ' ' || body)"
+
+    def __init__(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            self.trigram = cursor.fetchone() is not None
+
+    def _match(self, terms):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        match = f"{self.VECTOR} @@ to_tsquery('simple', %s)"
+        if self.trigram:
+            return f'({match} OR name %% %s)', [tsquery, ' '.join(terms)]
+        return match, [tsquery]
+
+    def search(self, owner_id, terms, after=None, limit=50):
+        score = f"ts_rank({self.VECTOR}, to_tsquery('simple', %s))"
+        score_params = [' & '.join(f'{term}:*' for term in terms)]
+        if self.trigram:
+            score = f'({score} + similarity(name, %s))'
+            score_params.append(' '.join(terms))
+        match, match_params = self._match(terms)
+
+        sql = f'SELECT file_id, {score} AS score, id FROM files_searchdocument WHERE owner_id = %s AND {match}'
+        params = score_params + [owner_id] + match_params
+        if after is not None:
+            sql += f' AND ({score} < %s OR ({score} = %s AND id > %s))'
+            params += score_params + [after[0]] + score_params + [after[0], after[1]]
+        sql += ' ORDER BY score DESC, id LIMIT %s'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit])
+            return cursor.fetchall()
+
+    def matches(self, owner_id, terms):
+        match, match_params = self._match(terms)
+        return SearchDocument.objects.filter(id__in=RawSQL(
+            f'SELECT id FROM files_searchdocument WHERE owner_id = %s AND {match}', [owner_id] + match_params
+        ))
+
+
+class FallbackSearchBackend(SearchBackend):
+    """Unindexed lookups for databases without full-text support; names score 1, content 0."""
+
+    def matches(self, owner_id, terms):
+        documents = SearchDocument.objects.filter(owner_id=owner_id)
+        for term in terms:
+            documents = documents.filter(Q(name__icontains=term) | Q(body__icontains=term))
+        return documents
+
+    def search(self, owner_id, terms, after=None, limit=50):
+        in_name = Q()
+        for term in terms:
+            in_name &= Q(name__icontains=term)
+        documents = self.matches(owner_id, terms).annotate(
+            score=Case(When(in_name, then=Value(1)), default=Value(0), output_field=IntegerField())
+        )
+        if after is not None:
+            documents = documents.filter(Q(score__lt=after[0]) | Q(score=after[0], id__gt=after[1]))
+        return list(documents.order_by('-score', 'id').values_list('file_id', 'score', 'id')[:limit])
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        if connection.vendor == 'sqlite' and 'files_search_fts' in connection.introspection.table_names():
+            _backend = SQLiteFTSBackend()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        else:
+            _backend = FallbackSearchBackend()
+    return _backend
+
+
+def search(owner, query, after=None, limit=50):
+    """Ranked `(file_id, score, doc_id)` hits for `query` among `owner`'s files."""
+    terms = search_terms(query)
+    if not terms:
+        return []
+    rows = get_search_backend().search(owner.pk, terms, after=after, limit=limit)
+    # SQLite hands UUIDs back as hex strings
+    return [(uuid.UUID(str(file_id)), score, doc_id) for file_id, score, doc_id in rows]
+
+
+def matching_documents(owner, query):
+    """All of `owner`'s SearchDocuments matching `query`, unranked and unevaluated."""
+    terms = search_terms(query)
+    if not terms:
+        return SearchDocument.objects.none()
+    return get_search_backend().matches(owner.pk, terms)
+
+
+def index_file(file_id):
+    """Create or refresh the document of a file, keeping any extracted content."""
+    row = File.objects.filter(pk=file_id).values_list('owner_id', 'name').first()
+    if row is None:
+        return
+    owner_id, name = row
+    updated = SearchDocument.objects.filter(file_id=file_id).exclude(name=name, owner_id=owner_id).update(
+        name=name, owner_id=owner_id
+    )
+    if not updated:
+        SearchDocument.objects.get_or_create(file_id=file_id, defaults={'owner_id': owner_id, 'name': name})
+
+
+def extract_text(file):
+    """A bounded prefix of the text content of a file, or '' if it has none."""
+    limit = settings.SEARCH_BODY_BYTES
+    if FilePreviewService.is_text(file.content_type):
+        chunks = iter(plaintext_chunks(file, limit))
+        sample = next(chunks, b'')
+        decoder = codecs.getincrementaldecoder(detect_encoding(sample))(errors='replace')
+        return decoder.decode(sample) + ''.join(decoder.decode(chunk) for chunk in chunks)
+    if file.content_type == 'application/pdf' and fitz is not None:
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as plain:
+            for chunk in plaintext_chunks(file):
+                plain.write(chunk)
+            plain.flush()
+            text = []
+            with fitz.open(plain.name) as document:
+                for page in document.pages(0, min(settings.SEARCH_PDF_PAGES, document.page_count)):
+                    text.append(page.get_text())
+                    if sum(map(len, text)) >= limit:
+                        break
+            return ''.join(text)[:limit]
+    return ''
+
+
+def index_content(file_id):
+    file = File.objects.filter(pk=file_id, status='READY').defer('encrypted_file').first()
+    if file is None or not file.has_content:
+        return
+    body = extract_text(file)
+    if body:
+        index_file(file_id)
+        SearchDocument.objects.filter(file_id=file_id).update(body=body)
+
+
+def queue_content_indexing(file):
+    """Extract and index a READY file's text on the background pool."""
+    if file.status != 'READY' or not file.has_content:
+        return
+    if not (FilePreviewService.is_text(file.content_type) or file.content_type == 'application/pdf'):
+        return
+    try:
+        get_preview_pool().submit(index_content, file.pk)
+    except PoolSaturated:
+        logger.info('Background pool is full, content of %s is not indexed', file.pk)
@@ -1,10 +1,87 @@
+import math
+from django.conf import settings
 from rest_framework import serializers
-from .models import File
+from .links import PERMISSIONS
+from .models import File, UploadSession
 
-class FileSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """Return only the fields listed in `?fields=a,b` on GET requests."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        requested = request.query_params.get('fields')
+        if requested:
+            allowed = {name.strip() for name in requested.split(',')}
+            for name in set(self.fields) - allowed:
+                self.fields.pop(name)
+
+
+class FileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')
-    
+    digest = serializers.ReadOnlyField(source='blob_digest')
+    # The upload itself; its content is only kept encrypted by the StorageEngine
+    file = serializers.FileField(write_only=True)
+
     class Meta:
         model = File
-        fields = ['id', 'name', 'file', 'encrypted_file', 'owner', 'created_at', 'updated_at']
-        read_only_fields = ['encrypted_file'] 
\ No newline at end of file
+        fields = [
+            'id', 'name', 'file', 'owner', 'size', 'content_type', 'digest', 'content_digest', 'status',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = ['size', 'content_type', 'content_digest', 'status'] 
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    size = serializers.IntegerField(source='total_size', min_value=0)
+    offset = serializers.ReadOnlyField(source='received')
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'name', 'content_type', 'size', 'offset', 'status', 'file', 'created_at', 'updated_at']
+        read_only_fields = ['status', 'file']
+
+    def validate_size(self, value):
+        if value > settings.MAX_RESUMABLE_UPLOAD_SIZE:
+            raise serializers.ValidationError(
+                f'Uploads are limited to {settings.MAX_RESUMABLE_UPLOAD_SIZE} bytes'
+            )
+        return value
+
+class DigestListField(serializers.ListField):
+    """Hex SHA-256 digests, lowercased; UPLOAD_PREFLIGHT_MAX_DIGESTS at most."""
+    child = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
+
+    def to_internal_value(self, data):
+        # Checked before any item is matched, so oversized requests cost nothing
+        limit = settings.UPLOAD_PREFLIGHT_MAX_DIGESTS
+        if isinstance(data, list) and len(data) > limit:
+            self.fail('max_length', max_length=limit)
+        return [digest.lower() for digest in super().to_internal_value(data)]
+
+
+class UploadPreflightSerializer(serializers.Serializer):
+    digests = DigestListField()
+
+
+class ExpirationHoursField(serializers.FloatField):
+    """A positive, finite number of hours; blank means none was given."""
+    default_error_messages = {
+        'positive': 'Ensure this value is a positive number of hours.',
+    }
+
+    def validate_empty_values(self, data):
+        return super().validate_empty_values(None if data == '' else data)
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not math.isfinite(value) or value <= 0:
+            self.fail('positive')
+        return value
+
+
+class ShareLinkSerializer(serializers.Serializer):
+    permission = serializers.ChoiceField(choices=PERMISSIONS, default='VIEW')
+    # Omitted, the link lives for SHARE_LINK_MAX_AGE
+    expiration_hours = ExpirationHoursField(required=False, allow_null=True)
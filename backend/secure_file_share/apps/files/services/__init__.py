@@ -1,4 +1,3 @@
-from .file_handler import FileHandler
 from .version_control import VersionControlService
 
-__all__ = ['FileHandler', 'VersionControlService']
+__all__ = ['VersionControlService']
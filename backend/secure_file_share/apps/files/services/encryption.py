@@ -1,53 +1,39 @@
-import os
-from base64 import b64encode, b64decode
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.backends import default_backend
-from django.conf import settings
+from ..keys import CURRENT_KEY_VERSION, new_data_key, unwrap_key, wrap_key
+from ..utils import decrypt_stream, encrypt_stream
+
+
+def _raw_key(key):
+    return key['key'] if isinstance(key, dict) else key
+
 
 class FileEncryptionService:
-    def __init__(self):
-        self.master_key = settings.ENCRYPTION_MASTER_KEY.encode()
-
-    def _derive_key(self, salt):
-        """Derive a key using PBKDF2 with the master key."""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-            backend=default_backend()
-        )
-        return b64encode(kdf.derive(self.master_key))
+    """
+    In-memory helpers over the scheme used for stored files: a random data
+    key per file, wrapped with a key-encryption key, and the segmented
+    stream format. Stored content goes through engine.StorageEngine.
+    """
 
     def generate_file_key(self):
-        """Generate a unique encryption key for a file."""
-        salt = os.urandom(16)
-        key = self._derive_key(salt)
+        """Generate a data key for a file, with its wrapped record for storage."""
+        key, wrapped = new_data_key()
         return {
             'key': key,
-            'salt': salt
+            'wrapped_key': wrapped,
+            'key_version': CURRENT_KEY_VERSION
         }
 
     def encrypt_file(self, file_content, key):
-        """Encrypt file content using the provided key."""
-        f = Fernet(key)
-        return f.encrypt(file_content)
+        """Encrypt file content with a data key (or a `generate_file_key()` result)."""
+        return b''.join(encrypt_stream([file_content], _raw_key(key)))
 
     def decrypt_file(self, encrypted_content, key):
-        """Decrypt file content using the provided key."""
-        f = Fernet(key)
-        return f.decrypt(encrypted_content)
-
-    def encrypt_file_key(self, file_key, user_public_key):
-        """Encrypt the file key with user's public key for secure storage."""
-        # In a real implementation, you would use the user's public key
-        # to encrypt the file key. For this example, we'll use a simplified version.
-        return file_key
-
-    def decrypt_file_key(self, encrypted_file_key, user_private_key):
-        """Decrypt the file key using user's private key."""
-        # In a real implementation, you would use the user's private key
-        # to decrypt the file key. For this example, we'll use a simplified version.
-        return encrypted_file_key 
\ No newline at end of file
+        """Decrypt content produced by `encrypt_file`."""
+        return b''.join(decrypt_stream([encrypted_content], _raw_key(key)))
+
+    def encrypt_file_key(self, file_key, kek_version=None):
+        """Wrap a file's data key with a key-encryption key (the current one by default)."""
+        return wrap_key(_raw_key(file_key), kek_version)
+
+    def decrypt_file_key(self, encrypted_file_key):
+        """Unwrap a key from `encrypt_file_key`, whichever KEK it was wrapped with."""
+        return unwrap_key(encrypted_file_key)
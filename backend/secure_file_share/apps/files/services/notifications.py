@@ -1,56 +1,78 @@
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.conf import settings
+from django.utils.dateformat import format as format_date
+from ..models import OutboundEmail
+from ..outbox import queue_emails
 
 class ShareNotificationService:
+    """
+    Share notification emails.
+
+    Messages are queued in the email outbox (see outbox.py) and sent by its
+    worker, so notifying any number of recipients costs the request a
+    single INSERT.
+    """
+
     def send_share_notification(self, share, base_url):
-        """Send notification email for file sharing."""
-        if share.share_type == 'USER':
-            self._send_user_share_notification(share)
-        else:
-            self._send_link_share_notification(share, base_url)
-
-    def _send_user_share_notification(self, share):
-        """Send notification for direct user share."""
-        context = {
-            'recipient_name': share.shared_with.username,
-            'sender_name': share.created_by.username,
-            'file_name': share.file.name,
-        }
-        
-        html_content = render_to_string(
-            'emails/file_shared_notification.html',
-            context
-        )
-        
-        send_mail(
-            subject=f'{share.created_by.username} shared a file with you',
-            message=strip_tags(html_content),
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[share.shared_with.email],
-            html_message=html_content
-        )
+        """Queue the notification email for a file share."""
+        return self.send_share_notifications([share], base_url)
 
-    def _send_link_share_notification(self, share, base_url):
-        """Send notification for link share."""
-        share_url = f"{base_url}/share/{share.access_token}"
-        
-        context = {
-            'sender_name': share.created_by.username,
-            'file_name': share.file.name,
-            'share_url': share_url,
-            'expires_at': share.expires_at,
-        }
-        
-        html_content = render_to_string(
-            'emails/share_link_notification.html',
-            context
-        )
-        
-        send_mail(
+    def send_share_notifications(self, shares, base_url):
+        """Queue notification emails for many shares at once."""
+        return queue_emails([
+            self._user_share_email(share, base_url) for share in shares if share.shared_with.email
+        ])
+
+    def send_bulk_share_notifications(self, owner, shares, base_url):
+        """Queue one email per recipient of a bulk share, naming the files shared."""
+        by_recipient = {}
+        for share in shares:
+            by_recipient.setdefault(share.shared_with_id, []).append(share)
+
+        emails = []
+        for recipient_shares in by_recipient.values():
+            recipient = recipient_shares[0].shared_with
+            if not recipient.email:
+                continue
+            file_name = recipient_shares[0].file.name
+            if len(recipient_shares) > 1:
+                file_name = f'{file_name} and {len(recipient_shares) - 1} other files'
+            emails.append(OutboundEmail(
+                to=recipient.email,
+                subject=f'{owner.username} shared {len(recipient_shares)} file(s) with you',
+                template='emails/file_shared_notification.html',
+                context={
+                    'recipient_name': recipient.username,
+                    'sender_name': owner.username,
+                    'file_name': file_name,
+                    'login_url': base_url,
+                },
+            ))
+        return queue_emails(emails)
+
+    def send_link_notification(self, sender, file, share_url, expires_at=None):
+        """Queue the email telling `sender` their share link is ready."""
+        # The context is stored as JSON, so the expiry is formatted here
+        # rather than by the template's `date` filter
+        return queue_emails([OutboundEmail(
+            to=sender.email,
             subject='Your file share link is ready',
-            message=strip_tags(html_content),
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[share.created_by.email],
-            html_message=html_content
-        ) 
\ No newline at end of file
+            template='emails/share_link_notification.html',
+            context={
+                'sender_name': sender.username,
+                'file_name': file.name,
+                'share_url': share_url,
+                'expires_at': format_date(expires_at, 'F j, Y, g:i a') if expires_at else None,
+            },
+        )])
+
+    def _user_share_email(self, share, base_url):
+        return OutboundEmail(
+            to=share.shared_with.email,
+            subject=f'{share.owner.username} shared a file with you',
+            template='emails/file_shared_notification.html',
+            context={
+                'recipient_name': share.shared_with.username,
+                'sender_name': share.owner.username,
+                'file_name': share.file.name,
+                'login_url': base_url,
+            },
+        )
@@ -1,21 +1,85 @@
-import os
-import fitz  # PyMuPDF
+import codecs
+import logging
 from PIL import Image
 from io import BytesIO
-from django.core.files.base import ContentFile
-from django.conf import settings
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+try:
+    import charset_normalizer
+except ImportError:
+    charset_normalizer = None
+
+logger = logging.getLogger(__name__)
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def detect_encoding(sample):
+    """Best guess at the charset of a text prefix (which may end mid-character)."""
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    if charset_normalizer is not None:
+        match = charset_normalizer.from_bytes(sample).best()
+        if match is not None:
+            return match.encoding
+    return 'cp1252'
+
+
+def iter_bytes(source, chunk_size=8192):
+    """Yield byte chunks from a file-like object or an iterable of chunks."""
+    if hasattr(source, 'read'):
+        yield from iter(lambda: source.read(chunk_size), b'')
+    else:
+        yield from source
+
 
 class FilePreviewService:
     PREVIEW_SIZE = (800, 800)  # Max preview dimensions
+    TEXT_TYPES = ('text/plain', 'text/csv', 'text/markdown', 'application/json')
+    TEXT_PREVIEW_LINES = 20
+    TEXT_PREVIEW_BYTES = 16 * 1024  # Never read more than this much of a text file
+    TEXT_PREVIEW_LINE_LENGTH = 500
+    ENCODING_SAMPLE_SIZE = 4096
     
-    def __init__(self):
+    def __init__(self, size=None):
+        self.size = tuple(size or self.PREVIEW_SIZE)
         self.supported_types = {
-            'application/pdf': self._preview_pdf,
             'image/jpeg': self._preview_image,
             'image/png': self._preview_image,
             'image/gif': self._preview_image,
-            'text/plain': self._preview_text,
         }
+        for content_type in self.TEXT_TYPES:
+            self.supported_types[content_type] = self._preview_text
+        if fitz is not None:
+            self.supported_types['application/pdf'] = self._preview_pdf
+
+    def supports(self, content_type):
+        return content_type in self.supported_types
+
+    @classmethod
+    def preview_content_type(cls, content_type):
+        """Content type of the preview generated for `content_type`."""
+        return 'text/plain; charset=utf-8' if content_type in cls.TEXT_TYPES else 'image/jpeg'
+
+    @classmethod
+    def is_text(cls, content_type):
+        return content_type in cls.TEXT_TYPES
 
     def generate_preview(self, file_obj, content_type):
         """Generate a preview for the given file if supported."""
@@ -24,44 +88,82 @@ class FilePreviewService:
             
         try:
             return self.supported_types[content_type](file_obj)
-        except Exception as e:
-            print(f"Preview generation failed: {str(e)}")
+        except Exception:
+            logger.exception('Preview generation failed')
             return None
 
     def _preview_pdf(self, file_obj):
         """Generate preview for PDF files."""
-        pdf_document = fitz.open(stream=file_obj.read(), filetype="pdf")
-        first_page = pdf_document[0]
-        
-        # Convert to PNG
-        pix = first_page.get_pixmap(matrix=fitz.Matrix(2, 2))
-        img_data = pix.tobytes("png")
-        
-        # Create thumbnail
-        return self._create_thumbnail(Image.open(BytesIO(img_data)))
+        # Only a path the upload handler created is opened directly; `name`
+        # can come from the client and must never be used as a path
+        if hasattr(file_obj, 'temporary_file_path'):
+            pdf_document = fitz.open(file_obj.temporary_file_path())
+        else:
+            pdf_document = fitz.open(stream=file_obj.read(), filetype="pdf")
+        with pdf_document:
+            first_page = pdf_document[0]
+
+            # Rasterize straight at the preview size instead of 2x and downscaling
+            rect = first_page.rect
+            scale = min(self.size[0] / rect.width, self.size[1] / rect.height)
+            pix = first_page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+            image = Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+
+        return self._encode(image)
 
     def _preview_image(self, file_obj):
         """Generate preview for image files."""
         image = Image.open(file_obj)
+        # JPEGs decode at the smallest DCT scale (1/2 .. 1/8) still above the target
+        image.draft('RGB', self.size)
         return self._create_thumbnail(image)
 
     def _preview_text(self, file_obj):
-        """Generate preview for text files."""
-        # For text files, we'll return the first few lines
-        content = file_obj.read().decode('utf-8')
-        preview = '\n'.join(content.split('\n')[:20])  # First 20 lines
+        """
+        Generate preview for text files.
+
+        `file_obj` may be a file or an iterable of chunks such as a
+        decryption stream; only a bounded prefix is read and decoded.
+        """
+        budget = self.TEXT_PREVIEW_BYTES
+        chunks = iter_bytes(file_obj)
+        sample = bytearray()
+        for chunk in chunks:
+            sample += chunk[:budget - len(sample)]
+            if len(sample) >= min(self.ENCODING_SAMPLE_SIZE, budget):
+                break
+        budget -= len(sample)
+
+        decoder = codecs.getincrementaldecoder(detect_encoding(bytes(sample)))(errors='replace')
+        text = decoder.decode(bytes(sample))
+        for chunk in chunks:
+            if text.count('\n') >= self.TEXT_PREVIEW_LINES or budget <= 0:
+                break
+            chunk = chunk[:budget]
+            budget -= len(chunk)
+            text += decoder.decode(chunk)
+
+        lines = text.splitlines()[:self.TEXT_PREVIEW_LINES]
+        limit = self.TEXT_PREVIEW_LINE_LENGTH
+        preview = '\n'.join(line if len(line) <= limit else line[:limit] + '…' for line in lines)
         return preview.encode('utf-8')
 
     def _create_thumbnail(self, image):
         """Create a thumbnail from an image."""
+        if image.mode in ('1', 'P'):
+            # Palette images would otherwise be resized with NEAREST
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        # Shrink first (box-reducing most of the way), convert only the small result
+        image.thumbnail(self.size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        return self._encode(image)
+
+    def _encode(self, image):
         # Convert to RGB if necessary
         if image.mode not in ('L', 'RGB'):
             image = image.convert('RGB')
-            
-        # Create thumbnail
-        image.thumbnail(self.PREVIEW_SIZE, Image.Resampling.LANCZOS)
-        
+
         # Save to bytes
         output = BytesIO()
         image.save(output, format='JPEG', quality=85)
-        return output.getvalue() 
\ No newline at end of file
+        return output.getvalue()
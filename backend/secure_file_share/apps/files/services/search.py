@@ -1,68 +1,181 @@
-from django.db.models import Q
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import BigIntegerField, Count, Q, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import timedelta
+from ..search import matching_documents
+
+MB = 1024 * 1024
+
+TYPE_FILTERS = {
+    'document': Q(content_type__in=[
+        'application/pdf',
+        'application/msword',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'text/plain'
+    ]),
+    'image': Q(content_type__startswith='image/'),
+    'video': Q(content_type__startswith='video/'),
+    'audio': Q(content_type__startswith='audio/'),
+}
+
+SIZE_FILTERS = {
+    'small': Q(size__lt=MB),
+    'medium': Q(size__gte=MB, size__lt=10 * MB),
+    'large': Q(size__gte=10 * MB),
+}
+
+
+def date_filters(now=None):
+    now = now or timezone.now()
+    local = timezone.localtime(now) if timezone.is_aware(now) else now
+    return {
+        'today': Q(created_at__gte=local.replace(hour=0, minute=0, second=0, microsecond=0)),
+        'week': Q(created_at__gte=now - timedelta(days=7)),
+        'month': Q(created_at__gte=now - timedelta(days=30)),
+    }
+
+
+class InvalidSortKey(ValueError):
+    pass
+
+
+def _facet_cache():
+    return caches[getattr(settings, 'FILE_FACET_CACHE_ALIAS', 'default')]
+
+
+def _facet_cache_key(owner_id):
+    return f'files:facets:{owner_id}'
+
+
+def invalidate_facet_cache(owner_id):
+    """Drop an owner's cached facet counts (called from signals)."""
+    if getattr(settings, 'FILE_FACET_CACHE_TTL', 0):
+        _facet_cache().delete(_facet_cache_key(owner_id))
+
 
 class FileSearchService:
-    def search_files(self, queryset, search_params):
+    # Sort key -> field; each is backed by an (owner, field, id) index on File
+    SORT_KEYS = {
+        'created_at': 'created_at',
+        'name': 'name',
+        'size': 'sort_size',
+    }
+    # Sort fields that are annotations. Files stored before sizes were
+    # recorded have none and sort as the smallest, so cursors always carry a value
+    SORT_ANNOTATIONS = {
+        'sort_size': Coalesce('size', Value(-1), output_field=BigIntegerField()),
+    }
+    DEFAULT_SORT = '-created_at'
+
+    def get_ordering(self, sort=None):
+        """`(field, descending)` for a `sort` parameter such as `-size`."""
+        sort = sort or self.DEFAULT_SORT
+        descending = sort.startswith('-')
+        field = self.SORT_KEYS.get(sort.lstrip('-'))
+        if field is None:
+            raise InvalidSortKey(f"Invalid sort key, use one of: {', '.join(sorted(self.SORT_KEYS))}")
+        return field, descending
+
+    def annotate_sort(self, queryset, field):
+        """Add the annotation a sort `field` from `get_ordering` needs, if any."""
+        if field in self.SORT_ANNOTATIONS:
+            return queryset.annotate(**{field: self.SORT_ANNOTATIONS[field]})
+        return queryset
+
+    def filter_text(self, queryset, search_text, owner=None):
+        # Through the full-text index when the owner is known, as a subquery
+        # so listings and facets see every match
+        if not search_text:
+            return queryset
+        if owner is not None:
+            return queryset.filter(pk__in=matching_documents(owner, search_text).values('file_id'))
+        return queryset.filter(name__icontains=search_text)
+
+    def filter_files(self, queryset, search_params, owner=None):
         """
-        Search and filter files based on various parameters.
+        Filter files by text, type, date range and size.
         """
-        # Text search
-        if search_text := search_params.get('search'):
-            queryset = queryset.filter(
-                Q(name__icontains=search_text) |
-                Q(tags__name__icontains=search_text)
-            ).distinct()
+        queryset = self.filter_text(queryset, search_params.get('search'), owner=owner)
 
         # File type filter
         if file_types := search_params.getlist('type'):
             type_query = Q()
             for file_type in file_types:
-                if file_type == 'document':
-                    type_query |= Q(content_type__in=[
-                        'application/pdf',
-                        'application/msword',
-                        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                        'text/plain'
-                    ])
-                elif file_type == 'image':
-                    type_query |= Q(content_type__startswith='image/')
-                elif file_type == 'video':
-                    type_query |= Q(content_type__startswith='video/')
-                elif file_type == 'audio':
-                    type_query |= Q(content_type__startswith='audio/')
+                type_query |= TYPE_FILTERS.get(file_type, Q(pk__in=[]))
             queryset = queryset.filter(type_query)
 
         # Date range filter
         if date_range := search_params.get('date_range'):
-            today = timezone.now()
-            if date_range == 'today':
-                queryset = queryset.filter(uploaded_at__date=today.date())
-            elif date_range == 'week':
-                week_ago = today - timedelta(days=7)
-                queryset = queryset.filter(uploaded_at__gte=week_ago)
-            elif date_range == 'month':
-                month_ago = today - timedelta(days=30)
-                queryset = queryset.filter(uploaded_at__gte=month_ago)
-            elif date_range == 'custom':
+            if date_range == 'custom':
                 start_date = search_params.get('start_date')
                 end_date = search_params.get('end_date')
                 if start_date:
-                    queryset = queryset.filter(uploaded_at__gte=start_date)
+                    queryset = queryset.filter(created_at__gte=start_date)
                 if end_date:
-                    queryset = queryset.filter(uploaded_at__lte=end_date)
+                    queryset = queryset.filter(created_at__lte=end_date)
+            elif date_range in ('today', 'week', 'month'):
+                queryset = queryset.filter(date_filters()[date_range])
 
         # Size filter
         if size_range := search_params.get('size'):
-            if size_range == 'small':  # < 1MB
-                queryset = queryset.filter(size__lt=1024*1024)
-            elif size_range == 'medium':  # 1MB - 10MB
-                queryset = queryset.filter(size__gte=1024*1024, size__lt=10*1024*1024)
-            elif size_range == 'large':  # > 10MB
-                queryset = queryset.filter(size__gte=10*1024*1024)
-
-        # Sorting
-        sort_by = search_params.get('sort', '-uploaded_at')
-        queryset = queryset.order_by(sort_by)
-
-        return queryset 
\ No newline at end of file
+            if size_range in SIZE_FILTERS:
+                queryset = queryset.filter(SIZE_FILTERS[size_range])
+
+        return queryset
+
+    def search_files(self, queryset, search_params, owner=None):
+        """
+        Search and filter files based on various parameters.
+        """
+        queryset = self.filter_files(queryset, search_params, owner=owner)
+        field, descending = self.get_ordering(search_params.get('sort'))
+        queryset = self.annotate_sort(queryset, field)
+        if descending:
+            return queryset.order_by(f'-{field}', '-pk')
+        return queryset.order_by(field, 'pk')
+
+    def facet_counts(self, queryset):
+        """
+        Count files per type, size and date bucket in one aggregate query.
+
+        Type buckets that match nothing else are counted as `other`.
+        """
+        buckets = {
+            **{f'type_{name}': q for name, q in TYPE_FILTERS.items()},
+            **{f'size_{name}': q for name, q in SIZE_FILTERS.items()},
+            **{f'date_{name}': q for name, q in date_filters().items()},
+        }
+        row = queryset.order_by().aggregate(
+            total=Count('pk'),
+            **{key: Count('pk', filter=q) for key, q in buckets.items()}
+        )
+
+        facets = {'total': row.pop('total'), 'type': {}, 'size': {}, 'date': {}}
+        for key, count in row.items():
+            group, name = key.split('_', 1)
+            facets[group][name] = count
+        facets['type']['other'] = facets['total'] - sum(facets['type'].values())
+        return facets
+
+    def get_facets(self, owner, queryset, search_params):
+        """
+        Facet counts of `owner`'s files matching the text search.
+
+        Counts without a text search are cached for FILE_FACET_CACHE_TTL
+        seconds once the owner has FILE_FACET_CACHE_MIN_FILES files, and
+        dropped by signals whenever one of the owner's files changes.
+        """
+        ttl = getattr(settings, 'FILE_FACET_CACHE_TTL', 0)
+        cacheable = ttl and not search_params.get('search')
+        key = _facet_cache_key(owner.pk)
+        if cacheable:
+            facets = _facet_cache().get(key)
+            if facets is not None:
+                return facets
+
+        facets = self.facet_counts(self.filter_text(queryset, search_params.get('search'), owner=owner))
+        if cacheable and facets['total'] >= getattr(settings, 'FILE_FACET_CACHE_MIN_FILES', 0):
+            _facet_cache().set(key, facets, ttl)
+        return facets
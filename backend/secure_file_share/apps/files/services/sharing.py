@@ -1,92 +1,115 @@
-from datetime import timedelta
-from django.utils import timezone
-from django.core.signing import TimestampSigner, BadSignature
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.conf import settings
-from ..models import FileShare, FileUserPermission
+from secure_file_share.apps.sharing.models import FileShare
+from ..access import invalidate_access_cache
+from ..links import InvalidShareToken, issue_token, revoke_token, verify_token
+from ..models import File
 
 class FileShareService:
-    def __init__(self):
-        self.signer = TimestampSigner()
-
-    def create_share_link(self, file, user, expiration_hours):
+    def create_share_link(self, file, user, expiration_hours=None, permission='VIEW'):
         """Create a temporary share link for a file."""
-        share = FileShare.objects.create(
-            file=file,
-            created_by=user,
-            share_type='LINK',
-            expires_at=timezone.now() + timedelta(hours=expiration_hours)
-        )
-        
-        # Create a signed token that includes the share ID
-        token = self.signer.sign(str(share.id))
-        
+        if file.owner_id != user.pk:
+            raise PermissionError('Only the owner can create share links')
+        ttl = None
+        if expiration_hours is not None:
+            # Capped before int(): hours * 3600 overflows to inf for huge values
+            ttl = int(min(expiration_hours * 3600, settings.SHARE_LINK_MAX_AGE))
+        token, link = issue_token(file.pk, permission, ttl)
         return {
-            'share_id': share.id,
+            'link_id': link.link_id,
             'token': token,
-            'expires_at': share.expires_at
+            'permission': link.permission,
+            'expires_at': link.expires_at
         }
 
-    def share_with_user(self, file, owner, target_user, permissions=None):
+    def share_with_user(self, file, owner, target_user, share_type='DOWNLOAD', expires_at=None):
         """Share a file with a specific user."""
-        # Create the file share record
-        share = FileShare.objects.create(
+        return FileShare.objects.create(
             file=file,
-            created_by=owner,
+            owner=owner,
             shared_with=target_user,
-            share_type='USER'
+            share_type=share_type,
+            expires_at=expires_at
         )
-        
-        # Set default permissions if none provided
-        if permissions is None:
-            permissions = ['READ']
-            
-        # Create permission records
-        for perm in permissions:
-            FileUserPermission.objects.create(
-                file=file,
-                user=target_user,
-                permission_type_id=perm,
-                granted_by=owner
+
+    def bulk_share(self, owner, file_ids, user_ids, share_type='DOWNLOAD', expires_at=None):
+        """
+        Share every file in `file_ids` with every user in `user_ids`.
+
+        Runs a fixed number of queries in one transaction whatever the size
+        of the matrix: the owner's files, the users and the existing shares
+        are each read in one query and the new shares are written with
+        batched INSERTs that ignore (file, shared_with) conflicts. Returns
+        `(shares, results)`: the created shares and a `(file_id, user_id,
+        status)` per pair, status being one of 'created', 'exists',
+        'file_not_found', 'user_not_found' or 'self'.
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        user_ids = list(dict.fromkeys(user_ids))
+        with transaction.atomic():
+            files = File.objects.filter(pk__in=file_ids, owner=owner).only('id', 'name', 'owner_id').in_bulk()
+            users = get_user_model().objects.filter(pk__in=user_ids).only('id', 'username', 'email').in_bulk()
+            existing = set(FileShare.objects.filter(
+                file_id__in=list(files), shared_with_id__in=list(users)
+            ).values_list('file_id', 'shared_with_id'))
+
+            shares, results = [], []
+            for file_id in file_ids:
+                file = files.get(file_id)
+                for user_id in user_ids:
+                    if file is None:
+                        status = 'file_not_found'
+                    elif user_id not in users:
+                        status = 'user_not_found'
+                    elif user_id == owner.pk:
+                        status = 'self'
+                    elif (file.pk, user_id) in existing:
+                        status = 'exists'
+                    else:
+                        status = 'created'
+                        shares.append(FileShare(
+                            file=file,
+                            owner=owner,
+                            shared_with=users[user_id],
+                            share_type=share_type,
+                            expires_at=expires_at
+                        ))
+                    results.append((file_id, user_id, status))
+
+            # A share created concurrently since the read above is left as it is
+            FileShare.objects.bulk_create(
+                shares, batch_size=settings.SHARE_BULK_BATCH_SIZE, ignore_conflicts=True
             )
-            
-        return share
+
+        # bulk_create sends no post_save, so drop the recipients' cached access here
+        for user_id in {share.shared_with_id for share in shares}:
+            invalidate_access_cache(user_id)
+        return shares, results
 
     def validate_share_token(self, token):
-        """Validate a share token and return the associated share."""
+        """Return the ShareLink of a valid token, or None; never queries the database."""
         try:
-            # Verify the token signature and age
-            share_id = self.signer.unsign(
-                token,
-                max_age=settings.SHARE_LINK_MAX_AGE
-            )
-            
-            # Get and validate the share
-            share = FileShare.objects.get(id=share_id)
-            
-            if share.is_expired:
-                return None
-                
-            return share
-            
-        except (BadSignature, FileShare.DoesNotExist):
+            return verify_token(token)
+        except InvalidShareToken:
             return None
 
+    def revoke_share_link(self, token, user):
+        """Revoke a share link; only the owner of the linked file may."""
+        link = verify_token(token)
+        if not File.objects.filter(pk=link.file_id, owner=user).exists():
+            raise PermissionError('Only the owner can revoke share links')
+        return revoke_token(token)
+
     def revoke_share(self, share_id, user):
         """Revoke a file share."""
         try:
             share = FileShare.objects.get(id=share_id)
             
             # Verify the user has permission to revoke
-            if share.created_by != user and share.file.owner != user:
+            if share.owner_id != user.pk and share.file.owner_id != user.pk:
                 return False
-                
-            # Remove associated permissions
-            if share.shared_with:
-                FileUserPermission.objects.filter(
-                    file=share.file,
-                    user=share.shared_with
-                ).delete()
-                
+
             # Delete the share
             share.delete()
             return True
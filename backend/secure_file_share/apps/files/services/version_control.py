@@ -1,22 +1,47 @@
+from django.conf import settings
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
-import os
+from ..chunking import release_manifest, store_chunks, version_key
+from ..deltas import iter_version, rebase_dependents, save_delta_version
+from ..models import FileVersion
 
 class VersionControlService:
     @staticmethod
-    def save_version(file_obj, version):
-        """Save a new version of a file"""
-        file_path = os.path.join(
-            'versions',
-            str(version.file.id),
-            f'v{version.version_number}_{file_obj.name}'
-        )
-        
-        path = default_storage.save(file_path, ContentFile(file_obj.read()))
-        version.file_path = path
+    def save_version(file_obj, version, delta=None):
+        """
+        Save a new version of a file as a manifest of deduplicated chunks,
+        or in delta mode as a binary delta against the previous version
+        """
+        if hasattr(file_obj, 'chunks'):
+            chunks = file_obj.chunks()
+        else:
+            chunks = iter(lambda: file_obj.read(1024 * 1024), b'')
+
+        if delta is None:
+            delta = settings.VERSION_DELTA_ENABLED
+        if delta:
+            previous = FileVersion.objects.filter(
+                file=version.file,
+                version_number__lt=version.version_number,
+                manifest__isnull=False
+            ).order_by('-version_number').first()
+            save_delta_version(version, previous, chunks)
+            return version.manifest
+
+        # Only chunks no earlier version contains are written
+        version.manifest, version.size = store_chunks(chunks, version_key(version))
         version.save()
-        
-        return path
+
+        return version.manifest
+
+    @staticmethod
+    def read_version(version):
+        """Yield the content of a specific version"""
+        if version.manifest is not None:
+            yield from iter_version(version)
+        elif version.file_path:
+            # Full copy saved before versions were chunked
+            with default_storage.open(version.file_path, 'rb') as f:
+                yield from f.chunks()
 
     @staticmethod
     def get_version_path(version):
@@ -25,6 +50,13 @@ class VersionControlService:
 
     @staticmethod
     def delete_version(version):
-        """Delete a specific version's file"""
+        """Delete a specific version's content"""
+        if version.manifest is not None:
+            # Versions stored as deltas against this one become keyframes
+            rebase_dependents(version)
+            release_manifest(version.manifest)
+            version.manifest = None
+            version.base = None
+            version.save(update_fields=['manifest', 'base'])
         if version.file_path and default_storage.exists(version.file_path):
-            default_storage.delete(version.file_path) 
\ No newline at end of file
+            default_storage.delete(version.file_path)
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from secure_file_share.apps.sharing.models import FileShare
+from .access import invalidate_access_cache
+from .chunking import release_manifest
+from .convergent import release_convergent_blob
+from .models import ConvergentBlob, File, FileVersion
+from .previews import delete_previews, queue_previews
+from .search import index_file, queue_content_indexing
+from .services.search import invalidate_facet_cache
+from .storage import get_blob_store
+from .workers import file_processed
+
+
+@receiver(post_delete, sender=File)
+def delete_orphaned_blob(sender, instance, **kwargs):
+    """Remove a file's blob once no row references it any more."""
+    ref, digest = instance.blob_ref, instance.blob_digest
+    if not ref:
+        return
+
+    def delete_blob():
+        if not (
+            File.objects.filter(blob_ref=ref).exists()
+            or ConvergentBlob.objects.filter(blob_ref=ref).exists()
+        ):
+            get_blob_store().delete(ref)
+            if digest:
+                delete_previews(digest)
+
+    transaction.on_commit(delete_blob)
+
+
+@receiver(post_delete, sender=File)
+def release_convergent_reference(sender, instance, **kwargs):
+    """Drop the deleted file's reference to its shared convergent blob."""
+    if instance.convergent_blob_id is not None:
+        release_convergent_blob(instance.convergent_blob_id)
+
+
+@receiver(post_save, sender=File)
+def queue_file_previews(sender, instance, created, **kwargs):
+    """Render previews in the background once an uploaded file is stored."""
+    if created and settings.PREVIEW_ON_UPLOAD:
+        transaction.on_commit(lambda: queue_previews(instance))
+
+
+@receiver(file_processed)
+def queue_processed_file_previews(sender, file, **kwargs):
+    if settings.PREVIEW_ON_UPLOAD:
+        queue_previews(file)
+
+
+@receiver(post_save, sender=File)
+def update_search_index(sender, instance, created, **kwargs):
+    """Index a file's name on every save and its content once it is uploaded."""
+    file_id = instance.pk
+    transaction.on_commit(lambda: index_file(file_id))
+    if created:
+        transaction.on_commit(lambda: queue_content_indexing(instance))
+
+
+@receiver(post_save, sender=File)
+@receiver(post_delete, sender=File)
+def invalidate_file_facets(sender, instance, **kwargs):
+    owner_id = instance.owner_id
+    transaction.on_commit(lambda: invalidate_facet_cache(owner_id))
+
+
+@receiver(file_processed)
+def index_processed_file(sender, file, **kwargs):
+    queue_content_indexing(file)
+
+
+@receiver(post_delete, sender=FileVersion)
+def release_version_chunks(sender, instance, **kwargs):
+    """Drop the deleted version's references to its chunks."""
+    if instance.manifest is not None:
+        release_manifest(instance.manifest)
+
+
+@receiver(post_save, sender=FileShare)
+@receiver(post_delete, sender=FileShare)
+def invalidate_share_access(sender, instance, **kwargs):
+    """Forget cached access decisions for the recipient of a created, changed or revoked share."""
+    user_id = instance.shared_with_id
+    invalidate_access_cache(user_id)
+    # Again after commit, in case a concurrent request re-cached the old state
+    transaction.on_commit(lambda: invalidate_access_cache(user_id))
@@ -0,0 +1,232 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import NamedTuple
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class BlobInfo(NamedTuple):
+    ref: str
+    size: int
+    digest: str
+
+
+class BlobStore:
+    """
+    Content-addressed store for encrypted file payloads.
+
+    Blobs are written from an iterable of byte chunks and addressed by the
+    SHA-256 of their content, so the database row only needs the reference,
+    size and digest.
+    """
+
+    def save(self, chunks, digest=None):
+        """
+        Persist the chunks and return a BlobInfo.
+
+        A `digest` stores them under that name instead of their SHA-256, for
+        content named by a keyed hash (see chunking.py).
+        """
+        raise NotImplementedError
+
+    def adopt(self, path, info):
+        """Take ownership of a fully written local file, storing it under `info.digest`."""
+        raise NotImplementedError
+
+    def read_chunks(self, ref, offset=0, length=None, chunk_size=READ_CHUNK_SIZE):
+        """Yield the blob's bytes from `offset`, optionally limited to `length` bytes."""
+        raise NotImplementedError
+
+    def size(self, ref):
+        raise NotImplementedError
+
+    def exists(self, ref):
+        raise NotImplementedError
+
+    def delete(self, ref):
+        raise NotImplementedError
+
+    @staticmethod
+    def ref_for_digest(digest):
+        return f'sha256/{digest[:2]}/{digest[2:4]}/{digest}'
+
+
+class LocalBlobStore(BlobStore):
+    """Filesystem blob store sharded by the first bytes of the content hash."""
+
+    def __init__(self, root=None):
+        self.root = root or settings.BLOB_ROOT
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, ref):
+        path = os.path.normpath(os.path.join(self.root, ref))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f'Invalid blob reference: {ref}')
+        return path
+
+    def save(self, chunks, digest=None):
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in chunks:
+                    tmp.write(chunk)
+                    sha256.update(chunk)
+                    size += len(chunk)
+            return self.adopt(tmp_path, BlobInfo(None, size, digest or sha256.hexdigest()))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def adopt(self, tmp_path, info):
+        """Move an already written file into place under `info.digest` without copying it."""
+        ref = self.ref_for_digest(info.digest)
+        path = self.path(ref)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            # Identical content is already stored
+            os.remove(tmp_path)
+        else:
+            try:
+                os.replace(tmp_path, path)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(tmp_path, path)
+        return BlobInfo(ref, info.size, info.digest)
+
+    def read_chunks(self, ref, offset=0, length=None, chunk_size=READ_CHUNK_SIZE):
+        with open(self.path(ref), 'rb') as f:
+            f.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def size(self, ref):
+        return os.path.getsize(self.path(ref))
+
+    def exists(self, ref):
+        return os.path.exists(self.path(ref))
+
+    def delete(self, ref):
+        try:
+            os.remove(self.path(ref))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore(BlobStore):
+    """
+    Stand-in for an S3-compatible object store.
+
+    Works with any client exposing the boto3 `put_object`, `get_object`,
+    `head_object` and `delete_object` calls. Uploads are spooled to a
+    temporary file while hashing because the object key is the digest.
+    """
+
+    def __init__(self, bucket, client=None, prefix='', spool_size=8 * 1024 * 1024, **client_kwargs):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImproperlyConfigured('S3BlobStore requires boto3 or an explicit client')
+            client = boto3.client('s3', **client_kwargs)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.spool_size = spool_size
+
+    def key(self, ref):
+        return f'{self.prefix}{ref}'
+
+    def save(self, chunks, digest=None):
+        sha256 = hashlib.sha256()
+        size = 0
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_size) as spool:
+            for chunk in chunks:
+                spool.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+            spool.seek(0)
+            digest = digest or sha256.hexdigest()
+            ref = self.ref_for_digest(digest)
+            self.client.put_object(Bucket=self.bucket, Key=self.key(ref), Body=spool)
+        return BlobInfo(ref, size, digest)
+
+    def adopt(self, path, info):
+        ref = self.ref_for_digest(info.digest)
+        with open(path, 'rb') as f:
+            self.client.put_object(Bucket=self.bucket, Key=self.key(ref), Body=f)
+        os.remove(path)
+        return BlobInfo(ref, info.size, info.digest)
+
+    def read_chunks(self, ref, offset=0, length=None, chunk_size=READ_CHUNK_SIZE):
+        kwargs = {}
+        if offset or length is not None:
+            end = '' if length is None else offset + length - 1
+            kwargs['Range'] = f'bytes={offset}-{end}'
+        body = self.client.get_object(Bucket=self.bucket, Key=self.key(ref), **kwargs)['Body']
+        while chunk := body.read(chunk_size):
+            yield chunk
+
+    def size(self, ref):
+        return self.client.head_object(Bucket=self.bucket, Key=self.key(ref))['ContentLength']
+
+    def exists(self, ref):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(ref))
+        except Exception:
+            return False
+        return True
+
+    def delete(self, ref):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(ref))
+
+
+_blob_store = None
+
+
+def get_blob_store():
+    """Return the configured blob store (settings.BLOB_STORE), created once per process."""
+    global _blob_store
+    if _blob_store is None:
+        config = getattr(settings, 'BLOB_STORE', {})
+        backend = import_string(config.get('BACKEND', 'secure_file_share.apps.files.storage.LocalBlobStore'))
+        _blob_store = backend(**config.get('OPTIONS', {}))
+    return _blob_store
+
+
+_chunk_store = None
+
+
+def get_chunk_store():
+    """Return the store for deduplicated version chunks (settings.VERSION_CHUNK_ROOT)."""
+    global _chunk_store
+    if _chunk_store is None:
+        _chunk_store = LocalBlobStore(settings.VERSION_CHUNK_ROOT)
+    return _chunk_store
+
+
+@receiver(setting_changed)
+def _reset_blob_store(setting, **kwargs):
+    global _blob_store, _chunk_store
+    if setting in ('BLOB_STORE', 'BLOB_ROOT'):
+        _blob_store = None
+    if setting == 'VERSION_CHUNK_ROOT':
+        _chunk_store = None
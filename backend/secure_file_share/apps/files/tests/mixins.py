@@ -0,0 +1,35 @@
+import os
+import shutil
+import tempfile
+from django.test import override_settings
+from ..workers import get_preview_pool, get_worker_pool
+
+
+class TemporaryStorageMixin:
+    """
+    Point every storage root at a temporary directory, `self.root`, for
+    the duration of each test.
+
+    Background encryption and preview jobs are drained before the settings
+    are restored, so none of them writes into the real MEDIA_ROOT.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.root,
+            UPLOAD_ROOT=os.path.join(self.root, 'uploads'),
+            BLOB_ROOT=os.path.join(self.root, 'blobs'),
+            BLOB_STORE={},
+            PREVIEW_ROOT=os.path.join(self.root, 'previews'),
+            VERSION_ROOT=os.path.join(self.root, 'versions'),
+            VERSION_CHUNK_ROOT=os.path.join(self.root, 'chunks'),
+            UPLOAD_SESSION_ROOT=os.path.join(self.root, 'sessions'),
+            ASYNC_STAGING_ROOT=os.path.join(self.root, 'staging'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(get_preview_pool().drain, 10)
+        self.addCleanup(get_worker_pool().drain, 10)
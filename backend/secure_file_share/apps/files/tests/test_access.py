@@ -0,0 +1,141 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from secure_file_share.apps.sharing.models import FileShare
+from ..access import AccessResolver, shared_files
+from ..models import File
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+
+class SharedFileAccessTests(TemporaryStorageMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(
+            username='owner',
+            email='owner@example.com',
+            password='testpass123'
+        )
+        self.recipient = User.objects.create_user(
+            username='recipient',
+            email='recipient@example.com',
+            password='testpass123'
+        )
+
+        self.client.force_authenticate(user=self.owner)
+        for i in range(3):
+            self.client.post(
+                '/api/files/files/',
+                {'name': f'doc{i}.txt', 'file': SimpleUploadedFile(f'doc{i}.txt', b'shared content')},
+                format='multipart'
+            )
+        self.files = list(File.objects.all())
+        for file in self.files:
+            FileShare.objects.create(file=file, owner=self.owner, shared_with=self.recipient)
+        self.client.force_authenticate(user=self.recipient)
+
+    def test_query_counts_are_pinned(self):
+        """Test list, retrieve and download each resolve access in one query"""
+        file = self.files[0]
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/files/shared/')
+        self.assertEqual(len(response.data['results']), 3)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/files/shared/{file.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/files/shared/{file.id}/download/')
+            self.assertEqual(b''.join(response.streaming_content), b'shared content')
+
+    def test_expired_shares_are_hidden(self):
+        """Test expired shares no longer grant access"""
+        file = self.files[0]
+        FileShare.objects.filter(file=file).update(expires_at=timezone.now() - timedelta(hours=1))
+
+        response = self.client.get('/api/files/shared/')
+        self.assertNotIn(str(file.id), [item['id'] for item in response.data['results']])
+        response = self.client.get(f'/api/files/shared/{file.id}/download/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_view_only_shares_cannot_download(self):
+        """Test VIEW shares can retrieve metadata but not download"""
+        file = self.files[0]
+        FileShare.objects.filter(file=file).update(share_type='VIEW')
+
+        self.assertEqual(self.client.get(f'/api/files/shared/{file.id}/').status_code, status.HTTP_200_OK)
+        response = self.client.get(f'/api/files/shared/{file.id}/download/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AccessResolverTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username='owner',
+            email='owner@example.com',
+            password='testpass123'
+        )
+        self.recipient = User.objects.create_user(
+            username='recipient',
+            email='recipient@example.com',
+            password='testpass123'
+        )
+        self.files = [File.objects.create(name=f'doc{i}.txt', owner=self.owner) for i in range(3)]
+        FileShare.objects.create(file=self.files[0], owner=self.owner, shared_with=self.recipient)
+        FileShare.objects.create(
+            file=self.files[1], owner=self.owner, shared_with=self.recipient, share_type='VIEW'
+        )
+        cache.clear()
+
+    def test_decisions_are_batched_per_request(self):
+        """Test any number of checks costs a single share query"""
+        resolver = AccessResolver(self.recipient)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(resolver.can_access(self.files[0], download=True))
+            self.assertTrue(resolver.can_access(self.files[1]))
+            self.assertFalse(resolver.can_access(self.files[1], download=True))
+            self.assertFalse(resolver.can_access(self.files[2]))
+            self.assertTrue(AccessResolver(self.owner).can_access(self.files[2]))
+
+    def test_annotated_share_needs_no_query(self):
+        """Test files from shared_files() are decided from the share they carry"""
+        view_only = shared_files(self.recipient).get(pk=self.files[1].pk)
+        resolver = AccessResolver(self.recipient)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(resolver.can_access(view_only))
+            self.assertFalse(resolver.can_access(view_only, download=True))
+
+    @override_settings(FILE_ACCESS_CACHE_TTL=30)
+    def test_shared_cache_and_signal_invalidation(self):
+        """Test the shared cache is reused and dropped when a share is revoked"""
+        AccessResolver(self.recipient).can_access(self.files[0])
+
+        with self.assertNumQueries(0):
+            self.assertTrue(AccessResolver(self.recipient).can_access(self.files[0]))
+
+        FileShare.objects.get(file=self.files[0]).delete()
+        self.assertFalse(AccessResolver(self.recipient).can_access(self.files[0]))
+
+    @override_settings(FILE_ACCESS_CACHE_TTL=30)
+    def test_cached_shares_still_expire(self):
+        """Test a cached share stops granting access once it expires"""
+        share = FileShare.objects.get(file=self.files[0])
+        share.expires_at = timezone.now() + timedelta(seconds=60)
+        share.save()
+        resolver = AccessResolver(self.recipient)
+        self.assertTrue(resolver.can_access(self.files[0]))
+
+        share_map = cache.get(f'files:access:{self.recipient.pk}')
+        share_map[self.files[0].pk] = ('DOWNLOAD', timezone.now() - timedelta(seconds=1))
+        cache.set(f'files:access:{self.recipient.pk}', share_map)
+        self.assertFalse(AccessResolver(self.recipient).can_access(self.files[0]))
@@ -0,0 +1,77 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from secure_file_share.apps.sharing.models import FileShare
+from ..models import File, OutboundEmail
+
+User = get_user_model()
+
+
+@override_settings(EMAIL_OUTBOX_AUTOSEND=False)
+class BulkShareTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.files = File.objects.bulk_create([
+            File(name=f'file{n}.txt', owner=self.user) for n in range(300)
+        ])
+        self.team = User.objects.bulk_create([
+            User(username=f'member{n}', email=f'member{n}@example.com') for n in range(4)
+        ])
+
+    def _bulk(self, files, users, **extra):
+        return self.client.post('/api/sharing/shares/bulk/', {
+            'files': [str(f.pk) for f in files],
+            'users': [u.pk for u in users],
+            **extra
+        }, format='json')
+
+    def test_matrix_is_shared_in_a_handful_of_queries(self):
+        """Test sharing a folder with a team costs a fixed number of queries"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self._bulk(self.files, self.team, share_type='VIEW')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 1200)
+        self.assertEqual(FileShare.objects.filter(share_type='VIEW').count(), 1200)
+        inserts = [q for q in queries if 'INTO "sharing_fileshare"' in q['sql']]
+        # Multi-row INSERTs (SQLite caps each at 999 parameters) plus a few reads
+        self.assertLessEqual(len(inserts), 12)
+        self.assertLessEqual(len(queries) - len(inserts), 6)
+        # One notification per recipient
+        self.assertEqual(OutboundEmail.objects.count(), 4)
+
+    def test_per_item_results(self):
+        """Test each file/user pair reports whether it was created, existed or was refused"""
+        mine, other_users_file = self.files[0], File.objects.create(
+            name='theirs.txt', owner=self.team[0]
+        )
+        FileShare.objects.create(file=mine, owner=self.user, shared_with=self.team[0])
+
+        response = self.client.post('/api/sharing/shares/bulk/', {
+            'files': [str(mine.pk), str(other_users_file.pk)],
+            'users': [self.team[0].pk, self.team[1].pk, self.user.pk, 999999],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        statuses = {(item['file'], item['user']): item['status'] for item in response.data['results']}
+        self.assertEqual(statuses[(str(mine.pk), self.team[0].pk)], 'exists')
+        self.assertEqual(statuses[(str(mine.pk), self.team[1].pk)], 'created')
+        self.assertEqual(statuses[(str(mine.pk), self.user.pk)], 'self')
+        self.assertEqual(statuses[(str(mine.pk), 999999)], 'user_not_found')
+        self.assertEqual(statuses[(str(other_users_file.pk), self.team[1].pk)], 'file_not_found')
+        self.assertEqual(response.data['created'], 1)
+        self.assertFalse(FileShare.objects.filter(file=other_users_file).exists())
+
+    @override_settings(SHARE_BULK_MAX_ITEMS=100)
+    def test_matrix_size_is_limited(self):
+        """Test oversized matrices are rejected before touching the database"""
+        response = self._bulk(self.files, self.team)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(FileShare.objects.exists())
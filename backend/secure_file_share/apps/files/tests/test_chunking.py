@@ -0,0 +1,146 @@
+import os
+import random
+import shutil
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from ..chunking import (
+    iter_content_chunks, iter_manifest, owner_key, read_chunk, release_manifest, store_chunks, unpack_manifest
+)
+from ..models import ContentChunk, File, FileVersion
+from ..services import VersionControlService
+from ..storage import get_chunk_store
+from ..utils import StreamDecryptionError
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+SIZES = dict(min_size=2048, avg_size=8192, max_size=32768)
+
+
+class ContentDefinedChunkingTests(SimpleTestCase):
+    def setUp(self):
+        self.data = random.Random(1).randbytes(512 * 1024)
+
+    def test_chunks_reassemble_and_respect_bounds(self):
+        """Test chunks concatenate back to the input and stay within the size limits"""
+        pieces = [self.data[i:i + 10000] for i in range(0, len(self.data), 10000)]
+        chunks = list(iter_content_chunks(pieces, **SIZES))
+
+        self.assertEqual(b''.join(chunks), self.data)
+        self.assertTrue(all(len(c) <= SIZES['max_size'] for c in chunks))
+        self.assertTrue(all(len(c) >= SIZES['min_size'] for c in chunks[:-1]))
+
+    def test_boundaries_resynchronise_after_an_insertion(self):
+        """Test inserting bytes only changes the chunks around the edit"""
+        edited = self.data[:100000] + b'inserted' + self.data[100000:]
+
+        before = set(iter_content_chunks([self.data], **SIZES))
+        after = list(iter_content_chunks([edited], **SIZES))
+
+        changed = [c for c in after if c not in before]
+        self.assertLessEqual(sum(map(len, changed)), 3 * SIZES['max_size'])
+        self.assertGreater(len(after) - len(changed), len(after) // 2)
+
+
+@override_settings(
+    VERSION_CHUNK_MIN_SIZE=SIZES['min_size'],
+    VERSION_CHUNK_AVG_SIZE=SIZES['avg_size'],
+    VERSION_CHUNK_MAX_SIZE=SIZES['max_size'],
+)
+class VersionControlServiceTests(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.file = File.objects.create(name='doc.bin', owner=self.user)
+        self.data = random.Random(2).randbytes(256 * 1024)
+
+    def _save(self, number, content):
+        version = FileVersion(file=self.file, version_number=number)
+        VersionControlService.save_version(ContentFile(content, name='doc.bin'), version)
+        return version
+
+    def _stored_chunks(self):
+        root = os.path.join(get_chunk_store().root, 'sha256')
+        return sum(len(files) for _, _, files in os.walk(root))
+
+    def test_versions_share_unchanged_chunks(self):
+        """Test a small edit only stores the chunks that changed"""
+        first = self._save(1, self.data)
+        stored = self._stored_chunks()
+        edited = self.data[:5000] + b'edit' + self.data[5004:]
+        second = self._save(2, edited)
+
+        self.assertEqual(b''.join(VersionControlService.read_version(first)), self.data)
+        self.assertEqual(b''.join(VersionControlService.read_version(second)), edited)
+        self.assertEqual(second.size, len(edited))
+        self.assertLessEqual(self._stored_chunks() - stored, 2)
+        shared = set(unpack_manifest(first.manifest)) & set(unpack_manifest(second.manifest))
+        self.assertTrue(ContentChunk.objects.filter(digest__in=[d for d, _ in shared], refcount=2).exists())
+
+    def test_deleting_versions_releases_chunks(self):
+        """Test chunks are removed once no version references them"""
+        first = self._save(1, self.data)
+        second = self._save(2, self.data + b'tail')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            VersionControlService.delete_version(first)
+        self.assertEqual(b''.join(VersionControlService.read_version(second)), self.data + b'tail')
+        self.assertFalse(ContentChunk.objects.filter(refcount__gt=1).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(ContentChunk.objects.exists())
+        self.assertEqual(self._stored_chunks(), 0)
+
+    def _stored_bytes(self):
+        data = b''
+        for directory, _, files in os.walk(os.path.join(get_chunk_store().root, 'sha256')):
+            for name in files:
+                with open(os.path.join(directory, name), 'rb') as f:
+                    data += f.read()
+        return data
+
+    def test_chunks_are_encrypted_and_scoped_to_their_owner(self):
+        """Test chunks hold no plaintext and identical content of another owner is stored again"""
+        self._save(1, self.data)
+        self.assertNotIn(self.data[10000:10064], self._stored_bytes())
+
+        stored = self._stored_chunks()
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        other_file = File.objects.create(name='doc.bin', owner=other)
+        version = FileVersion(file=other_file, version_number=1)
+        VersionControlService.save_version(ContentFile(self.data, name='doc.bin'), version)
+
+        self.assertEqual(self._stored_chunks(), 2 * stored)
+        self.assertEqual(b''.join(VersionControlService.read_version(version)), self.data)
+
+    def test_swapped_chunk_is_not_served(self):
+        """Test a chunk file replaced with other bytes fails authentication instead of being read"""
+        manifest = self._save(1, self.data).manifest
+        digest, size = unpack_manifest(manifest)[0]
+        path = get_chunk_store().path(get_chunk_store().ref_for_digest(digest))
+        with open(path, 'wb') as f:
+            f.write(self.data[:size])
+
+        with self.assertRaises(StreamDecryptionError):
+            b''.join(read_chunk(owner_key(self.user.pk), digest, 0, size))
+
+    def test_chunk_released_while_stored_again_survives(self):
+        """Test a chunk referenced again before its deletion runs is rewritten and kept"""
+        key = owner_key(self.user.pk)
+        manifest, _ = store_chunks([self.data], key)
+        with self.captureOnCommitCallbacks() as callbacks:
+            release_manifest(manifest)
+        # The deletion got as far as the blobs before the chunks were stored again
+        shutil.rmtree(os.path.join(get_chunk_store().root, 'sha256'))
+
+        manifest, _ = store_chunks([self.data], key)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(b''.join(iter_manifest(manifest, key)), self.data)
+        self.assertFalse(ContentChunk.objects.filter(refcount=0).exists())
@@ -0,0 +1,96 @@
+import os
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from ..compression import (
+    CODEC_DEFLATE, CODEC_NONE, CODEC_ZSTD, OUTPUT_CHUNK_SIZE, choose_codec, compress_chunks, decompress_chunks,
+    entropy, zstandard
+)
+from ..models import File
+from ..storage import get_blob_store
+from ..utils import (
+    HEADER_SIZE, MAX_HEADER_SIZE, StreamDecryptionError, decrypt_stream, decrypt_stream_range,
+    encrypt_stream, new_stream_header, stream_codec
+)
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+CSV = b''.join(b'%d,widget,%d.50,approved\n' % (n, n * 7) for n in range(20000))
+
+
+class CompressionTests(SimpleTestCase):
+    def test_codec_is_chosen_by_type_and_entropy(self):
+        """Test text compresses while known and sniffed incompressible content doesn't"""
+        self.assertGreater(entropy(os.urandom(65536)), 7.9)
+        self.assertLess(entropy(CSV), 5)
+
+        codec, chunks = choose_codec([CSV[:1000], CSV[1000:]], 'application/pdf')
+        self.assertEqual(codec, CODEC_DEFLATE)
+        self.assertEqual(b''.join(chunks), CSV)
+        self.assertEqual(choose_codec([CSV], 'application/zip')[0], CODEC_NONE)
+        self.assertEqual(choose_codec([os.urandom(100000)], 'text/plain')[0], CODEC_NONE)
+        self.assertEqual(choose_codec([b'tiny'], 'text/plain')[0], CODEC_NONE)
+        with override_settings(FILE_COMPRESSION=False):
+            self.assertEqual(choose_codec([CSV], 'text/csv')[0], CODEC_NONE)
+
+    def test_compressed_stream_round_trip(self):
+        """Test the codec is authenticated in the header and ranges decompress"""
+        key = os.urandom(32)
+        stream = b''.join(encrypt_stream([CSV], key, header=new_stream_header(codec=CODEC_DEFLATE)))
+        self.assertEqual(stream_codec(stream[:MAX_HEADER_SIZE]), CODEC_DEFLATE)
+        self.assertLess(len(stream), len(CSV) // 2)
+        self.assertEqual(b''.join(decrypt_stream([stream[:5], stream[5:]], key)), CSV)
+
+        read = lambda offset, length: [stream[offset:offset + length]]
+        self.assertEqual(b''.join(decrypt_stream_range(read, key, len(stream), 1000, 99999)), CSV[1000:100000])
+
+        # Claiming the stream is uncompressed breaks authentication
+        tampered = stream[:4] + b'\x01' + stream[5:HEADER_SIZE] + stream[MAX_HEADER_SIZE:]
+        with self.assertRaises(StreamDecryptionError):
+            b''.join(decrypt_stream([tampered], key))
+
+    def test_decompression_output_is_bounded(self):
+        """Test highly compressible content decompresses in pieces no larger than a segment"""
+        zeros = bytes(16 * 1024 * 1024)
+        for codec in [CODEC_DEFLATE] + ([CODEC_ZSTD] if zstandard else []):
+            compressed = list(compress_chunks(codec, [zeros]))
+            self.assertLess(sum(map(len, compressed)), OUTPUT_CHUNK_SIZE)
+            sizes = [len(piece) for piece in decompress_chunks(codec, compressed)]
+            self.assertEqual(sum(sizes), len(zeros))
+            self.assertLessEqual(max(sizes), OUTPUT_CHUNK_SIZE)
+
+
+class CompressedUploadTests(TemporaryStorageMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_text_uploads_are_stored_compressed(self):
+        """Test a CSV upload is compressed at rest and downloads whole and by range"""
+        response = self.client.post('/api/files/files/', {
+            'name': 'data.csv',
+            'file': SimpleUploadedFile('data.csv', CSV, content_type='text/csv')
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        file = File.objects.get(pk=response.data['id'])
+        self.assertLess(file.blob_size, len(CSV) // 2)
+        header = b''.join(get_blob_store().read_chunks(file.blob_ref, 0, MAX_HEADER_SIZE))
+        self.assertNotEqual(stream_codec(header), CODEC_NONE)
+
+        url = f'/api/files/files/{file.pk}/download/'
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Length'], str(len(CSV)))
+        self.assertEqual(b''.join(response.streaming_content), CSV)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=70000-70099')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 70000-70099/{len(CSV)}')
+        self.assertEqual(b''.join(response.streaming_content), CSV[70000:70100])
@@ -0,0 +1,139 @@
+import os
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from .. import convergent
+from ..compression import CODEC_NONE
+from ..keys import CURRENT_KEY_VERSION, KEY_VERSION_CONVERGENT
+from ..models import ConvergentBlob, File
+from ..previews import preview_path
+from ..storage import get_blob_store
+from ..utils import stream_codec
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+
+def tenant_by_domain(user):
+    return user.email.rpartition('@')[2]
+
+
+@override_settings(
+    CONVERGENT_ENCRYPTION=True,
+    CONVERGENT_ENCRYPTION_TENANT='secure_file_share.apps.files.tests.test_convergent.tenant_by_domain',
+)
+class ConvergentEncryptionTests(TemporaryStorageMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+
+    def _client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    def _upload(self, user, content, name='report.txt'):
+        response = self._client(user).post('/api/files/files/', {
+            'name': name,
+            'file': SimpleUploadedFile(name, content, content_type='text/plain')
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return File.objects.get(pk=response.data['id'])
+
+    def _download(self, user, file):
+        response = self._client(user).get(f'/api/files/files/{file.pk}/download/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content)
+
+    def test_identical_content_is_encrypted_and_stored_once(self):
+        """Test a second upload of the same content in a tenant reuses the blob without encrypting"""
+        colleague = User.objects.create_user(username='colleague', email='colleague@example.com', password='testpass123')
+        content = b'quarterly numbers' * 1000
+
+        with mock.patch.object(convergent, 'encrypt_stream', wraps=convergent.encrypt_stream) as encrypt:
+            first = self._upload(self.user, content)
+            second = self._upload(colleague, content, name='copy.txt')
+        self.assertEqual(encrypt.call_count, 1)
+
+        blob = ConvergentBlob.objects.get()
+        self.assertEqual(blob.refcount, 2)
+        self.assertEqual(first.convergent_blob_id, blob.pk)
+        self.assertEqual(second.blob_ref, first.blob_ref)
+        self.assertEqual(first.key_version, KEY_VERSION_CONVERGENT)
+        self.assertEqual(self._download(self.user, first), content)
+        self.assertEqual(self._download(colleague, second), content)
+
+    def test_tenants_do_not_share_blobs(self):
+        """Test the same content in two tenants is encrypted under different keys"""
+        outsider = User.objects.create_user(username='outsider', email='outsider@other.test', password='testpass123')
+        first = self._upload(self.user, b'same bytes')
+        second = self._upload(outsider, b'same bytes')
+
+        self.assertEqual(ConvergentBlob.objects.count(), 2)
+        self.assertNotEqual(first.blob_ref, second.blob_ref)
+        self.assertEqual(self._download(outsider, second), b'same bytes')
+
+    def test_blob_is_deleted_with_its_last_file(self):
+        """Test deleting files drops references and the last one removes the blob"""
+        first = self._upload(self.user, b'shared content')
+        second = self._upload(self.user, b'shared content', name='again.txt')
+        ref = first.blob_ref
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(ConvergentBlob.objects.get().refcount, 1)
+        self.assertTrue(get_blob_store().exists(ref))
+
+        preview = preview_path(first.blob_digest, 'thumb')
+        os.makedirs(os.path.dirname(preview), exist_ok=True)
+        open(preview, 'wb').close()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(ConvergentBlob.objects.exists())
+        self.assertFalse(get_blob_store().exists(ref))
+        self.assertFalse(os.path.exists(preview))
+
+    def test_content_stored_again_while_its_blob_is_deleted(self):
+        """Test an upload racing the deletion of the same content's blob keeps a readable blob"""
+        first = self._upload(self.user, b'shared content')
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+        # The deletion got as far as the blob before the next upload
+        get_blob_store().delete(first.blob_ref)
+
+        second = self._upload(self.user, b'shared content', name='again.txt')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(ConvergentBlob.objects.get().refcount, 1)
+        self.assertEqual(self._download(self.user, second), b'shared content')
+
+    def test_restored_blob_encrypts_the_same_bytes(self):
+        """Test a blob stored again after a compression change is the same uncompressed stream"""
+        content = b'a,b,c\n' * 10000
+        first = self._upload(self.user, content)
+        self.assertEqual(stream_codec(next(get_blob_store().read_chunks(first.blob_ref))), CODEC_NONE)
+        first.delete()
+        get_blob_store().delete(first.blob_ref)
+
+        with override_settings(FILE_COMPRESSION=False):
+            second = self._upload(self.user, content, name='again.txt')
+        self.assertEqual(second.blob_ref, first.blob_ref)
+        self.assertEqual(self._download(self.user, second), content)
+
+    def test_disabled_by_default(self):
+        """Test uploads use per-file keys when convergent encryption is off"""
+        with override_settings(CONVERGENT_ENCRYPTION=False):
+            first = self._upload(self.user, b'same bytes')
+            second = self._upload(self.user, b'same bytes')
+
+        self.assertFalse(ConvergentBlob.objects.exists())
+        self.assertEqual(first.key_version, CURRENT_KEY_VERSION)
+        self.assertNotEqual(first.blob_ref, second.blob_ref)
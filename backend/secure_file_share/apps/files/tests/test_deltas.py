@@ -0,0 +1,99 @@
+import random
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db.models import RestrictedError
+from django.test import TestCase, override_settings
+from ..deltas import map_cache
+from ..models import ContentChunk, File, FileVersion
+from ..services import VersionControlService
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+
+@override_settings(
+    VERSION_CHUNK_MIN_SIZE=2048,
+    VERSION_CHUNK_AVG_SIZE=8192,
+    VERSION_CHUNK_MAX_SIZE=32768,
+    VERSION_DELTA_BLOCK_SIZE=1024,
+    VERSION_KEYFRAME_INTERVAL=3,
+)
+class DeltaVersionTests(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        map_cache.clear()
+
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.file = File.objects.create(name='doc.bin', owner=self.user)
+        self.rng = random.Random(3)
+        self.contents = [self.rng.randbytes(128 * 1024)]
+
+    def _edit(self, data):
+        at = self.rng.randrange(len(data))
+        return data[:at] + b'changed' + data[at + 3:]
+
+    def _save_versions(self, count):
+        versions = []
+        for number in range(1, count + 1):
+            if number > len(self.contents):
+                self.contents.append(self._edit(self.contents[-1]))
+            version = FileVersion(file=self.file, version_number=number)
+            VersionControlService.save_version(
+                ContentFile(self.contents[number - 1], name='doc.bin'), version, delta=True
+            )
+            versions.append(version)
+        return versions
+
+    def _read(self, version):
+        return b''.join(VersionControlService.read_version(FileVersion.objects.get(pk=version.pk)))
+
+    def test_versions_round_trip_with_keyframes(self):
+        """Test deltas reconstruct every version and chains restart at keyframes"""
+        versions = self._save_versions(5)
+
+        self.assertEqual([v.chain_depth for v in versions], [0, 1, 2, 0, 1])
+        self.assertIsNone(versions[3].base)
+        self.assertEqual(versions[2].base, versions[1])
+        for version, content in zip(versions, self.contents):
+            self.assertEqual(self._read(version), content)
+        # A delta is stored as one small blob instead of a manifest of chunks
+        delta_size = ContentChunk.objects.get(digest=bytes(versions[1].manifest)[:32].hex()).size
+        self.assertLess(delta_size, 4096)
+
+    def test_unrelated_content_is_stored_as_a_keyframe(self):
+        """Test a version that is mostly new bytes is not stored as a delta"""
+        self.contents.append(self.rng.randbytes(128 * 1024))
+        versions = self._save_versions(2)
+
+        self.assertIsNone(versions[1].base)
+        self.assertEqual(self._read(versions[1]), self.contents[1])
+
+    def test_deleting_a_base_rebases_its_deltas(self):
+        """Test deleting a version's content turns its dependents into keyframes"""
+        versions = self._save_versions(3)
+        with self.assertRaises(RestrictedError):
+            FileVersion.objects.get(pk=versions[1].pk).delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            VersionControlService.delete_version(versions[1])
+        third = FileVersion.objects.get(pk=versions[2].pk)
+        self.assertIsNone(third.base)
+        self.assertEqual(third.chain_depth, 0)
+        self.assertEqual(self._read(third), self.contents[2])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.file.delete()
+        self.assertFalse(ContentChunk.objects.exists())
+
+    def test_cached_maps_survive_rebasing_an_ancestor(self):
+        """Test a deeper delta is still readable after the keyframe under its base is deleted"""
+        versions = self._save_versions(3)
+        self.assertEqual(self._read(versions[2]), self.contents[2])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            VersionControlService.delete_version(versions[0])
+        self.assertEqual(self._read(versions[2]), self.contents[2])
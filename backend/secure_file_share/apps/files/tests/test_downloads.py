@@ -0,0 +1,105 @@
+import os
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+from rest_framework import status
+from rest_framework.test import APITestCase
+from ..downloads import parse_range
+from ..models import File
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_range_forms(self):
+        """Test explicit, open-ended and suffix ranges"""
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=990-2000', 1000), (990, 999))
+
+    def test_ignored_and_unsatisfiable_ranges(self):
+        """Test malformed ranges are ignored and out-of-bounds ones rejected"""
+        self.assertIsNone(parse_range(None, 1000))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range('items=0-1', 1000))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=1000-', 1000)
+        with self.assertRaises(ValueError):
+            parse_range('bytes=5-1', 1000)
+
+
+class FileDownloadTests(TemporaryStorageMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        self.content = os.urandom(300 * 1024 + 123)
+        response = self.client.post(
+            '/api/files/files/',
+            {'name': 'movie.bin', 'file': SimpleUploadedFile('movie.bin', self.content)},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.file = File.objects.get()
+        self.url = f'/api/files/files/{self.file.id}/download/'
+
+    def test_full_download_streams_plaintext(self):
+        """Test a plain GET streams the whole decrypted file"""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_upload_is_only_stored_encrypted(self):
+        """Test the upload leaves no plaintext copy and is never echoed back"""
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                with open(os.path.join(directory, name), 'rb') as f:
+                    self.assertNotIn(self.content[:4096], f.read())
+
+        response = self.client.get(f'/api/files/files/{self.file.id}/')
+        self.assertNotIn('file', response.data)
+
+    def test_range_request_spanning_segments(self):
+        """Test a Range request returns only the requested bytes"""
+        start, end = 65530, 200000
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={start}-{end}')
+
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[start:end + 1])
+        self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{len(self.content)}')
+
+    def test_suffix_range_reads_final_segment(self):
+        """Test a suffix range covering the short final segment"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-500')
+
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[-500:])
+
+    def test_unsatisfiable_range(self):
+        """Test a range past the end of the file returns 416"""
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_conditional_requests(self):
+        """Test If-None-Match returns 304 and a stale If-Range ignores Range"""
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
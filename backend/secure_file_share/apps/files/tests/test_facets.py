@@ -0,0 +1,107 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from ..models import File
+
+User = get_user_model()
+
+MB = 1024 * 1024
+
+
+class SortAndFacetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.addCleanup(cache.clear)
+
+        now = timezone.now()
+        for name, content_type, size, age in [
+            ('report.pdf', 'application/pdf', 2 * MB, 0),
+            ('photo.jpg', 'image/jpeg', 20 * MB, 3),
+            ('clip.mp4', 'video/mp4', 50 * MB, 20),
+            ('notes.txt', 'text/plain', 100, 60),
+            ('archive.zip', 'application/zip', 100, 0),
+            ('banner.png', 'image/png', 5 * MB, 0),
+        ]:
+            file = File.objects.create(name=name, content_type=content_type, size=size, owner=self.user)
+            File.objects.filter(pk=file.pk).update(created_at=now - timedelta(days=age))
+
+    def _walk(self, url):
+        names = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            names.extend(item['name'] for item in response.data['results'])
+            url = response.data['next']
+        return names
+
+    def test_whitelisted_sort_keys_page_in_order(self):
+        """Test listings sort by whitelisted keys across cursor pages, ties broken by id"""
+        self.assertEqual(
+            self._walk('/api/files/files/?sort=name&page_size=4'),
+            ['archive.zip', 'banner.png', 'clip.mp4', 'notes.txt', 'photo.jpg', 'report.pdf']
+        )
+        sizes = [File.objects.get(name=name).size for name in self._walk('/api/files/files/?sort=-size&page_size=4')]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+
+        first = self.client.get('/api/files/files/?sort=name&page_size=4')
+        other_sort = self.client.get(first.data['next'].replace('sort=name', 'sort=size'))
+        self.assertEqual(other_sort.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_files_without_a_size_page_when_sorted_by_size(self):
+        """Test files from before sizes were recorded sort as smallest and keep paging"""
+        for name in ['old1.bin', 'old2.bin', 'old3.bin']:
+            File.objects.create(name=name, owner=self.user)
+
+        names = self._walk('/api/files/files/?sort=size&page_size=2')
+        self.assertEqual(len(names), 9)
+        self.assertEqual(sorted(names[:3]), ['old1.bin', 'old2.bin', 'old3.bin'])
+        self.assertEqual(self._walk('/api/files/files/?sort=-size&page_size=2')[-3:], names[:3][::-1])
+
+    def test_unknown_sort_key_is_rejected(self):
+        """Test sorting on a column outside the whitelist returns 400"""
+        response = self.client.get('/api/files/files/?sort=encryption_salt')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filters_apply_to_listing(self):
+        """Test type and size filters narrow the listing"""
+        names = self._walk('/api/files/files/?type=image&size=medium&sort=name')
+        self.assertEqual(names, ['banner.png'])
+
+    def test_facets_are_counted_in_one_query(self):
+        """Test type, size and date counts come from a single aggregate query"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/files/files/facets/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len([q for q in queries if 'files_file' in q['sql']]), 1)
+
+        self.assertEqual(response.data['total'], 6)
+        self.assertEqual(
+            response.data['type'],
+            {'document': 2, 'image': 2, 'video': 1, 'audio': 0, 'other': 1}
+        )
+        self.assertEqual(response.data['size'], {'small': 2, 'medium': 2, 'large': 2})
+        self.assertEqual(response.data['date']['week'], 4)
+        self.assertEqual(response.data['date']['month'], 5)
+
+    @override_settings(FILE_FACET_CACHE_TTL=60, FILE_FACET_CACHE_MIN_FILES=5)
+    def test_facets_are_cached_until_a_file_changes(self):
+        """Test facet counts are served from the cache and invalidated by changes"""
+        self.client.get('/api/files/files/facets/')
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get('/api/files/files/facets/')
+        self.assertEqual(cached.data['total'], 6)
+        self.assertFalse([q for q in queries if 'files_file' in q['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            File.objects.create(name='new.txt', content_type='text/plain', size=10, owner=self.user)
+        self.assertEqual(self.client.get('/api/files/files/facets/').data['total'], 7)
@@ -0,0 +1,91 @@
+import os
+import base64
+from unittest import mock
+from cryptography.exceptions import InvalidTag
+from django.test import SimpleTestCase, override_settings
+from ..keys import (
+    KEY_VERSION_ENVELOPE, KEY_VERSION_HKDF, KEY_VERSION_PBKDF2, DerivedKeyCache, derive_file_key,
+    key_cache, new_data_key, rewrap_key, wrap_key, wrapped_kek_version
+)
+from ..utils import generate_key
+
+
+class DerivedKeyCacheTests(SimpleTestCase):
+    def test_cached_keys_are_derived_once(self):
+        """Test that a cached key is not re-derived"""
+        cache = DerivedKeyCache(maxsize=4, ttl=60)
+        derive = mock.Mock(return_value=b'k' * 32)
+
+        self.assertEqual(cache.get('a', derive), b'k' * 32)
+        self.assertEqual(cache.get('a', derive), b'k' * 32)
+        self.assertEqual(derive.call_count, 1)
+
+    def test_evicted_keys_are_wiped(self):
+        """Test LRU eviction zeroes the evicted key material"""
+        cache = DerivedKeyCache(maxsize=1, ttl=60)
+        cache.get('a', lambda: b'a' * 32)
+        stored = cache._entries['a'][0]
+
+        cache.get('b', lambda: b'b' * 32)
+
+        self.assertNotIn('a', cache._entries)
+        self.assertEqual(stored, bytearray(32))
+        self.assertEqual(len(cache), 1)
+
+    def test_expired_keys_are_rederived(self):
+        """Test entries past their TTL are derived again"""
+        cache = DerivedKeyCache(maxsize=4, ttl=0)
+        derive = mock.Mock(return_value=b'k' * 32)
+
+        cache.get('a', derive)
+        cache.get('a', derive)
+        self.assertEqual(derive.call_count, 2)
+
+
+class DeriveFileKeyTests(SimpleTestCase):
+    def setUp(self):
+        key_cache.clear()
+
+    def test_hkdf_subkeys_are_per_salt(self):
+        """Test different salts yield different subkeys"""
+        first = derive_file_key(os.urandom(16), KEY_VERSION_HKDF)
+        second = derive_file_key(os.urandom(16), KEY_VERSION_HKDF)
+
+        self.assertEqual(len(first), 32)
+        self.assertNotEqual(first, second)
+
+    def test_legacy_rows_use_pbkdf2_keys(self):
+        """Test version 1 rows still derive the original PBKDF2 key"""
+        salt = os.urandom(16)
+        legacy_key, _ = generate_key(salt)
+
+        self.assertEqual(
+            base64.urlsafe_b64encode(derive_file_key(salt, KEY_VERSION_PBKDF2)),
+            legacy_key
+        )
+        self.assertNotEqual(
+            derive_file_key(salt, KEY_VERSION_PBKDF2),
+            derive_file_key(salt, KEY_VERSION_HKDF)
+        )
+
+
+@override_settings(ENCRYPTION_KEKS={1: 'first-kek', 2: 'second-kek'}, ENCRYPTION_KEK_VERSION=1)
+class WrappedKeyTests(SimpleTestCase):
+    def test_data_keys_unwrap_under_any_configured_kek(self):
+        """Test a wrapped data key survives re-wrapping under a new KEK"""
+        key, wrapped = new_data_key()
+        self.assertEqual(wrapped_kek_version(wrapped), 1)
+        self.assertEqual(derive_file_key(wrapped, KEY_VERSION_ENVELOPE), key)
+
+        rewrapped = rewrap_key(wrapped, 2)
+        self.assertEqual(wrapped_kek_version(rewrapped), 2)
+        with override_settings(ENCRYPTION_KEKS={2: 'second-kek'}):
+            self.assertEqual(derive_file_key(rewrapped, KEY_VERSION_ENVELOPE), key)
+            with self.assertRaises(ValueError):
+                derive_file_key(wrapped, KEY_VERSION_ENVELOPE)
+
+    def test_kek_version_is_authenticated(self):
+        """Test a record relabelled with another KEK version is rejected"""
+        wrapped = wrap_key(os.urandom(32))
+        with self.assertRaises(InvalidTag):
+            derive_file_key(b'\x00\x02' + wrapped[2:], KEY_VERSION_ENVELOPE)
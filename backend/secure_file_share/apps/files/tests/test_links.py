@@ -0,0 +1,147 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from ..links import InvalidShareToken, issue_token, revocations, verify_token
+from ..models import File, RevokedShareLink
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+
+class ShareTokenTests(SimpleTestCase):
+    def setUp(self):
+        # Nothing is revoked and the set is fresh, so no query is attempted
+        revocations.clear()
+        self.addCleanup(revocations.clear)
+        revocations._refreshed_at = float('inf')
+
+    def test_token_round_trip(self):
+        """Test a token carries the file, permission and expiry"""
+        file_id = '5f0c6a2e-8a41-4d3c-9a0e-2b1f3c4d5e6f'
+        token, link = issue_token(file_id, 'DOWNLOAD', ttl=3600)
+
+        self.assertLess(len(token), 70)
+        verified = verify_token(token)
+        self.assertEqual(verified, link)
+        self.assertEqual(str(verified.file_id), file_id)
+        self.assertEqual(verified.permission, 'DOWNLOAD')
+
+    def test_forged_expired_and_malformed_tokens(self):
+        """Test tampered, expired and garbage tokens are rejected"""
+        token, _ = issue_token('5f0c6a2e-8a41-4d3c-9a0e-2b1f3c4d5e6f', 'VIEW', ttl=3600)
+        tampered = token[:20] + ('A' if token[20] != 'A' else 'B') + token[21:]
+        expired, _ = issue_token('5f0c6a2e-8a41-4d3c-9a0e-2b1f3c4d5e6f', 'VIEW', ttl=-1)
+
+        for bad in (tampered, expired, 'bogus', token[:-4], ''):
+            with self.assertRaises(InvalidShareToken):
+                verify_token(bad)
+
+    def test_tokens_survive_key_rotation(self):
+        """Test tokens signed with a fallback secret key still verify"""
+        token, link = issue_token('5f0c6a2e-8a41-4d3c-9a0e-2b1f3c4d5e6f', 'VIEW', ttl=3600)
+        with override_settings(SECRET_KEY='rotated', SECRET_KEY_FALLBACKS=[settings.SECRET_KEY]):
+            self.assertEqual(verify_token(token), link)
+        with override_settings(SECRET_KEY='rotated', SECRET_KEY_FALLBACKS=[]):
+            with self.assertRaises(InvalidShareToken):
+                verify_token(token)
+
+
+class ShareLinkTests(TemporaryStorageMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        revocations.clear()
+        self.addCleanup(revocations.clear)
+
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post('/api/files/files/', {
+            'name': 'report.txt',
+            'file': SimpleUploadedFile('report.txt', b'quarterly numbers', content_type='text/plain')
+        }, format='multipart')
+        self.file = File.objects.get(pk=response.data['id'])
+        self.anonymous = APIClient()
+
+    def _link(self, permission='VIEW'):
+        response = self.client.post(
+            f'/api/files/files/{self.file.pk}/share-link/', {'permission': permission, 'expiration_hours': 1}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['token']
+
+    def test_invalid_expirations_are_rejected(self):
+        """Test non-numeric, non-finite and non-positive lifetimes return 400"""
+        url = f'/api/files/files/{self.file.pk}/share-link/'
+        for hours in ['soon', 'nan', 'inf', '-1', '0']:
+            response = self.client.post(url, {'expiration_hours': hours})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, hours)
+        self.assertEqual(self.client.post(url, {'permission': 'EDIT'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(url, {'expiration_hours': '1e306'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.post(url, {'expiration_hours': ''}).status_code, status.HTTP_201_CREATED)
+
+    def test_links_resolve_without_database_lookups(self):
+        """Test a valid link costs only the file fetch and a bad one no query at all"""
+        token = self._link()
+        revocations.refresh(force=True)
+
+        with self.assertNumQueries(1):
+            response = self.anonymous.get(f'/api/files/links/{token}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'report.txt')
+        self.assertEqual(response.data['permission'], 'VIEW')
+
+        with self.assertNumQueries(0):
+            response = self.anonymous.get(f'/api/files/links/{token[:-2]}xx/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_permission_is_enforced(self):
+        """Test view links can't download and download links stream the file"""
+        view_token = self._link('VIEW')
+        response = self.anonymous.get(f'/api/files/links/{view_token}/download/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        download_token = self._link('DOWNLOAD')
+        response = self.anonymous.get(f'/api/files/links/{download_token}/download/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), b'quarterly numbers')
+
+    def test_revoked_links_are_refused(self):
+        """Test revoking a link refuses it at once in this process"""
+        token = self._link()
+        response = self.client.delete(f'/api/files/files/{self.file.pk}/share-link/', {'token': token})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        with self.assertNumQueries(0):
+            response = self.anonymous.get(f'/api/files/links/{token}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_revocations_from_other_processes_are_picked_up(self):
+        """Test a revocation recorded elsewhere is seen on the next refresh"""
+        token = self._link()
+        revocations.refresh(force=True)
+        RevokedShareLink.objects.create(link_id=verify_token(token).link_id, expires=2 ** 40)
+
+        with override_settings(SHARE_LINK_REVOCATION_REFRESH=0):
+            response = self.anonymous.get(f'/api/files/links/{token}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_only_the_owner_manages_links(self):
+        """Test other users can't create links to or revoke links of a file"""
+        token = self._link()
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        client = APIClient()
+        client.force_authenticate(user=other)
+
+        response = client.post(f'/api/files/files/{self.file.pk}/share-link/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = client.delete(f'/api/files/files/{self.file.pk}/share-link/', {'token': token})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(RevokedShareLink.objects.exists())
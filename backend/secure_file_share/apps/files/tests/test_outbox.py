@@ -0,0 +1,136 @@
+import smtplib
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from secure_file_share.apps.sharing.models import FileShare
+from ..models import File, OutboundEmail
+from ..outbox import _template, deliver_outbox
+from ..services.notifications import ShareNotificationService
+
+User = get_user_model()
+
+
+class CountingBackend(EmailBackend):
+    """locmem backend that counts connections and refuses @bounce.test recipients."""
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if message.to[0].endswith('@bounce.test'):
+                raise smtplib.SMTPRecipientsRefused({message.to[0]: (550, b'No such user')})
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='secure_file_share.apps.files.tests.test_outbox.CountingBackend',
+    EMAIL_OUTBOX_AUTOSEND=False,
+)
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        CountingBackend.opened = 0
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.file = File.objects.create(name='plans.pdf', owner=self.user)
+
+    def _shares(self, count, domain='example.com'):
+        recipients = User.objects.bulk_create([
+            User(username=f'user{n}@{domain}', email=f'user{n}@{domain}') for n in range(count)
+        ])
+        return [FileShare(file=self.file, owner=self.user, shared_with=recipient) for recipient in recipients]
+
+    def test_many_recipients_are_queued_in_bulk_and_sent_over_one_connection(self):
+        """Test notifying many recipients costs a bulk INSERT and one connection per batch"""
+        shares = self._shares(250)
+        with CaptureQueriesContext(connection) as queries:
+            ShareNotificationService().send_share_notifications(shares, 'https://files.example.com/')
+        # One statement, split only by the database's parameter limit
+        self.assertLessEqual(len(queries), 3)
+        self.assertTrue(all(q['sql'].startswith('INSERT') for q in queries))
+        self.assertEqual(len(mail.outbox), 0)
+
+        with override_settings(EMAIL_OUTBOX_BATCH_SIZE=100):
+            self.assertEqual(deliver_outbox(), 250)
+        self.assertEqual(CountingBackend.opened, 3)
+        self.assertEqual(len(mail.outbox), 250)
+        self.assertFalse(OutboundEmail.objects.exclude(status='SENT').exists())
+
+        message = mail.outbox[0]
+        self.assertEqual(message.subject, 'testuser shared a file with you')
+        self.assertIn('plans.pdf', message.body)
+        self.assertNotIn('<p>', message.body)
+        self.assertEqual(message.alternatives[0][1], 'text/html')
+        self.assertGreater(_template.cache_info().hits, 0)
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        """Test a refused message backs off exponentially and fails after the last attempt"""
+        ShareNotificationService().send_share_notifications(self._shares(1, 'bounce.test'), '/')
+
+        with self.assertLogs('secure_file_share.apps.files.outbox', 'WARNING'):
+            self.assertEqual(deliver_outbox(), 0)
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('PENDING', 1))
+        self.assertIn('No such user', email.last_error)
+        first_delay = email.next_attempt_at - timezone.now()
+        self.assertAlmostEqual(first_delay.total_seconds(), 30, delta=5)
+
+        # Not due yet
+        self.assertEqual(deliver_outbox(), 0)
+        self.assertEqual(OutboundEmail.objects.get().attempts, 1)
+
+        with override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=3):
+            for attempts in (2, 3):
+                OutboundEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+                with self.assertLogs('secure_file_share.apps.files.outbox', 'WARNING'):
+                    deliver_outbox()
+                self.assertEqual(OutboundEmail.objects.get().attempts, attempts)
+        self.assertEqual(OutboundEmail.objects.get().status, 'FAILED')
+
+    def test_expired_claims_are_sent_again(self):
+        """Test messages left claimed by a crashed worker are delivered after the lease"""
+        ShareNotificationService().send_share_notifications(self._shares(1), '/')
+        OutboundEmail.objects.update(status='SENDING', next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(deliver_outbox(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_sharing_queues_a_notification(self):
+        """Test creating a share queues the email instead of sending it in the request"""
+        recipient = User.objects.create_user(username='friend', email='friend@example.com', password='testpass123')
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.post('/api/sharing/shares/', {'file': self.file.pk, 'shared_with': recipient.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.get().to, 'friend@example.com')
+
+        deliver_outbox()
+        self.assertEqual(mail.outbox[0].to, ['friend@example.com'])
+
+    def test_creating_a_share_link_queues_a_notification_with_its_expiry(self):
+        """Test the share link email names the date the link expires"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.post(f'/api/files/files/{self.file.pk}/share-link/', {'expiration_hours': 24})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(OutboundEmail.objects.get().to, 'test@example.com')
+
+        deliver_outbox()
+        expires_at = response.data['expires_at']
+        self.assertIn(response.data['url'], mail.outbox[0].alternatives[0][0])
+        self.assertIn(f'expire on {expires_at:%B} {expires_at.day}, {expires_at.year}', mail.outbox[0].body)
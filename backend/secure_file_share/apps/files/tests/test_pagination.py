@@ -0,0 +1,78 @@
+import base64
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from secure_file_share.apps.sharing.models import FileShare
+from ..models import File
+
+User = get_user_model()
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        now = timezone.now()
+        self.files = []
+        for i in range(7):
+            file = File.objects.create(name=f'file{i}.txt', owner=self.user)
+            # Pairs of files share a timestamp to exercise the id tie-breaker
+            File.objects.filter(pk=file.pk).update(created_at=now - timedelta(minutes=i // 2))
+            self.files.append(file)
+
+    def _walk(self, url, link='next'):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data[link]
+        return ids
+
+    def test_pages_cover_every_file_once(self):
+        """Test walking next links returns each file exactly once, newest first"""
+        ids = self._walk('/api/files/files/?page_size=3')
+
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(set(ids), {str(f.id) for f in self.files})
+        created = {str(f.id): f.created_at for f in File.objects.all()}
+        self.assertEqual(ids, sorted(ids, key=lambda i: (created[i], i), reverse=True))
+
+    def test_previous_links(self):
+        """Test paging back from the last page returns the earlier pages"""
+        first = self.client.get('/api/files/files/?page_size=3')
+        second = self.client.get(first.data['next'])
+        self.assertIsNone(first.data['previous'])
+
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_invalid_cursor(self):
+        """Test a garbage cursor is rejected"""
+        response = self.client.get('/api/files/files/?cursor=bogus')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        cursor = base64.urlsafe_b64encode(b'n|created_at|2020-01-01T00:00:00|notauuid').decode()
+        response = self.client.get(f'/api/files/files/?cursor={cursor}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_shared_files_are_paginated(self):
+        """Test the shared listing pages through files shared with the user"""
+        for file in self.files[:5]:
+            FileShare.objects.create(file=file, owner=self.user, shared_with=self.other)
+        self.client.force_authenticate(user=self.other)
+
+        ids = self._walk('/api/files/shared/?page_size=2')
+        self.assertEqual(sorted(ids), sorted(str(f.id) for f in self.files[:5]))
@@ -0,0 +1,99 @@
+import hashlib
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from ..models import File
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+
+def sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+class UploadPreflightTests(TemporaryStorageMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _upload(self, content, name='report.txt'):
+        response = self.client.post('/api/files/files/', {
+            'name': name,
+            'file': SimpleUploadedFile(name, content, content_type='text/plain')
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response
+
+    def test_upload_reports_plaintext_digest(self):
+        """Test an upload is stored with, and returns, the SHA-256 of its plaintext"""
+        content = b'quarterly numbers' * 1000
+        response = self._upload(content)
+
+        self.assertEqual(response.data['content_digest'], sha256(content))
+        self.assertEqual(File.objects.get(pk=response.data['id']).content_digest, sha256(content))
+
+    def test_preflight_splits_owned_and_missing_content(self):
+        """Test preflight reports which digests the user already has a file for"""
+        stored = self._upload(b'already here')
+        missing = sha256(b'not uploaded yet')
+
+        response = self.client.post('/api/files/files/preflight/', {
+            'digests': [sha256(b'already here').upper(), missing]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['existing'], {sha256(b'already here'): stored.data['id']})
+        self.assertEqual(response.data['missing'], [missing])
+
+    def test_preflight_only_sees_own_files(self):
+        """Test another user's identical content is reported as missing"""
+        self._upload(b'private content')
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        self.client.force_authenticate(user=other)
+
+        response = self.client.post('/api/files/files/preflight/', {
+            'digests': [sha256(b'private content')]
+        }, format='json')
+        self.assertEqual(response.data['existing'], {})
+        self.assertEqual(self.client.head(f'/api/files/files/by-digest/{sha256(b"private content")}/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    @override_settings(UPLOAD_PREFLIGHT_MAX_DIGESTS=2)
+    def test_preflight_rejects_malformed_or_oversized_requests(self):
+        """Test preflight validates the digests it is given"""
+        for body in [
+            {'digests': 'abc'},
+            {'digests': ['not-a-digest']},
+            {'digests': [sha256(b'a'), sha256(b'b'), sha256(b'c')]},
+            {},
+            [sha256(b'a')],
+        ]:
+            response = self.client.post('/api/files/files/preflight/', body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_head_by_digest(self):
+        """Test a HEAD on a digest answers whether the user has that content"""
+        self._upload(b'head me')
+
+        self.assertEqual(self.client.head(f'/api/files/files/by-digest/{sha256(b"head me")}/').status_code,
+                         status.HTTP_200_OK)
+        self.assertEqual(self.client.head(f'/api/files/files/by-digest/{sha256(b"nope")}/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_backfill_hashes_files_without_a_digest(self):
+        """Test the backfill command gives older files a content digest"""
+        content = b'stored before digests' * 500
+        file_id = self._upload(content).data['id']
+        File.objects.filter(pk=file_id).update(content_digest=None)
+
+        call_command('backfill_content_digests', stdout=StringIO())
+        self.assertEqual(File.objects.get(pk=file_id).content_digest, sha256(content))
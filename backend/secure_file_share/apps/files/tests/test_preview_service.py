@@ -0,0 +1,69 @@
+import itertools
+import unittest
+from io import BytesIO
+from django.test import SimpleTestCase
+from PIL import Image
+from ..services.preview import FilePreviewService, fitz
+
+
+class FilePreviewServiceTests(SimpleTestCase):
+    def _encode(self, image, fmt, **kwargs):
+        output = BytesIO()
+        image.save(output, format=fmt, **kwargs)
+        output.seek(0)
+        return output
+
+    def test_jpeg_preview_fits_target(self):
+        """Test a large JPEG is decoded at reduced scale and fits the preview size"""
+        source = self._encode(Image.new('RGB', (4000, 3000), (10, 120, 200)), 'JPEG')
+
+        preview = Image.open(BytesIO(FilePreviewService((400, 400)).generate_preview(source, 'image/jpeg')))
+        self.assertEqual(preview.format, 'JPEG')
+        self.assertEqual(preview.size, (400, 300))
+
+    def test_palette_images_are_converted(self):
+        """Test palette and transparent images produce RGB JPEG previews"""
+        source = self._encode(Image.new('RGBA', (1000, 500), (255, 0, 0, 128)).convert('P'), 'GIF')
+
+        preview = Image.open(BytesIO(FilePreviewService((200, 200)).generate_preview(source, 'image/gif')))
+        self.assertEqual(preview.mode, 'RGB')
+        self.assertEqual(preview.size, (200, 100))
+
+    @unittest.skipIf(fitz is None, 'PyMuPDF is not installed')
+    def test_pdf_is_rendered_at_target_scale(self):
+        """Test the first PDF page is rasterized directly at the preview size"""
+        document = fitz.open()
+        document.new_page(width=595, height=842)
+        source = BytesIO(document.tobytes())
+        # A client-chosen name that happens to be a server path is ignored
+        source.name = __file__
+
+        preview = Image.open(BytesIO(FilePreviewService((800, 800)).generate_preview(source, 'application/pdf')))
+        self.assertEqual(preview.size[1], 800)
+        self.assertLessEqual(preview.size[0], 566)
+
+    def test_text_preview_reads_a_bounded_prefix(self):
+        """Test text previews stop reading after the line and byte limits"""
+        consumed = []
+
+        def endless_log():
+            for n in itertools.count():
+                chunk = f'line {n}\n'.encode() * 100
+                consumed.append(len(chunk))
+                yield chunk
+
+        preview = FilePreviewService().generate_preview(endless_log(), 'text/plain').decode()
+        self.assertEqual(preview.splitlines(), ['line 0'] * 20)
+        self.assertLessEqual(sum(consumed), FilePreviewService.TEXT_PREVIEW_BYTES + 1024)
+
+        long_line = FilePreviewService().generate_preview(iter([b'x' * 10 ** 6]), 'text/plain')
+        self.assertEqual(len(long_line.decode()), FilePreviewService.TEXT_PREVIEW_LINE_LENGTH + 1)
+
+    def test_text_preview_detects_charset(self):
+        """Test BOM-marked UTF-16 and legacy single-byte text are decoded"""
+        service = FilePreviewService()
+        utf16 = 'caf\u00e9\nna\u00efve'.encode('utf-16')
+        self.assertEqual(service.generate_preview(BytesIO(utf16), 'text/plain').decode(), 'caf\u00e9\nna\u00efve')
+
+        cp1252 = 'price: 10\u20ac'.encode('cp1252')
+        self.assertEqual(service.generate_preview([cp1252], 'text/plain').decode(), 'price: 10\u20ac')
@@ -0,0 +1,90 @@
+from io import BytesIO
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+from ..models import File
+from ..previews import plaintext_chunks, preview_path, queue_previews
+from ..utils import is_encrypted_stream
+from ..workers import get_preview_pool
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+
+class PreviewPipelineTests(TemporaryStorageMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _upload(self, name, content, content_type):
+        response = self.client.post('/api/files/files/', {
+            'name': name,
+            'file': SimpleUploadedFile(name, content, content_type=content_type)
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(get_preview_pool().drain(timeout=10))
+        return File.objects.get(pk=response.data['id'])
+
+    def _png(self):
+        output = BytesIO()
+        Image.new('RGB', (1200, 900), (200, 30, 30)).save(output, format='PNG')
+        return output.getvalue()
+
+    def test_previews_are_rendered_on_upload_and_stored_encrypted(self):
+        """Test every preset is rendered in the background and cached encrypted"""
+        file = self._upload('photo.png', self._png(), 'image/png')
+
+        for preset in ('thumbnail', 'medium'):
+            with open(preview_path(file.blob_digest, preset), 'rb') as f:
+                self.assertTrue(is_encrypted_stream(f.read(16)))
+
+        response = self.client.get(f'/api/files/files/{file.id}/preview/?size=thumbnail')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('max-age', response['Cache-Control'])
+        image = Image.open(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(image.size, (200, 150))
+
+        cached = self.client.get(
+            f'/api/files/files/{file.id}/preview/?size=thumbnail',
+            HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_existing_previews_are_not_rendered_again(self):
+        """Test queueing a file whose previews exist submits no work"""
+        file = self._upload('photo.png', self._png(), 'image/png')
+        submitted = get_preview_pool().metrics()['submitted']
+
+        queue_previews(file)
+        self.assertEqual(get_preview_pool().metrics()['submitted'], submitted)
+
+    def test_unsupported_types_and_sizes(self):
+        """Test files without a renderer return 404 and unknown sizes 400"""
+        file = self._upload('data.bin', b'\x00' * 100, 'application/octet-stream')
+
+        response = self.client.get(f'/api/files/files/{file.id}/preview/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(f'/api/files/files/{file.id}/preview/?size=huge')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_text_preview_decrypts_only_the_first_segments(self):
+        """Test a large text upload is previewed from a short decrypted prefix"""
+        content = b''.join(f'{n:08d} log entry\n'.encode() for n in range(100000))
+        file = self._upload('app.log', content, 'text/plain')
+
+        self.assertLessEqual(sum(map(len, plaintext_chunks(file, 100))), 100)
+        response = self.client.get(f'/api/files/files/{file.id}/preview/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, [f'{n:08d} log entry' for n in range(20)])
@@ -0,0 +1,113 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+from ..models import File, SearchDocument
+from ..search import FallbackSearchBackend, search
+from ..services.search import FileSearchService
+from ..workers import get_preview_pool
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+
+@override_settings(PREVIEW_ON_UPLOAD=False)
+class SearchIndexTests(TemporaryStorageMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _upload(self, name, content=b'data', content_type='text/plain'):
+        response = self.client.post('/api/files/files/', {
+            'name': name,
+            'file': SimpleUploadedFile(name, content, content_type=content_type)
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(get_preview_pool().drain(timeout=10))
+        return File.objects.get(pk=response.data['id'])
+
+    def _hits(self, query, user=None):
+        return [file_id for file_id, _, _ in search(user or self.user, query)]
+
+    def test_content_is_indexed_and_name_matches_rank_first(self):
+        """Test text content is searchable and name matches outrank content matches"""
+        in_body = self._upload('notes.txt', b'meeting about the quarterly budget\n')
+        in_name = self._upload('budget.txt', b'numbers\n')
+        self._upload('other.txt', b'nothing relevant\n')
+
+        self.assertEqual(self._hits('budget'), [in_name.pk, in_body.pk])
+        self.assertEqual(self._hits('quarterly budget'), [in_body.pk])
+
+    def test_terms_match_as_prefixes(self):
+        """Test partial words match and query syntax is treated as text"""
+        file = self._upload('invoice-2023.txt')
+
+        self.assertEqual(self._hits('invo'), [file.pk])
+        self.assertEqual(self._hits('"invo" OR NOT'), [])
+        self.assertEqual(self._hits('***'), [])
+
+    def test_results_are_scoped_to_owner(self):
+        """Test a user never sees another user's files in search results"""
+        self._upload('secret-plans.txt')
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+
+        self.assertEqual(self._hits('secret', user=other), [])
+
+    def test_rename_and_delete_update_the_index(self):
+        """Test renamed files are found by their new name and deleted files disappear"""
+        file = self._upload('draft.txt')
+        file.name = 'final.txt'
+        file.save()
+
+        self.assertEqual(self._hits('draft'), [])
+        self.assertEqual(self._hits('final'), [file.pk])
+
+        file.delete()
+        self.assertEqual(self._hits('final'), [])
+        self.assertFalse(SearchDocument.objects.exists())
+
+    def test_text_filter_keeps_every_match(self):
+        """Test listings filter on the index with a subquery rather than a list of top hits"""
+        ids = {self._upload(f'report-{n}.txt').pk for n in range(5)}
+        self._upload('other.txt')
+
+        files = FileSearchService().filter_text(File.objects.all(), 'report', owner=self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(set(files.values_list('pk', flat=True)), ids)
+        self.assertEqual(len(FallbackSearchBackend().matches(self.user.pk, ['report'])), 5)
+
+        seen = []
+        url = '/api/files/files/?search=report&page_size=2'
+        while url:
+            response = self.client.get(url)
+            seen += [result['id'] for result in response.data['results']]
+            url = response.data['next']
+        self.assertEqual({str(file_id) for file_id in ids}, set(map(str, seen)))
+
+    def test_search_endpoint_pages_with_a_cursor(self):
+        """Test the search endpoint returns ranked pages linked by cursors"""
+        ids = {self._upload(f'report-{n}.txt').pk for n in range(5)}
+
+        seen = []
+        url = '/api/files/files/search/?q=report&page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            for result in response.data['results']:
+                self.assertIn('score', result)
+                seen.append(result['id'])
+            url = response.data['next']
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual({str(file_id) for file_id in ids}, set(map(str, seen)))
+
+        response = self.client.get('/api/files/files/search/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from ..models import File
+
+User = get_user_model()
+
+
+class FileListRepresentationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        File.objects.create(
+            name='report.csv',
+            owner=self.user,
+            encrypted_file=b'x' * 1024,
+            blob_digest='ab' * 32,
+            size=1000,
+            content_type='text/csv',
+        )
+
+    def test_list_returns_metadata_only(self):
+        """Test list responses never include or load the ciphertext"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/files/files/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        item = response.data['results'][0]
+        self.assertNotIn('encrypted_file', item)
+        self.assertEqual(item['size'], 1000)
+        self.assertEqual(item['content_type'], 'text/csv')
+        self.assertEqual(item['digest'], 'ab' * 32)
+        self.assertFalse(any('encrypted_file' in query['sql'] for query in queries.captured_queries))
+
+    def test_sparse_fieldsets(self):
+        """Test ?fields= limits the returned fields"""
+        response = self.client.get('/api/files/files/', {'fields': 'id,name'})
+
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
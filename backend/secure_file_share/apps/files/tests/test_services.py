@@ -1,7 +1,6 @@
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from ..services.encryption import FileEncryptionService
-from ..services.file_handler import FileHandler
 from ..services.sharing import FileShareService
 
 User = get_user_model()
@@ -14,7 +13,6 @@ class ServiceTests(TestCase):
             password='testpass123'
         )
         self.encryption_service = FileEncryptionService()
-        self.file_handler = FileHandler()
         self.share_service = FileShareService()
 
     def test_file_encryption(self):
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, SimpleTestCase, override_settings
+from ..models import File
+from ..storage import LocalBlobStore, get_blob_store
+from ..utils import decrypt_chunks, encrypt_file
+
+User = get_user_model()
+
+
+class LocalBlobStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.store = LocalBlobStore(self.root)
+
+    def test_blobs_are_content_addressed(self):
+        """Test blobs are sharded by digest and identical content is stored once"""
+        data = os.urandom(300 * 1024)
+        digest = hashlib.sha256(data).hexdigest()
+
+        blob = self.store.save([data[:1000], data[1000:]])
+        again = self.store.save([data])
+
+        self.assertEqual(blob.digest, digest)
+        self.assertEqual(blob.size, len(data))
+        self.assertEqual(blob.ref, f'sha256/{digest[:2]}/{digest[2:4]}/{digest}')
+        self.assertEqual(again.ref, blob.ref)
+        self.assertEqual(os.listdir(self.store.tmp_dir), [])
+
+    def test_range_reads(self):
+        """Test reading a slice of a blob"""
+        data = bytes(range(256)) * 10
+        blob = self.store.save([data])
+
+        self.assertEqual(b''.join(self.store.read_chunks(blob.ref)), data)
+        self.assertEqual(b''.join(self.store.read_chunks(blob.ref, 100, 50, chunk_size=7)), data[100:150])
+
+    def test_refs_cannot_escape_root(self):
+        """Test that references are confined to the store root"""
+        with self.assertRaises(ValueError):
+            self.store.path('../outside')
+
+
+class BlobMigrationTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.settings_override = override_settings(BLOB_ROOT=self.root, BLOB_STORE={})
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+
+    def test_migrate_blobs_moves_legacy_rows(self):
+        """Test migrate_blobs copies BinaryField ciphertext into the store"""
+        content = b'legacy content' * 1000
+        encrypted, salt = encrypt_file(content)
+        file = File.objects.create(
+            name='legacy.txt',
+            owner=self.user,
+            encrypted_file=encrypted,
+            encryption_salt=salt,
+        )
+
+        call_command('migrate_blobs', batch_size=1, stdout=open(os.devnull, 'w'))
+
+        file.refresh_from_db()
+        self.assertIsNone(file.encrypted_file)
+        self.assertEqual(file.blob_size, len(encrypted))
+        self.assertTrue(get_blob_store().exists(file.blob_ref))
+        self.assertEqual(
+            b''.join(decrypt_chunks(file.encrypted_chunks(), file.encryption_salt, file.key_version)),
+            content
+        )
+
+    def test_deleting_file_removes_blob(self):
+        """Test the blob is removed once its row is deleted"""
+        blob = get_blob_store().save([b'ciphertext'])
+        file = File.objects.create(name='a.txt', owner=self.user, blob_ref=blob.ref)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            file.delete()
+
+        self.assertFalse(get_blob_store().exists(blob.ref))
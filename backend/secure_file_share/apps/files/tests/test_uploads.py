@@ -0,0 +1,112 @@
+import hashlib
+import os
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from ..models import File, UploadSession
+from ..storage import get_blob_store
+from ..uploads import purge_stale_sessions, session_dir
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+
+class ResumableUploadTests(TemporaryStorageMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.content = os.urandom(200 * 1024 + 17)
+
+    def _create(self):
+        response = self.client.post(
+            '/api/files/uploads/',
+            {'name': 'big.bin', 'size': len(self.content), 'content_type': 'application/octet-stream'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return f"/api/files/uploads/{response.data['id']}/"
+
+    def _put(self, url, offset, data):
+        return self.client.put(
+            url, data, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_chunked_upload_round_trip(self):
+        """Test uploading in uneven chunks, completing and downloading"""
+        url = self._create()
+        offset = 0
+        for size in (1000, 70000, 65536, 100):
+            response = self._put(url, offset, self.content[offset:offset + size])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            offset += size
+            self.assertEqual(response['Upload-Offset'], str(offset))
+        self._put(url, offset, self.content[offset:])
+
+        response = self.client.post(url + 'complete/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        file = File.objects.get()
+        self.assertEqual(file.name, 'big.bin')
+        ciphertext = b''.join(get_blob_store().read_chunks(file.blob_ref))
+        self.assertEqual(file.blob_digest, hashlib.sha256(ciphertext).hexdigest())
+        download = self.client.get(f'/api/files/files/{file.id}/download/')
+        self.assertEqual(b''.join(download.streaming_content), self.content)
+        self.assertFalse(os.path.exists(session_dir(UploadSession.objects.get())))
+
+    def test_wrong_offset_reports_resume_point(self):
+        """Test a chunk at the wrong offset is rejected with the expected offset"""
+        url = self._create()
+        self._put(url, 0, self.content[:5000])
+
+        response = self._put(url, 4000, self.content[4000:9000])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 5000)
+        self.assertEqual(self.client.get(url).data['offset'], 5000)
+
+    def test_incomplete_and_oversized_uploads_are_rejected(self):
+        """Test completing early or sending too much data fails"""
+        url = self._create()
+        self._put(url, 0, self.content[:10])
+
+        self.assertEqual(self.client.post(url + 'complete/').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self._put(url, 10, self.content[10:] + b'extra')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # The failed request left nothing behind; the upload can still finish
+        self._put(url, 10, self.content[10:])
+        self.assertEqual(self.client.post(url + 'complete/').status_code, status.HTTP_201_CREATED)
+        download = self.client.get(f'/api/files/files/{File.objects.get().id}/download/')
+        self.assertEqual(b''.join(download.streaming_content), self.content)
+
+    def test_retry_after_abandoned_request_uses_fresh_nonces(self):
+        """Test segments sealed by a request that never committed are never re-sealed under the same nonces"""
+        url = self._create()
+        self._put(url, 0, self.content[:1000])
+        header = bytes(UploadSession.objects.get().stream_header)
+
+        # Seals two segments, then fails on the declared size
+        response = self._put(url, 1000, os.urandom(len(self.content)))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(bytes(UploadSession.objects.get().stream_header), header)
+
+        self._put(url, 1000, self.content[1000:])
+        self.assertNotEqual(bytes(UploadSession.objects.get().stream_header), header)
+        self.assertEqual(self.client.post(url + 'complete/').status_code, status.HTTP_201_CREATED)
+        download = self.client.get(f'/api/files/files/{File.objects.get().id}/download/')
+        self.assertEqual(b''.join(download.streaming_content), self.content)
+
+    def test_stale_sessions_are_purged(self):
+        """Test the GC sweep removes idle sessions and their staging files"""
+        self._create()
+        session = UploadSession.objects.get()
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(purge_stale_sessions(), 1)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(session_dir(session)))
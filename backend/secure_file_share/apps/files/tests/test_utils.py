@@ -0,0 +1,65 @@
+import os
+from cryptography.fernet import Fernet
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+from ..keys import CURRENT_KEY_VERSION, KEY_VERSION_PBKDF2
+from ..utils import (
+    HEADER_SIZE, TAG_SIZE, StreamDecryptionError, decrypt_file, decrypt_stream,
+    encrypt_file, encrypt_stream, generate_key
+)
+
+
+class StreamEncryptionTests(SimpleTestCase):
+    def setUp(self):
+        self.key = os.urandom(32)
+
+    def _encrypt(self, data, segment_size=1024):
+        return b''.join(encrypt_stream([data], self.key, segment_size=segment_size))
+
+    def test_round_trip_across_segments(self):
+        """Test that multi-segment streams decrypt back to the plaintext"""
+        data = os.urandom(10 * 1024 + 7)
+        encrypted = self._encrypt(data)
+
+        self.assertEqual(len(encrypted), HEADER_SIZE + len(data) + 11 * TAG_SIZE)
+
+        # Feed the ciphertext back in chunks that don't line up with segments
+        chunks = [encrypted[i:i + 777] for i in range(0, len(encrypted), 777)]
+        self.assertEqual(b''.join(decrypt_stream(chunks, self.key)), data)
+
+    def test_empty_and_exact_segment_inputs(self):
+        """Test boundary sizes produce a single authenticated final segment"""
+        for data in (b'', os.urandom(1024), os.urandom(2048)):
+            encrypted = self._encrypt(data)
+            self.assertEqual(b''.join(decrypt_stream([encrypted], self.key)), data)
+
+    def test_tampered_segment_is_rejected(self):
+        """Test that flipping a ciphertext bit fails authentication"""
+        encrypted = bytearray(self._encrypt(os.urandom(4096)))
+        encrypted[HEADER_SIZE + 10] ^= 1
+
+        with self.assertRaises(StreamDecryptionError):
+            b''.join(decrypt_stream([bytes(encrypted)], self.key))
+
+    def test_truncated_stream_is_rejected(self):
+        """Test that dropping the final segment is detected"""
+        encrypted = self._encrypt(os.urandom(4096))
+        truncated = encrypted[:HEADER_SIZE + 2 * (1024 + TAG_SIZE)]
+
+        with self.assertRaises(StreamDecryptionError):
+            b''.join(decrypt_stream([truncated], self.key))
+
+    def test_encrypt_file_consumes_uploaded_chunks(self):
+        """Test encrypt_file/decrypt_file with an uploaded file"""
+        content = os.urandom(200 * 1024)
+        upload = SimpleUploadedFile('big.bin', content)
+
+        encrypted, salt = encrypt_file(upload)
+        self.assertEqual(decrypt_file(encrypted, salt, CURRENT_KEY_VERSION), content)
+
+    def test_legacy_fernet_payloads_still_decrypt(self):
+        """Test rows written before the stream format still decrypt"""
+        key, salt = generate_key()
+        legacy = Fernet(key).encrypt(b'legacy content')
+
+        self.assertEqual(decrypt_file(legacy, salt, KEY_VERSION_PBKDF2), b'legacy content')
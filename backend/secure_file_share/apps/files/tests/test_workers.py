@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from ..models import File
+from ..workers import (
+    WorkerPool, PoolSaturated, file_processed, get_worker_pool, recover_pending_files, staging_path
+)
+from .mixins import TemporaryStorageMixin
+
+User = get_user_model()
+
+
+class WorkerPoolTests(TransactionTestCase):
+    def test_submit_raises_when_saturated(self):
+        """Test the pool rejects work once every slot is taken"""
+        pool = WorkerPool(max_workers=1, max_pending=1, submit_timeout=0.01)
+        release = threading.Event()
+        pool.submit(release.wait)
+
+        with self.assertRaises(PoolSaturated):
+            pool.submit(lambda: None)
+
+        release.set()
+        self.assertTrue(pool.drain(timeout=5))
+        metrics = pool.metrics()
+        self.assertEqual(metrics['completed'], 1)
+        self.assertEqual(metrics['rejected'], 1)
+        self.assertEqual(metrics['queue_depth'], 0)
+
+
+@override_settings(ASYNC_FILE_ENCRYPTION=True)
+class AsyncUploadTests(TemporaryStorageMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_upload_is_encrypted_in_the_background(self):
+        """Test an async upload is accepted as PENDING and becomes downloadable"""
+        processed = []
+        handler = lambda sender, file, **kwargs: processed.append(file.status)
+        file_processed.connect(handler)
+        self.addCleanup(file_processed.disconnect, handler)
+        content = os.urandom(100 * 1024)
+
+        response = self.client.post('/api/files/files/', {
+            'name': 'async.bin',
+            'file': SimpleUploadedFile('async.bin', content)
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'PENDING')
+
+        self.assertTrue(get_worker_pool().drain(timeout=10))
+        file = File.objects.get()
+        self.assertEqual(file.status, 'READY')
+        self.assertEqual(processed, ['READY'])
+
+        download = self.client.get(f'/api/files/files/{file.id}/download/')
+        self.assertEqual(b''.join(download.streaming_content), content)
+
+    def test_pending_file_cannot_be_downloaded(self):
+        """Test downloading a file that is still being encrypted returns 409"""
+        file = File.objects.create(name='pending.bin', owner=self.user, status='PENDING')
+
+        response = self.client.get(f'/api/files/files/{file.id}/download/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_worker_metrics_are_staff_only(self):
+        """Test only staff can read the worker pool metrics"""
+        response = self.client.get('/api/files/files/worker-metrics/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/files/files/worker-metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('queue_depth', response.data)
+
+    def test_files_left_pending_by_a_dead_worker_are_recovered(self):
+        """Test the sweep encrypts staged pending files, fails the rest and removes orphaned copies"""
+        content = os.urandom(10000)
+        staged = File.objects.create(name='staged.bin', owner=self.user, size=len(content), status='PENDING')
+        lost = File.objects.create(name='lost.bin', owner=self.user, status='PENDING')
+        File.objects.create(name='fresh.bin', owner=self.user, status='PENDING')
+        File.objects.filter(pk__in=[staged.pk, lost.pk]).update(updated_at=timezone.now() - timedelta(hours=2))
+        os.makedirs(os.path.join(self.root, 'staging'))
+        with open(staging_path(staged.pk), 'wb') as f:
+            f.write(content)
+        orphan = staging_path('orphan')
+        with open(orphan, 'wb') as f:
+            f.write(b'left behind')
+        os.utime(orphan, (time.time() - 7200, time.time() - 7200))
+
+        self.assertEqual(recover_pending_files(3600), (1, 1, 1))
+        statuses = dict(File.objects.values_list('name', 'status'))
+        self.assertEqual(statuses, {'staged.bin': 'READY', 'lost.bin': 'FAILED', 'fresh.bin': 'PENDING'})
+        self.assertEqual(os.listdir(os.path.join(self.root, 'staging')), [])
+        download = self.client.get(f'/api/files/files/{staged.id}/download/')
+        self.assertEqual(b''.join(download.streaming_content), content)
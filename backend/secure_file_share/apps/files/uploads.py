@@ -0,0 +1,239 @@
+"""
+Resumable uploads.
+
+    POST   /api/files/uploads/                create a session ({name, size, content_type})
+    PUT    /api/files/uploads/<id>/           append raw bytes at the `Upload-Offset` header
+    GET    /api/files/uploads/<id>/           current offset to resume from
+    POST   /api/files/uploads/<id>/complete/  turn the session into a File
+
+Every PUT is encrypted as it arrives: full segments are sealed and appended
+to the session's staging file, and the short remainder is kept as an
+encrypted tail named after the offset it ends at. The database row is the
+source of truth, so a request that dies half way leaves nothing a retry at
+the same offset can't repair. Completing a session seals the tail as the
+final segment and hands the staging file to the blob store without copying.
+
+A request that dies after sealing segments has used nonces that a retry
+would use again, perhaps for different bytes. So before appending, a
+session whose staging file holds such uncommitted segments is moved to a
+fresh nonce prefix, re-sealing its committed segments into a new staging
+file named after it.
+"""
+import hashlib
+import os
+import shutil
+from datetime import timedelta
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .keys import derive_file_key, key_fields, new_data_key
+from .models import File, UploadSession
+from .storage import BlobInfo, get_blob_store
+from .utils import HEADER_SIZE, TAG_SIZE, new_stream_header, open_segment, parse_stream_header, seal_segment
+
+
+class UploadError(ValueError):
+    """Raised when a chunk or completion request is not valid for the session."""
+
+
+class UploadOffsetMismatch(UploadError):
+    def __init__(self, expected):
+        super().__init__(f'Expected upload offset {expected}')
+        self.expected = expected
+
+
+def session_dir(session):
+    return os.path.join(settings.UPLOAD_SESSION_ROOT, str(session.pk))
+
+
+def _data_path(session, header=None):
+    _, nonce_prefix = parse_stream_header(bytes(header or session.stream_header))
+    return os.path.join(session_dir(session), f'data-{nonce_prefix.hex()}')
+
+
+def _tail_path(session, offset):
+    return os.path.join(session_dir(session), f'tail-{offset}')
+
+
+def _tail_aad(session, offset):
+    return session.pk.bytes + offset.to_bytes(8, 'big')
+
+
+def _read_tail(session, key):
+    try:
+        with open(_tail_path(session, session.received), 'rb') as f:
+            sealed = f.read()
+    except FileNotFoundError:
+        return b''
+    return AESGCM(key).decrypt(sealed[:12], sealed[12:], _tail_aad(session, session.received))
+
+
+def _write_tail(session, key, offset, data):
+    # Tails are re-encrypted on every request, so each gets a random nonce
+    nonce = os.urandom(12)
+    sealed = nonce + AESGCM(key).encrypt(nonce, bytes(data), _tail_aad(session, offset))
+    path = _tail_path(session, offset)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(sealed)
+    os.replace(path + '.tmp', path)
+
+
+def _committed_size(session, segment_size):
+    return HEADER_SIZE + session.segments_written * (segment_size + TAG_SIZE)
+
+
+def _open_staging(session, segment_size):
+    """Open the staging file positioned after the last committed segment."""
+    data = open(_data_path(session), 'r+b')
+    # Drop anything written by a request that never committed
+    data.truncate(_committed_size(session, segment_size))
+    data.seek(0, os.SEEK_END)
+    return data
+
+
+def _renew_nonce_prefix(session, key):
+    """
+    Re-seal the committed segments under a fresh header if an abandoned
+    request left sealed segments behind.
+
+    Returns `(header, old_path)`: the header to append with and the staging
+    file to remove once the transaction holding the session lock commits
+    (None if nothing changed). Until then the old file is kept, so a
+    rollback leaves the session as it was.
+    """
+    header = bytes(session.stream_header)
+    segment_size, _ = parse_stream_header(header)
+    old_path = _data_path(session)
+    if os.path.getsize(old_path) <= _committed_size(session, segment_size):
+        return header, None
+
+    new_header = new_stream_header(segment_size)
+    with open(old_path, 'rb') as old, open(_data_path(session, new_header), 'wb') as new:
+        old.seek(HEADER_SIZE)
+        new.write(new_header)
+        for index in range(session.segments_written):
+            plaintext = open_segment(key, header, index, old.read(segment_size + TAG_SIZE), False)
+            new.write(seal_segment(key, new_header, index, plaintext, False))
+    session.stream_header = new_header
+    return new_header, old_path
+
+
+def _sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_session(owner, name, total_size, content_type=''):
+    session = UploadSession.objects.create(
+        owner=owner,
+        name=name,
+        content_type=content_type,
+        total_size=total_size,
+        stream_header=new_stream_header(),
+        **key_fields(new_data_key()[1])
+    )
+    os.makedirs(session_dir(session), exist_ok=True)
+    with open(_data_path(session), 'wb') as f:
+        f.write(bytes(session.stream_header))
+    return session
+
+
+def append_chunk(session_id, owner, offset, chunks):
+    """Encrypt and persist `chunks` at `offset`; returns the updated session."""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(
+            pk=session_id, owner=owner, status='ACTIVE'
+        )
+        if offset != session.received:
+            raise UploadOffsetMismatch(session.received)
+
+        key = derive_file_key(session.encryption_salt, session.key_version)
+        header, abandoned = _renew_nonce_prefix(session, key)
+        segment_size, _ = parse_stream_header(header)
+        buffer = bytearray(_read_tail(session, key))
+        index = session.segments_written
+        received = session.received
+
+        with _open_staging(session, segment_size) as data:
+            for chunk in chunks:
+                received += len(chunk)
+                if received > session.total_size:
+                    raise UploadError('Upload exceeds the declared size')
+                buffer += chunk
+                # Keep at least one byte back; only completion may seal the final segment
+                while len(buffer) > segment_size:
+                    data.write(seal_segment(key, header, index, buffer[:segment_size], False))
+                    del buffer[:segment_size]
+                    index += 1
+
+        _write_tail(session, key, received, buffer)
+        previous_tail = _tail_path(session, session.received)
+        session.received = received
+        session.segments_written = index
+        session.save(update_fields=['received', 'segments_written', 'stream_header', 'updated_at'])
+
+    for path in (previous_tail, abandoned):
+        if path and os.path.exists(path):
+            os.remove(path)
+    return session
+
+
+def complete_session(session_id, owner):
+    """Seal the final segment, move the staging file into the blob store and create the File."""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(
+            pk=session_id, owner=owner, status='ACTIVE'
+        )
+        if session.received != session.total_size:
+            raise UploadError(f'Upload is incomplete: {session.received} of {session.total_size} bytes')
+
+        key = derive_file_key(session.encryption_salt, session.key_version)
+        header = bytes(session.stream_header)
+        segment_size, _ = parse_stream_header(header)
+        sealed = seal_segment(key, header, session.segments_written, _read_tail(session, key), True)
+        with _open_staging(session, segment_size) as data:
+            data.write(sealed)
+            blob_size = data.tell()
+
+        # Blobs are addressed by the SHA-256 of their ciphertext, which spans
+        # every request, so the staging file is read back once to hash it
+        digest = _sha256_of(_data_path(session))
+        blob = get_blob_store().adopt(_data_path(session), BlobInfo(None, blob_size, digest))
+
+        file = File.objects.create(
+            name=session.name,
+            owner=session.owner,
+            blob_ref=blob.ref,
+            blob_size=blob.size,
+            blob_digest=blob.digest,
+            size=session.total_size,
+            content_type=session.content_type,
+            **key_fields(session.encryption_salt, session.key_version),
+        )
+        session.status = 'COMPLETE'
+        session.file = file
+        session.save(update_fields=['status', 'file', 'updated_at'])
+
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+    return file
+
+
+def discard_session(session):
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+    session.delete()
+
+
+def purge_stale_sessions(max_age=None):
+    """Delete sessions (and their staging files) not touched within `max_age` seconds."""
+    if max_age is None:
+        max_age = settings.UPLOAD_SESSION_TTL
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    purged = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+        discard_session(session)
+        purged += 1
+    return purged
@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FileViewSet, SharedFileViewSet
+from .views import FileViewSet, ShareLinkViewSet, SharedFileViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'files', FileViewSet, basename='file')
 router.register(r'shared', SharedFileViewSet, basename='shared-file')
+router.register(r'uploads', UploadSessionViewSet, basename='upload-session')
+router.register(r'links', ShareLinkViewSet, basename='share-link')
 
 urlpatterns = [
     path('', include(router.urls)),
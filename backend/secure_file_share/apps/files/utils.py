@@ -1,34 +1,307 @@
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet
-from django.conf import settings
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import base64
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+import itertools
+import struct
 import os
+from .compression import CODEC_NONE, CODECS, choose_codec, compress_chunks, decompress_chunks
+from .keys import KEY_VERSION_PBKDF2, derive_file_key, new_data_key
+from .storage import get_blob_store
+
+# Segmented stream format
+#
+#   header  = magic (4) | version (1) | segment size (4, big endian) | nonce prefix (7)
+#             [| codec (1), version 2 only]
+#   segment = AES-256-GCM ciphertext of up to `segment size` plaintext bytes + 16 byte tag
+#
+# Version 2 streams hold content compressed with `codec` (see compression.py)
+# before encryption; their plaintext offsets don't map onto segments.
+# Every segment is authenticated on its own with the nonce
+# `nonce prefix | segment index (4) | last flag (1)` and the header as
+# associated data, so segments cannot be reordered, dropped, truncated or
+# spliced into another stream. Only the final segment may be short.
+STREAM_MAGIC = b'SFSE'
+STREAM_VERSION = 1
+STREAM_VERSION_COMPRESSED = 2
+SEGMENT_SIZE = 64 * 1024
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+HEADER = struct.Struct('>4sBI7s')
+HEADER_SIZE = HEADER.size
+HEADER_V2 = struct.Struct('>4sBI7sB')
+MAX_HEADER_SIZE = HEADER_V2.size
+MAX_SEGMENTS = 2 ** 32
+
+
+class StreamDecryptionError(ValueError):
+    """Raised when an encrypted stream is malformed or fails authentication."""
+
 
 def generate_key(salt=None):
-    """Generate a Fernet key using PBKDF2."""
+    """Generate a legacy Fernet key using PBKDF2 (served from the derived-key cache)."""
     if salt is None:
         salt = os.urandom(16)
-    
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-    )
-    
-    key = base64.urlsafe_b64encode(kdf.derive(settings.SECRET_KEY.encode()))
+
+    key = base64.urlsafe_b64encode(derive_file_key(salt, KEY_VERSION_PBKDF2))
     return key, salt
 
+def _segment_nonce(nonce_prefix, index, last):
+    if index >= MAX_SEGMENTS:
+        raise ValueError('Stream exceeds the maximum number of segments')
+    return nonce_prefix + struct.pack('>I?', index, last)
+
+def _aead(key):
+    # generate_key() hands out Fernet-style base64 keys; AES-GCM wants the raw 32 bytes.
+    if len(key) != 32:
+        key = base64.urlsafe_b64decode(key)
+    return AESGCM(key)
+
+def _iter_chunks(file_data):
+    if isinstance(file_data, (bytes, bytearray, memoryview)):
+        yield bytes(file_data)
+    elif hasattr(file_data, 'chunks'):
+        yield from file_data.chunks()
+    else:
+        yield from file_data
+
+def is_encrypted_stream(data):
+    """Return True if `data` starts with a segmented stream header."""
+    return bytes(data[:len(STREAM_MAGIC)]) == STREAM_MAGIC
+
+def new_stream_header(segment_size=SEGMENT_SIZE, nonce_prefix=None, codec=CODEC_NONE):
+    """Return a fresh stream header, with a random nonce prefix unless one is given."""
+    if nonce_prefix is None:
+        nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+    if codec != CODEC_NONE:
+        return HEADER_V2.pack(STREAM_MAGIC, STREAM_VERSION_COMPRESSED, segment_size, nonce_prefix, codec)
+    return HEADER.pack(STREAM_MAGIC, STREAM_VERSION, segment_size, nonce_prefix)
+
+def seal_segment(key, header, index, plaintext, last):
+    """Encrypt segment `index` of the stream described by `header`."""
+    _, nonce_prefix = parse_stream_header(header)
+    return _aead(key).encrypt(_segment_nonce(nonce_prefix, index, last), bytes(plaintext), header)
+
+def open_segment(key, header, index, ciphertext, last):
+    """Decrypt segment `index` of the stream described by `header`."""
+    _, nonce_prefix = parse_stream_header(header)
+    return _open_segment(_aead(key), header, nonce_prefix, index, last, ciphertext)
+
+def encrypt_stream(chunks, key, segment_size=SEGMENT_SIZE, header=None):
+    """
+    Encrypt an iterable of byte chunks (e.g. `UploadedFile.chunks()`).
+
+    Yields the header followed by one ciphertext segment per `segment_size`
+    bytes of plaintext, so memory use is bounded by a single segment no
+    matter how large the input is. A `header` may be given to fix the
+    nonce prefix and codec; it must never be reused with the same key for
+    other data. Content is compressed first if the header names a codec.
+    """
+    aead = _aead(key)
+    if header is None:
+        header = new_stream_header(segment_size)
+    segment_size, nonce_prefix = parse_stream_header(header)
+    chunks = compress_chunks(stream_codec(header), chunks)
+    yield header
+
+    buffer = bytearray()
+    index = 0
+    for chunk in chunks:
+        buffer += chunk
+        # Hold back at least one byte so the final segment can be flagged as such.
+        while len(buffer) > segment_size:
+            nonce = _segment_nonce(nonce_prefix, index, False)
+            yield aead.encrypt(nonce, bytes(buffer[:segment_size]), header)
+            del buffer[:segment_size]
+            index += 1
+
+    yield aead.encrypt(_segment_nonce(nonce_prefix, index, True), bytes(buffer), header)
+
+def stream_header_size(header):
+    """Length of the stream header at the start of `header` (which may run on)."""
+    if len(header) < HEADER_SIZE or bytes(header[:len(STREAM_MAGIC)]) != STREAM_MAGIC:
+        raise StreamDecryptionError('Encrypted stream is missing its header')
+    version = header[len(STREAM_MAGIC)]
+    if version == STREAM_VERSION:
+        return HEADER_SIZE
+    if version == STREAM_VERSION_COMPRESSED:
+        return HEADER_V2.size
+    raise StreamDecryptionError('Unsupported encrypted stream format')
+
+def _unpack_header(header):
+    size = stream_header_size(header)
+    if len(header) < size:
+        raise StreamDecryptionError('Encrypted stream is missing its header')
+    if size == HEADER_SIZE:
+        return HEADER.unpack(bytes(header[:size])) + (CODEC_NONE,)
+    fields = HEADER_V2.unpack(bytes(header[:size]))
+    if fields[-1] not in CODECS.values():
+        raise StreamDecryptionError('Unsupported encrypted stream format')
+    return fields
+
+def parse_stream_header(header):
+    """Return `(segment_size, nonce_prefix)` from a stream header."""
+    _, _, segment_size, nonce_prefix, _ = _unpack_header(header)
+    return segment_size, nonce_prefix
+
+def stream_codec(header):
+    """The compression codec of a stream (CODEC_NONE for version 1 streams)."""
+    return _unpack_header(header)[-1]
+
+def stream_segment_count(encrypted_size, segment_size):
+    """Number of segments in a stream of `encrypted_size` bytes (always at least one)."""
+    body = encrypted_size - HEADER_SIZE
+    return max(1, -(-body // (segment_size + TAG_SIZE)))
+
+def stream_plaintext_size(encrypted_size, segment_size):
+    """Plaintext length of a stream, derived from its size alone."""
+    segments = stream_segment_count(encrypted_size, segment_size)
+    return encrypted_size - HEADER_SIZE - segments * TAG_SIZE
+
+def _open_segment(aead, header, nonce_prefix, index, last, data):
+    try:
+        return aead.decrypt(_segment_nonce(nonce_prefix, index, last), bytes(data), header)
+    except InvalidTag:
+        raise StreamDecryptionError(f'Segment {index} failed authentication') from None
+
+def decrypt_stream(chunks, key):
+    """
+    Decrypt an iterable of ciphertext chunks produced by `encrypt_stream`.
+
+    Chunk boundaries do not need to line up with segments. Compressed
+    streams are decompressed as they are decrypted. Raises
+    StreamDecryptionError if the stream is tampered with or truncated.
+    """
+    buffer = bytearray()
+    chunks = iter(chunks)
+
+    for chunk in chunks:
+        buffer += chunk
+        # Every stream is longer than the largest header
+        if len(buffer) >= MAX_HEADER_SIZE:
+            break
+
+    header = bytes(buffer[:stream_header_size(buffer)])
+    del buffer[:len(header)]
+    yield from decompress_chunks(stream_codec(header), _open_segments(header, buffer, chunks, key))
+
+def _open_segments(header, buffer, chunks, key):
+    aead = _aead(key)
+    segment_size, nonce_prefix = parse_stream_header(header)
+
+    encrypted_segment_size = segment_size + TAG_SIZE
+    index = 0
+
+    for chunk in itertools.chain([b''], chunks):
+        buffer += chunk
+        while len(buffer) > encrypted_segment_size:
+            yield _open_segment(aead, header, nonce_prefix, index, False, buffer[:encrypted_segment_size])
+            del buffer[:encrypted_segment_size]
+            index += 1
+
+    if len(buffer) < TAG_SIZE:
+        raise StreamDecryptionError('Encrypted stream is truncated')
+    yield _open_segment(aead, header, nonce_prefix, index, True, buffer)
+
+def decrypt_stream_range(read, key, encrypted_size, start, end):
+    """
+    Decrypt plaintext bytes `start`..`end` (inclusive) of a stream.
+
+    `read(offset, length)` must return an iterable of ciphertext chunks;
+    only the header and the segments overlapping the range are read and
+    decrypted. Compressed streams can't be entered mid-way, so they are
+    decrypted from the start up to `end`.
+    """
+    aead = _aead(key)
+    header = b''.join(read(0, MAX_HEADER_SIZE))
+    header = header[:stream_header_size(header)]
+    if stream_codec(header) != CODEC_NONE:
+        yield from _slice(decrypt_stream(read(0, encrypted_size), key), start, end)
+        return
+    segment_size, nonce_prefix = parse_stream_header(header)
+
+    encrypted_segment_size = segment_size + TAG_SIZE
+    last_index = stream_segment_count(encrypted_size, segment_size) - 1
+    first, last = start // segment_size, end // segment_size
+    offset = HEADER_SIZE + first * encrypted_segment_size
+    length = min(encrypted_size, HEADER_SIZE + (last + 1) * encrypted_segment_size) - offset
+
+    def plaintext_slice(index, data):
+        plaintext = _open_segment(aead, header, nonce_prefix, index, index == last_index, data)
+        segment_start = index * segment_size
+        return plaintext[max(start - segment_start, 0):end + 1 - segment_start]
+
+    buffer = bytearray()
+    index = first
+    for chunk in read(offset, length):
+        buffer += chunk
+        while len(buffer) >= encrypted_segment_size:
+            yield plaintext_slice(index, buffer[:encrypted_segment_size])
+            del buffer[:encrypted_segment_size]
+            index += 1
+
+    if buffer:
+        yield plaintext_slice(index, buffer)
+    elif index <= last:
+        raise StreamDecryptionError('Encrypted stream is truncated')
+
+def _slice(chunks, start, end):
+    position = 0
+    for chunk in chunks:
+        if position > end:
+            return
+        if position + len(chunk) > start:
+            yield chunk[max(start - position, 0):end + 1 - position]
+        position += len(chunk)
+
 def encrypt_file(file_data):
-    """Encrypt file data using Fernet symmetric encryption."""
-    key, salt = generate_key()
-    f = Fernet(key)
-    encrypted_data = f.encrypt(file_data)
+    """
+    Encrypt file data using the segmented stream format.
+
+    `file_data` may be bytes or an uploaded file, which is consumed via
+    `chunks()` rather than read into memory in one piece.
+
+    The key is a random data key; the returned salt is its wrapped record,
+    to be stored alongside `CURRENT_KEY_VERSION` (see `keys.key_fields`).
+    """
+    key, salt = new_data_key()
+    encrypted_data = b''.join(encrypt_stream(_iter_chunks(file_data), key))
     return encrypted_data, salt
 
-def decrypt_file(encrypted_data, salt):
-    """Decrypt file data using Fernet symmetric encryption."""
-    key, _ = generate_key(salt)
-    f = Fernet(key)
-    return f.decrypt(encrypted_data) 
\ No newline at end of file
+def encrypt_file_to_store(file_data, store=None, content_type=''):
+    """
+    Encrypt file data straight into the blob store, compressing it first
+    when the content looks compressible.
+
+    Returns `(blob_info, salt)`, the salt being the wrapped data key;
+    neither the plaintext nor the ciphertext is ever held in memory in one
+    piece.
+    """
+    key, salt = new_data_key()
+    store = store or get_blob_store()
+    codec, chunks = choose_codec(_iter_chunks(file_data), content_type)
+    return store.save(encrypt_stream(chunks, key, header=new_stream_header(codec=codec))), salt
+
+def decrypt_chunks(chunks, salt, key_version):
+    """
+    Decrypt ciphertext chunks in either the stream or the legacy Fernet format.
+
+    `key_version` is the one stored with the ciphertext (`File.key_version`).
+    """
+    key = derive_file_key(salt, key_version)
+    chunks = iter(chunks)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= len(STREAM_MAGIC):
+            break
+
+    if is_encrypted_stream(head):
+        yield from decrypt_stream(itertools.chain([head], chunks), key)
+    else:
+        f = Fernet(base64.urlsafe_b64encode(key))
+        yield f.decrypt(head + b''.join(chunks))
+
+def decrypt_file(encrypted_data, salt, key_version):
+    """Decrypt file data, accepting both stream and legacy Fernet payloads."""
+    return b''.join(decrypt_chunks([bytes(encrypted_data)], salt, key_version))
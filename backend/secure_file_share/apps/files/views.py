@@ -1,84 +1,410 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import mixins, viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from .models import File
-from secure_file_share.apps.sharing.models import FileShare
-from .serializers import FileSerializer
-from .utils import encrypt_file, decrypt_file
+from .models import File, UploadSession
+from .pagination import FileCursorPagination, SearchCursorPagination, SharedFileCursorPagination
+from .serializers import FileSerializer, ShareLinkSerializer, UploadPreflightSerializer, UploadSessionSerializer
+from .access import get_access_resolver, shared_files
+from .convergent import tenant_for
+from .downloads import file_download_response
+from .engine import StorageEngine
+from .previews import preview_exists, preview_response, preview_unavailable, queue_previews
+from .links import InvalidShareToken, verify_token
+from .search import search
+from .services.notifications import ShareNotificationService
+from .services.search import FileSearchService, InvalidSortKey
+from .services.sharing import FileShareService
+from .uploads import (
+    UploadError, UploadOffsetMismatch, append_chunk, complete_session, create_session, discard_session
+)
+from .workers import PoolSaturated, claim_upload, encrypt_pending_file, get_worker_pool, release_claimed
+
+def _preview(request, file):
+    preset = request.query_params.get('size', settings.PREVIEW_DEFAULT_PRESET)
+    if preset not in settings.PREVIEW_PRESETS:
+        return Response(
+            {'error': f"Unknown preview size, use one of: {', '.join(settings.PREVIEW_PRESETS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if file.status == 'PENDING':
+        return Response(
+            {'error': 'File is still being processed'},
+            status=status.HTTP_409_CONFLICT
+        )
+
+    if preview_exists(file, preset):
+        return preview_response(request, file, preset)
+    if preview_unavailable(file, preset):
+        return Response(
+            {'error': 'No preview available'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    queue_previews(file, [preset])
+    response = Response({'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+    response['Retry-After'] = '2'
+    return response
 
 class FileViewSet(viewsets.ModelViewSet):
     serializer_class = FileSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FileCursorPagination
 
     def get_queryset(self):
-        return File.objects.filter(owner=self.request.user)
+        # The legacy ciphertext column is only loaded if a download needs it
+        return File.objects.filter(owner=self.request.user).select_related('owner').defer('encrypted_file')
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list':
+            service = FileSearchService()
+            queryset = service.filter_files(queryset, self.request.query_params, owner=self.request.user)
+            queryset = service.annotate_sort(queryset, self.get_keyset_ordering()[0])
+        return queryset
+
+    def get_keyset_ordering(self):
+        return getattr(self, 'ordering', (FileCursorPagination.ordering_field, True))
+
+    def list(self, request, *args, **kwargs):
+        try:
+            self.ordering = FileSearchService().get_ordering(request.query_params.get('sort'))
+        except InvalidSortKey as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        facets = FileSearchService().get_facets(request.user, self.get_queryset(), request.query_params)
+        return Response(facets)
+
+    @action(detail=False, methods=['post'])
+    def preflight(self, request):
+        # Only the caller's own files are consulted, so this reveals nothing
+        # about what other users have stored
+        serializer = UploadPreflightSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        digests = set(serializer.validated_data['digests'])
+        existing = {}
+        rows = self.get_queryset().filter(status='READY', content_digest__in=digests).order_by('-created_at')
+        for digest, file_id in rows.values_list('content_digest', 'id'):
+            existing.setdefault(digest, str(file_id))
+        return Response({
+            'existing': existing,
+            'missing': sorted(digests - existing.keys()),
+        })
+
+    @action(detail=False, methods=['get', 'head'], url_path=r'by-digest/(?P<digest>[0-9a-fA-F]{64})')
+    def by_digest(self, request, digest=None):
+        file_obj = self.get_queryset().filter(
+            status='READY', content_digest=digest.lower()
+        ).order_by('-created_at').first()
+        if file_obj is None:
+            return Response(
+                {'error': 'No file with that content'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(self.get_serializer(file_obj).data)
+
+    def create(self, request, *args, **kwargs):
+        try:
+            response = super().create(request, *args, **kwargs)
+        except PoolSaturated:
+            response = Response(
+                {'error': 'Too many uploads are being processed, try again shortly'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+            response['Retry-After'] = '5'
+            return response
+        if response.data.get('status') == 'PENDING':
+            # Accepted; poll the file until it is READY
+            response.status_code = status.HTTP_202_ACCEPTED
+        return response
 
     def perform_create(self, serializer):
-        file_obj = self.request.FILES['file']
-        file_data = file_obj.read()
-        
-        # Encrypt the file data
-        encrypted_data, salt = encrypt_file(file_data)
-        
-        serializer.save(
+        file_obj = serializer.validated_data.pop('file')
+        tenant = tenant_for(self.request.user)
+
+        if settings.ASYNC_FILE_ENCRYPTION:
+            self._create_pending(serializer, file_obj, tenant)
+            return
+
+        # Encrypt the upload segment by segment straight into the blob store;
+        # with a tenant, identical content in it is stored (and encrypted) once
+        StorageEngine().write(file_obj, lambda fields: serializer.save(
+            owner=self.request.user,
+            size=file_obj.size,
+            content_type=file_obj.content_type or '',
+            **fields
+        ), content_type=file_obj.content_type, tenant=tenant)
+
+    def _create_pending(self, serializer, file_obj, tenant=None):
+        # Keep the upload past the end of the request and let the pool encrypt it
+        file = serializer.save(
             owner=self.request.user,
-            encrypted_file=encrypted_data,
-            encryption_salt=salt
+            size=file_obj.size,
+            content_type=file_obj.content_type or '',
+            status='PENDING'
         )
+        claimed = None
+        try:
+            claimed = claim_upload(file_obj, file.pk)
+            get_worker_pool().submit(encrypt_pending_file, file.pk, claimed, tenant, file.content_type)
+        except Exception:
+            file.delete()
+            release_claimed(claimed)
+            raise
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'error': 'Query parameter q is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        paginator = SearchCursorPagination()
+        rows = paginator.paginate_search(
+            lambda after, limit: search(request.user, query, after=after, limit=limit), request
+        )
+        files = self.get_queryset().in_bulk([file_id for file_id, _, _ in rows])
+        results = []
+        for file_id, score, _ in rows:
+            if file_id in files:
+                data = self.get_serializer(files[file_id]).data
+                data['score'] = score
+                results.append(data)
+        return paginator.get_paginated_response(results)
+
+    @action(detail=False, methods=['get'], url_path='worker-metrics',
+            permission_classes=[permissions.IsAdminUser])
+    def worker_metrics(self, request):
+        return Response(get_worker_pool().metrics())
 
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
         file_obj = self.get_object()
+
+        if file_obj.status == 'PENDING':
+            return Response(
+                {'error': 'File is still being processed'},
+                status=status.HTTP_409_CONFLICT
+            )
         
-        if not file_obj.encrypted_file:
+        if not file_obj.has_content:
             return Response(
                 {'error': 'No encrypted file found'},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Decrypt the file
-        decrypted_data = decrypt_file(file_obj.encrypted_file, file_obj.encryption_salt)
-        
-        response = Response(decrypted_data, content_type='application/octet-stream')
-        response['Content-Disposition'] = f'attachment; filename="{file_obj.name}"'
-        return response
+        # Stream the decrypted file, honouring Range and conditional headers
+        return file_download_response(request, file_obj)
+
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        return _preview(request, self.get_object())
+
+    @action(detail=True, methods=['post', 'delete'], url_path='share-link')
+    def share_link(self, request, pk=None):
+        file_obj = self.get_object()
+        service = FileShareService()
+
+        if request.method == 'DELETE':
+            token = request.data.get('token', '')
+            try:
+                if verify_token(token).file_id != file_obj.pk:
+                    raise InvalidShareToken('Link is for another file')
+                service.revoke_share_link(token, request.user)
+            except InvalidShareToken as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        serializer = ShareLinkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        link = service.create_share_link(
+            file_obj,
+            request.user,
+            serializer.validated_data.get('expiration_hours'),
+            serializer.validated_data['permission']
+        )
+        link['url'] = request.build_absolute_uri(f"/api/files/links/{link['token']}/")
+        if request.user.email:
+            ShareNotificationService().send_link_notification(
+                request.user, file_obj, link['url'], link['expires_at']
+            )
+        return Response(link, status=status.HTTP_201_CREATED)
 
 class SharedFileViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = FileSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SharedFileCursorPagination
 
     def get_queryset(self):
-        return File.objects.filter(
-            fileshare__shared_with=self.request.user,
-            fileshare__expires_at__gt=timezone.now()
-        ).distinct()
+        # One query resolves each file together with its effective share
+        return shared_files(self.request.user).select_related('owner').defer('encrypted_file')
 
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['get', 'post'])
     def download(self, request, pk=None):
         file = self.get_object()
-        share = FileShare.objects.get(
-            file=file,
-            shared_with=request.user,
-            expires_at__gt=timezone.now()
-        )
         
-        if share.share_type != 'DOWNLOAD':
+        if not get_access_resolver(request).can_access(file, download=True):
             return Response(
                 {'error': 'Download not allowed'},
                 status=status.HTTP_403_FORBIDDEN
             )
+
+        if file.status == 'PENDING':
+            return Response(
+                {'error': 'File is still being processed'},
+                status=status.HTTP_409_CONFLICT
+            )
         
-        if not file.encrypted_file:
+        if not file.has_content:
             return Response(
                 {'error': 'No encrypted file found'},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Decrypt the file
-        decrypted_data = decrypt_file(file.encrypted_file, file.encryption_salt)
-        
-        response = Response(decrypted_data, content_type='application/octet-stream')
-        response['Content-Disposition'] = f'attachment; filename="{file.name}"'
-        return response 
\ No newline at end of file
+        # Stream the decrypted file, honouring Range and conditional headers
+        return file_download_response(request, file)
+
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        # Previews only need view access
+        return _preview(request, self.get_object())
+
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """Resumable uploads, see uploads.py for the protocol."""
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    read_chunk_size = 64 * 1024
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.instance = create_session(
+            owner=self.request.user,
+            name=serializer.validated_data['name'],
+            total_size=serializer.validated_data['total_size'],
+            content_type=serializer.validated_data.get('content_type', ''),
+        )
+
+    def perform_destroy(self, instance):
+        discard_session(instance)
+
+    def _request_chunks(self, request):
+        stream = request.stream
+        if stream is None:
+            return
+        while chunk := stream.read(self.read_chunk_size):
+            yield chunk
+
+    def update(self, request, pk=None):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Upload-Offset header is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            session = append_chunk(pk, request.user, offset, self._request_chunks(request))
+        except UploadSession.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        except UploadOffsetMismatch as e:
+            response = Response(
+                {'error': str(e), 'offset': e.expected},
+                status=status.HTTP_409_CONFLICT
+            )
+            response['Upload-Offset'] = str(e.expected)
+            return response
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = Response(self.get_serializer(session).data)
+        response['Upload-Offset'] = str(session.received)
+        return response
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        try:
+            file = complete_session(pk, request.user)
+        except UploadSession.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            FileSerializer(file, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED
+        )
+
+class ShareLinkViewSet(viewsets.ViewSet):
+    """
+    Public access to a file through a share-link token.
+
+    Tokens are verified from their signature and the process-local
+    revocation set (see links.py), so invalid, expired and revoked links
+    are turned away without a database query.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    lookup_field = 'token'
+    lookup_value_regex = '[A-Za-z0-9_-]+'
+
+    def _resolve(self, token, download=False):
+        link = FileShareService().validate_share_token(token)
+        if link is None:
+            return None, Response({'error': 'Invalid or expired link'}, status=status.HTTP_404_NOT_FOUND)
+        if download and link.permission != 'DOWNLOAD':
+            return None, Response({'error': 'Download not allowed'}, status=status.HTTP_403_FORBIDDEN)
+        file_obj = File.objects.filter(pk=link.file_id).defer('encrypted_file').first()
+        if file_obj is None:
+            return None, Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+        file_obj.link = link
+        return file_obj, None
+
+    def retrieve(self, request, token=None):
+        file_obj, error = self._resolve(token)
+        if error:
+            return error
+        return Response({
+            'name': file_obj.name,
+            'size': file_obj.size,
+            'content_type': file_obj.content_type,
+            'status': file_obj.status,
+            'permission': file_obj.link.permission,
+            'expires_at': file_obj.link.expires_at,
+        })
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, token=None):
+        file_obj, error = self._resolve(token, download=True)
+        if error:
+            return error
+        if file_obj.status == 'PENDING':
+            return Response(
+                {'error': 'File is still being processed'},
+                status=status.HTTP_409_CONFLICT
+            )
+        if not file_obj.has_content:
+            return Response(
+                {'error': 'No encrypted file found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return file_download_response(request, file_obj)
+
+    @action(detail=True, methods=['get'])
+    def preview(self, request, token=None):
+        file_obj, error = self._resolve(token)
+        if error:
+            return error
+        return _preview(request, file_obj)
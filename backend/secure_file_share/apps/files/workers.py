@@ -0,0 +1,254 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.dispatch import Signal
+from django.utils import timezone
+from .convergent import tenant_for
+from .engine import StorageEngine
+from .models import File
+
+logger = logging.getLogger(__name__)
+
+# Sent with `file` once an asynchronously encrypted upload is READY or FAILED
+file_processed = Signal()
+
+
+class PoolSaturated(Exception):
+    """Raised when no job slot frees up within the submit timeout."""
+
+
+class WorkerPool:
+    """
+    Bounded thread pool for encrypting uploads (and rendering previews) off the request thread.
+
+    AES-GCM and file I/O release the GIL, so threads scale with cores. At
+    most `max_pending` jobs may be queued or running; `submit` waits up to
+    `submit_timeout` seconds for a slot and then raises PoolSaturated so
+    the caller can push back on the client.
+    """
+
+    def __init__(self, max_workers=4, max_pending=32, submit_timeout=0.5, window=1000, name='file-encrypt'):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.submit_timeout = submit_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._running = 0
+        self._counts = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+        self._wait_times = deque(maxlen=window)
+        self._run_times = deque(maxlen=window)
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(timeout=self.submit_timeout):
+            with self._lock:
+                self._counts['rejected'] += 1
+            raise PoolSaturated('Encryption queue is full')
+        with self._lock:
+            self._pending += 1
+            self._counts['submitted'] += 1
+        return self._executor.submit(self._run, time.monotonic(), fn, args, kwargs)
+
+    def _run(self, queued_at, fn, args, kwargs):
+        started = time.monotonic()
+        with self._lock:
+            self._running += 1
+            self._wait_times.append(started - queued_at)
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            failed = True
+            logger.exception('Background job failed in the %s pool', self.name)
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+                self._run_times.append(time.monotonic() - started)
+                self._counts['failed' if failed else 'completed'] += 1
+                self._idle.notify_all()
+            self._slots.release()
+
+    def drain(self, timeout=None):
+        """Block until every submitted job has finished; returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def metrics(self):
+        """Queue depth, counters and wait/run latency percentiles (seconds)."""
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'queue_depth': self._pending - self._running,
+                'running': self._running,
+                **self._counts,
+                'wait_time': _percentiles(self._wait_times),
+                'run_time': _percentiles(self._run_times),
+            }
+
+
+def _percentiles(samples):
+    if not samples:
+        return {'p50': None, 'p95': None, 'max': None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 4)
+    return {'p50': pick(0.5), 'p95': pick(0.95), 'max': round(ordered[-1], 4)}
+
+
+_pool = None
+_preview_pool = None
+_mail_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = WorkerPool(
+                    max_workers=settings.FILE_ENCRYPTION_WORKERS,
+                    max_pending=settings.FILE_ENCRYPTION_MAX_PENDING,
+                )
+    return _pool
+
+
+def get_preview_pool():
+    global _preview_pool
+    if _preview_pool is None:
+        with _pool_lock:
+            if _preview_pool is None:
+                _preview_pool = WorkerPool(
+                    max_workers=settings.PREVIEW_WORKERS,
+                    max_pending=settings.PREVIEW_MAX_PENDING,
+                    submit_timeout=0,
+                    name='file-preview',
+                )
+    return _preview_pool
+
+
+def get_mail_pool():
+    """One worker draining the email outbox; a second slot queues the next drain."""
+    global _mail_pool
+    if _mail_pool is None:
+        with _pool_lock:
+            if _mail_pool is None:
+                _mail_pool = WorkerPool(max_workers=1, max_pending=2, submit_timeout=0, name='mail-outbox')
+    return _mail_pool
+
+
+def staging_path(file_id):
+    return os.path.join(settings.ASYNC_STAGING_ROOT, str(file_id))
+
+
+def claim_upload(uploaded, file_id):
+    """
+    Take a copy of the upload for PENDING file `file_id` that outlives the request.
+
+    Disk-backed uploads are hard-linked into ASYNC_STAGING_ROOT, named after
+    the file so `recover_pending_files` can find them, and no data is
+    copied; small in-memory uploads are returned as bytes.
+    """
+    if not hasattr(uploaded, 'temporary_file_path'):
+        return b''.join(uploaded.chunks())
+    os.makedirs(settings.ASYNC_STAGING_ROOT, exist_ok=True)
+    path = staging_path(file_id)
+    try:
+        os.link(uploaded.temporary_file_path(), path)
+    except OSError:
+        shutil.copyfile(uploaded.temporary_file_path(), path)
+    return path
+
+
+def iter_claimed(claimed, chunk_size=64 * 1024):
+    if isinstance(claimed, bytes):
+        yield claimed
+        return
+    with open(claimed, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def release_claimed(claimed):
+    if isinstance(claimed, str) and os.path.exists(claimed):
+        os.remove(claimed)
+
+
+def encrypt_pending_file(file_id, claimed, tenant=None, content_type=''):
+    """Worker job: encrypt a claimed upload into the blob store and mark its File READY."""
+    engine = StorageEngine()
+
+    def attach(fields):
+        updated = File.objects.filter(pk=file_id, status='PENDING').update(status='READY', **fields)
+        if not updated:
+            # The file was deleted while it was being encrypted
+            engine.discard(fields)
+        return updated
+
+    try:
+        updated = engine.write(lambda: iter_claimed(claimed), attach, content_type, tenant)
+    except Exception:
+        if File.objects.filter(pk=file_id, status='PENDING').update(status='FAILED'):
+            _notify(file_id)
+        raise
+    finally:
+        release_claimed(claimed)
+    if updated:
+        _notify(file_id)
+
+
+def _notify(file_id):
+    file = File.objects.filter(pk=file_id).first()
+    if file is not None:
+        file_processed.send(sender=File, file=file)
+
+
+def recover_pending_files(max_age=None):
+    """
+    Finish or fail uploads whose encryption job was lost with its process.
+
+    Files still PENDING `max_age` seconds (ASYNC_PENDING_TIMEOUT by default)
+    after their last update are encrypted again from their staged copy, or
+    marked FAILED if there is none (in-memory uploads aren't staged).
+    Staged copies older than that which no PENDING file claims are deleted.
+    Returns `(recovered, failed, removed)`.
+    """
+    if max_age is None:
+        max_age = settings.ASYNC_PENDING_TIMEOUT
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    recovered = failed = 0
+    for file in File.objects.filter(status='PENDING', updated_at__lt=cutoff).select_related('owner').iterator():
+        staged = staging_path(file.pk)
+        if os.path.exists(staged):
+            try:
+                encrypt_pending_file(file.pk, staged, tenant_for(file.owner), file.content_type)
+            except Exception:
+                logger.exception('Recovering pending file %s failed', file.pk)
+                failed += 1
+            else:
+                recovered += 1
+        elif File.objects.filter(pk=file.pk, status='PENDING').update(status='FAILED'):
+            _notify(file.pk)
+            failed += 1
+
+    removed = 0
+    if os.path.isdir(settings.ASYNC_STAGING_ROOT):
+        pending = {str(pk) for pk in File.objects.filter(status='PENDING').values_list('pk', flat=True)}
+        for name in os.listdir(settings.ASYNC_STAGING_ROOT):
+            path = os.path.join(settings.ASYNC_STAGING_ROOT, name)
+            if name not in pending and os.path.getmtime(path) < time.time() - max_age:
+                os.remove(path)
+                removed += 1
+    return recovered, failed, removed
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sharing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fileshare',
+            index=models.Index(fields=['shared_with', '-created_at', '-file'], name='share_recipient_created_idx'),
+        ),
+    ]
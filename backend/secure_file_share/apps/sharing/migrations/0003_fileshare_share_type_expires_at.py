@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sharing', '0002_fileshare_share_recipient_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileshare',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fileshare',
+            name='share_type',
+            field=models.CharField(choices=[('VIEW', 'View only'), ('DOWNLOAD', 'View and download')], default='DOWNLOAD', max_length=10),
+        ),
+    ]
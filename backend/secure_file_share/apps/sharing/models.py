@@ -3,16 +3,27 @@ from django.conf import settings
 from secure_file_share.apps.files.models import File
 
 class FileShare(models.Model):
+    SHARE_TYPES = (
+        ('VIEW', 'View only'),
+        ('DOWNLOAD', 'View and download'),
+    )
+
     file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='shares')
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='shared_files')
     shared_with = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='received_shares')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     can_edit = models.BooleanField(default=False)
+    share_type = models.CharField(max_length=10, choices=SHARE_TYPES, default='DOWNLOAD')
+    expires_at = models.DateTimeField(null=True, blank=True)  # Never expires when empty
 
     class Meta:
         unique_together = ['file', 'shared_with']
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the files shared with a user
+            models.Index(fields=['shared_with', '-created_at', '-file'], name='share_recipient_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.file.name} shared by {self.owner.username} with {self.shared_with.username}" 
\ No newline at end of file
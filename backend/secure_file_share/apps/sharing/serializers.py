@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import FileShare
 from secure_file_share.apps.files.serializers import FileSerializer
@@ -14,5 +15,21 @@ class FileShareSerializer(serializers.ModelSerializer):
         model = FileShare
         fields = ['id', 'file', 'file_details', 'owner', 'owner_username', 
                  'shared_with', 'shared_with_username', 'created_at', 
-                 'updated_at', 'can_edit']
-        read_only_fields = ['owner', 'created_at', 'updated_at'] 
\ No newline at end of file
+                 'updated_at', 'can_edit', 'share_type', 'expires_at']
+        read_only_fields = ['owner', 'created_at', 'updated_at'] 
+
+
+class BulkShareSerializer(serializers.Serializer):
+    """Every file in `files` is shared with every user in `users`."""
+    files = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    users = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    share_type = serializers.ChoiceField(choices=FileShare.SHARE_TYPES, default='DOWNLOAD')
+    expires_at = serializers.DateTimeField(required=False, allow_null=True, default=None)
+
+    def validate(self, attrs):
+        items = len(set(attrs['files'])) * len(set(attrs['users']))
+        if items > settings.SHARE_BULK_MAX_ITEMS:
+            raise serializers.ValidationError(
+                f'At most {settings.SHARE_BULK_MAX_ITEMS} file/user pairs can be shared at once'
+            )
+        return attrs
@@ -1,15 +1,42 @@
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from secure_file_share.apps.files.services.notifications import ShareNotificationService
+from secure_file_share.apps.files.services.sharing import FileShareService
 from .models import FileShare
-from .serializers import FileShareSerializer
+from .serializers import BulkShareSerializer, FileShareSerializer
 
 class ShareViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = FileShareSerializer
 
     def get_queryset(self):
-        return FileShare.objects.filter(owner=self.request.user)
+        return FileShare.objects.filter(owner=self.request.user).select_related(
+            'file', 'file__owner', 'owner', 'shared_with'
+        ).defer('file__encrypted_file')
 
     def perform_create(self, serializer):
-        serializer.save(owner=self.request.user) 
\ No newline at end of file
+        share = serializer.save(owner=self.request.user)
+        ShareNotificationService().send_share_notification(share, self.request.build_absolute_uri('/')) 
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = BulkShareSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        shares, results = FileShareService().bulk_share(
+            request.user, data['files'], data['users'],
+            share_type=data['share_type'], expires_at=data['expires_at']
+        )
+        ShareNotificationService().send_bulk_share_notifications(
+            request.user, shares, request.build_absolute_uri('/')
+        )
+        return Response({
+            'created': len(shares),
+            'results': [
+                {'file': str(file_id), 'user': user_id, 'status': item_status}
+                for file_id, user_id, item_status in results
+            ],
+        })
@@ -89,6 +89,27 @@ ENCRYPTION_MASTER_KEY = os.environ.get(
     'your-secure-master-key-here'
 )
 
+# Key-encryption keys (KEKs) by version. Each file's random data key is stored
+# wrapped with ENCRYPTION_KEK_VERSION. To rotate, add ENCRYPTION_KEK_<n>,
+# set ENCRYPTION_KEK_VERSION=<n> and run `manage.py rotate_keys`, which
+# re-wraps the key records only; retire the old KEK once it reports none left.
+# Version 1 is the master key, so existing deployments need no new secret. It
+# can stop wrapping keys but never be retired: version chunk keys and
+# convergent tenant keys are derived from ENCRYPTION_MASTER_KEY directly.
+ENCRYPTION_KEKS = {
+    1: ENCRYPTION_MASTER_KEY,
+    **{
+        int(name[len('ENCRYPTION_KEK_'):]): value
+        for name, value in os.environ.items()
+        if name.startswith('ENCRYPTION_KEK_') and name[len('ENCRYPTION_KEK_'):].isdigit()
+    },
+}
+ENCRYPTION_KEK_VERSION = int(os.environ.get('ENCRYPTION_KEK_VERSION', max(ENCRYPTION_KEKS)))
+
+# Derived file keys are cached per process; entries are wiped on eviction
+FILE_KEY_CACHE_SIZE = 1024
+FILE_KEY_CACHE_TTL = 300  # seconds
+
 # File upload settings
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_UPLOAD_EXTENSIONS = [
@@ -104,7 +125,11 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 os.makedirs(os.path.join(MEDIA_ROOT, 'uploads'), exist_ok=True)
 
 # Email settings
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Set to django.core.mail.backends.filebased.EmailBackend (writing to
+# EMAIL_FILE_PATH) or locmem.EmailBackend to keep mail local
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails'))
+EMAIL_TIMEOUT = 10
 EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
 EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
 EMAIL_USE_TLS = True
@@ -112,14 +137,32 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@securefileshare.com')
 
+# Notification emails go through an outbox table (see files/outbox.py).
+# With EMAIL_OUTBOX_AUTOSEND a background thread drains it after each commit;
+# otherwise run `manage.py send_outbox --loop`. Failed sends are retried after
+# EMAIL_OUTBOX_RETRY_DELAY seconds, doubling up to EMAIL_OUTBOX_MAX_RETRY_DELAY.
+EMAIL_OUTBOX_AUTOSEND = True
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6
+EMAIL_OUTBOX_RETRY_DELAY = 30
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 60 * 60
+EMAIL_OUTBOX_LEASE = 5 * 60  # Seconds before a crashed worker's claim expires
+
+# Bulk sharing (api/sharing/shares/bulk/): largest files x users matrix per
+# request, and rows per INSERT
+SHARE_BULK_MAX_ITEMS = 20000
+SHARE_BULK_BATCH_SIZE = 500
+
 # Share link settings
 SHARE_LINK_MAX_AGE = 60 * 60 * 24 * 7  # 7 days in seconds
+# Seconds before a link revoked in another process is refused here
+SHARE_LINK_REVOCATION_REFRESH = 5
 
 # Template configuration
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [BASE_DIR / 'secure_file_share' / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -171,24 +214,6 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
-# File Encryption Settings
-FILE_ENCRYPTION_KEY = 'YWJjZGVmZ2hpamtsbW5vcHFyc3R1dnd4eXoxMjM0NTY='  # Example key, generate your own!
-
-# To generate a new key:
-# from cryptography.fernet import Fernet
-# print(Fernet.generate_key().decode())
-
-# For development, we'll use a static key, but in production:
-# 1. Use environment variables
-# 2. Store the key securely
-# 3. Never commit the actual key to version control
-if not DEBUG:
-    FILE_ENCRYPTION_KEY = os.environ.get('FILE_ENCRYPTION_KEY')
-    if not FILE_ENCRYPTION_KEY:
-        raise ValueError(
-            "FILE_ENCRYPTION_KEY environment variable is required in production"
-        )
-
 # Media files configuration
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -198,10 +223,118 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 FILE_UPLOAD_PERMISSIONS = 0o644
 FILE_UPLOAD_DIRECTORY_PERMISSIONS = 0o755
 
+# Seconds a user's share map may be served from the cache for permission
+# checks; 0 keeps decisions per request only. Changes to a share invalidate it.
+# Point the alias at a shared backend (e.g. RedisCache) to share it across workers.
+FILE_ACCESS_CACHE_ALIAS = 'default'
+FILE_ACCESS_CACHE_TTL = 0
+
+# Encrypt uploads on a bounded background pool instead of the request thread.
+# Files are created PENDING and flip to READY (or FAILED) when done.
+ASYNC_FILE_ENCRYPTION = os.environ.get('ASYNC_FILE_ENCRYPTION', '0') == '1'
+FILE_ENCRYPTION_WORKERS = 4
+FILE_ENCRYPTION_MAX_PENDING = 32
+# Jobs die with their process; `manage.py recover_pending_files` (run it at
+# startup or from cron) re-encrypts or fails files PENDING for this long
+ASYNC_PENDING_TIMEOUT = 60 * 60
+
+# Uploads are compressed before encryption (see files/compression.py) with the
+# codec of the longest matching content-type prefix; None marks types that are
+# compressed already. Content whose first 64 KB has more entropy than
+# FILE_COMPRESSION_MAX_ENTROPY bits per byte is stored uncompressed. 'zstd'
+# needs the zstandard package and falls back to 'deflate'. Convergent blobs
+# (below) are always stored uncompressed.
+FILE_COMPRESSION = True
+FILE_COMPRESSION_CODECS = {
+    '': 'deflate',
+    'text/': 'zstd',
+    'application/json': 'zstd',
+    'application/xml': 'zstd',
+    'application/vnd.ms-excel': 'zstd',
+    'application/msword': 'deflate',
+    'application/zip': None,
+    'application/gzip': None,
+    'application/vnd.openxmlformats-officedocument.': None,  # .docx/.xlsx are zip files
+    'image/': None,
+    'image/bmp': 'deflate',
+    'image/svg+xml': 'zstd',
+    'audio/': None,
+    'video/': None,
+}
+FILE_COMPRESSION_MAX_ENTROPY = 7.5
+
+# Convergent encryption (see files/convergent.py): the key of an upload is
+# derived from its content, so identical files in a tenant are stored once.
+# Any uploader can then tell whether a file already exists in their tenant,
+# so keep it off unless that is acceptable. The resolver maps a user to a
+# tenant id, or None to encrypt that user's uploads as usual.
+CONVERGENT_ENCRYPTION = os.environ.get('CONVERGENT_ENCRYPTION', '0') == '1'
+CONVERGENT_ENCRYPTION_TENANT = 'secure_file_share.apps.files.convergent.default_tenant'
+
+# Previews (api/files/files/<id>/preview/?size=<preset>) are rendered in the
+# background and cached encrypted in PREVIEW_ROOT
+PREVIEW_PRESETS = {
+    'thumbnail': (200, 200),
+    'medium': (800, 800),
+}
+PREVIEW_DEFAULT_PRESET = 'medium'
+PREVIEW_ON_UPLOAD = True
+PREVIEW_WORKERS = 2
+PREVIEW_MAX_PENDING = 64
+PREVIEW_SPOOL_SIZE = 8 * 1024 * 1024  # Decrypted source kept in memory up to this size
+PREVIEW_CACHE_MAX_AGE = 60 * 60 * 24 * 7
+
+# Full-text search (api/files/files/search/?q=): how much text is indexed per file
+SEARCH_BODY_BYTES = 256 * 1024
+SEARCH_PDF_PAGES = 20
+
+# Seconds an owner's facet counts (api/files/files/facets/) may be served from
+# the cache, for owners with at least FILE_FACET_CACHE_MIN_FILES files; 0 disables.
+# Any change to one of the owner's files invalidates them.
+FILE_FACET_CACHE_ALIAS = 'default'
+FILE_FACET_CACHE_TTL = 300
+FILE_FACET_CACHE_MIN_FILES = 1000
+
+# Default page size for the keyset-paginated file listings
+FILE_LIST_PAGE_SIZE = 50
+
+# Content-defined chunking of file versions (bytes); see files/chunking.py
+VERSION_CHUNK_MIN_SIZE = 16 * 1024
+VERSION_CHUNK_AVG_SIZE = 64 * 1024
+VERSION_CHUNK_MAX_SIZE = 256 * 1024
+
+# Store new versions as binary deltas against the previous one (files/deltas.py),
+# with a full keyframe every VERSION_KEYFRAME_INTERVAL versions
+VERSION_DELTA_ENABLED = False
+VERSION_DELTA_BLOCK_SIZE = 4 * 1024
+VERSION_DELTA_MAX_LITERAL_RATIO = 0.5  # Store a keyframe when more of the version is new
+VERSION_KEYFRAME_INTERVAL = 16
+VERSION_MAP_CACHE_SIZE = 64
+
+# Resumable uploads (api/files/uploads/)
+MAX_RESUMABLE_UPLOAD_SIZE = 10 * 1024 * 1024 * 1024  # 10GB
+UPLOAD_SESSION_TTL = 60 * 60 * 24  # Sessions idle for a day are purged
+
+# Upload preflight (api/files/files/preflight/): clients send the SHA-256 of
+# files they are about to upload and skip the ones they already have
+UPLOAD_PREFLIGHT_MAX_DIGESTS = 1000
+
 # Ensure media directories exist
 UPLOAD_ROOT = os.path.join(MEDIA_ROOT, 'uploads')
 PREVIEW_ROOT = os.path.join(MEDIA_ROOT, 'previews')
 VERSION_ROOT = os.path.join(MEDIA_ROOT, 'versions')
+BLOB_ROOT = os.path.join(MEDIA_ROOT, 'blobs')
+UPLOAD_SESSION_ROOT = os.path.join(MEDIA_ROOT, 'upload_sessions')  # Keep on the same volume as BLOB_ROOT
+ASYNC_STAGING_ROOT = os.path.join(MEDIA_ROOT, 'async_staging')
+VERSION_CHUNK_ROOT = os.path.join(VERSION_ROOT, 'chunks')
 
-for directory in [UPLOAD_ROOT, PREVIEW_ROOT, VERSION_ROOT]:
+for directory in [UPLOAD_ROOT, PREVIEW_ROOT, VERSION_ROOT, BLOB_ROOT, UPLOAD_SESSION_ROOT, ASYNC_STAGING_ROOT]:
     os.makedirs(directory, exist_ok=True)
+
+# Encrypted file payloads live in a content-addressed blob store.
+# For an S3-compatible store use
+# {'BACKEND': 'secure_file_share.apps.files.storage.S3BlobStore', 'OPTIONS': {'bucket': '...'}}
+BLOB_STORE = {
+    'BACKEND': 'secure_file_share.apps.files.storage.LocalBlobStore',
+    'OPTIONS': {'root': BLOB_ROOT},
+}
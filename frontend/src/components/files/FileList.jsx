@@ -18,6 +18,8 @@ const FileList = () => {
       // Ensure we're getting an array of files
       const fileArray = Array.isArray(response.data)
         ? response.data
+        : Array.isArray(response.data.results)
+        ? response.data.results
         : Array.isArray(response.data.files)
         ? response.data.files
         : [];
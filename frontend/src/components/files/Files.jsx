@@ -16,7 +16,7 @@ const Files = () => {
   const loadFiles = useCallback(async () => {
     try {
       const response = await fileApi.getFiles();
-      setFiles(response.data);
+      setFiles(response.data.results ?? response.data);
     } catch {
       dispatch(setError("Failed to load files"));
     } finally {
@@ -40,7 +40,7 @@ const Files = () => {
     setIsLoading(true);
     try {
       const response = await fileApi.searchFiles(searchParams);
-      setFiles(response.data);
+      setFiles(response.data.results ?? response.data);
     } catch {
       dispatch(setError("Failed to search files"));
     } finally {
@@ -12,7 +12,7 @@ const SharedFiles = () => {
   const loadSharedFiles = useCallback(async () => {
     try {
       const response = await fileApi.getSharedFiles();
-      dispatch(setSharedFiles(response.data));
+      dispatch(setSharedFiles(response.data.results ?? response.data));
     } catch {
       setError("Failed to load shared files");
     }